@@ -0,0 +1,168 @@
+"""Counts the AWS calls of one invocation through botocore client events.
+
+Every call is recorded per "service:Operation" with its latency (all attempts
+included), retries, throttles and errors. log_call_summary() prints the budget of
+the invocation; call_budget() raises CallBudgetExceeded when a code path makes more
+calls than allowed:
+
+    with api_accounting.call_budget(12, DescribeInstances=2):
+        provision_asg(...)
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from rate_limiter import THROTTLING_CODES
+
+logger = logging.getLogger()
+
+API_ACCOUNTING_ENABLED = os.environ.get("API_ACCOUNTING", "true").lower() == "true"
+# "<total>" or "<total>,<Operation>=<n>,..."; checked when lambda_handler returns.
+API_CALL_BUDGET = os.environ.get("API_CALL_BUDGET", "")
+# With "raise" an exceeded API_CALL_BUDGET fails the invocation instead of logging a warning.
+API_CALL_BUDGET_MODE = os.environ.get("API_CALL_BUDGET_MODE", "warn")
+
+_START_KEY = "asg_accounting_started"
+
+
+class CallBudgetExceeded(Exception):
+    pass
+
+
+def _new_stats():
+    return {"calls": 0, "errors": 0, "retries": 0, "throttles": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+
+class ApiAccounting:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = defaultdict(_new_stats)
+
+    def before_call(self, context=None, **kwargs):
+        if context is not None:
+            context[_START_KEY] = time.perf_counter()
+        # Must not return anything: before-call stops at the first handler with a response.
+
+    def _record(self, key, context, error=False, retries=0):
+        started = (context or {}).get(_START_KEY)
+        elapsed_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+        with self._lock:
+            stats = self.stats[key]
+            stats["calls"] += 1
+            stats["errors"] += 1 if error else 0
+            stats["retries"] += retries
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def after_call(self, model, http_response=None, parsed=None, context=None, **kwargs):
+        retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts") or 0
+        error = http_response is None or http_response.status_code >= 300
+        self._record(f"{model.service_model.service_id.hyphenize()}:{model.name}", context, error, retries)
+
+    def after_call_error(self, event_name, context=None, **kwargs):
+        # Connection errors and the like never reach after-call; this event has no model.
+        _, service, operation_name = event_name.split(".", 2)
+        self._record(f"{service}:{operation_name}", context, error=True)
+
+    def needs_retry(self, operation, response=None, **kwargs):
+        if response is not None and response[1].get("Error", {}).get("Code") in THROTTLING_CODES:
+            key = f"{operation.service_model.service_id.hyphenize()}:{operation.name}"
+            with self._lock:
+                self.stats[key]["throttles"] += 1
+        return None
+
+    def install(self, client):
+        events = client.meta.events
+        events.register_first("before-call.*.*", self.before_call, unique_id="asg-accounting-before-call")
+        events.register("after-call.*.*", self.after_call, unique_id="asg-accounting-after-call")
+        events.register("after-call-error.*.*", self.after_call_error, unique_id="asg-accounting-after-call-error")
+        events.register("needs-retry.*.*", self.needs_retry, unique_id="asg-accounting-needs-retry")
+        return client
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(stats) for key, stats in self.stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+
+accounting = ApiAccounting()
+
+
+def summary(snapshot=None):
+    snapshot = snapshot if snapshot is not None else accounting.snapshot()
+    return {
+        "calls": sum(stats["calls"] for stats in snapshot.values()),
+        "errors": sum(stats["errors"] for stats in snapshot.values()),
+        "retries": sum(stats["retries"] for stats in snapshot.values()),
+        "throttles": sum(stats["throttles"] for stats in snapshot.values()),
+        "total_ms": round(sum(stats["total_ms"] for stats in snapshot.values()), 1),
+        "operations": {
+            key: {**stats, "total_ms": round(stats["total_ms"], 1), "max_ms": round(stats["max_ms"], 1)}
+            for key, stats in sorted(snapshot.items(), key=lambda item: -item[1]["calls"])
+        },
+    }
+
+
+def parse_budget(value):
+    total, per_operation = None, {}
+    for part in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, limit = part.partition("=")
+        if limit:
+            per_operation[name.strip()] = int(limit)
+        else:
+            total = int(name)
+    return total, per_operation
+
+
+def budget_violations(snapshot, total=None, per_operation=None):
+    violations = []
+    calls = sum(stats["calls"] for stats in snapshot.values())
+    if total is not None and calls > total:
+        violations.append(f"{calls} AWS calls, budget {total}")
+    for operation, limit in (per_operation or {}).items():
+        # "DescribeInstances" matches that operation of any service, "ec2:DescribeInstances" only EC2's.
+        count = sum(stats["calls"] for key, stats in snapshot.items() if operation in (key, key.split(":", 1)[1]))
+        if count > limit:
+            violations.append(f"{count} {operation} calls, budget {limit}")
+    return violations
+
+
+@contextmanager
+def call_budget(total=None, **per_operation):
+    """Raises CallBudgetExceeded if the block makes more calls than allowed, counted
+    from the calls recorded so far."""
+    before = accounting.snapshot()
+    yield
+    after = accounting.snapshot()
+    delta = {}
+    for key, stats in after.items():
+        calls = stats["calls"] - before.get(key, {}).get("calls", 0)
+        if calls:
+            delta[key] = {"calls": calls}
+    violations = budget_violations(delta, total, per_operation)
+    if violations:
+        raise CallBudgetExceeded(f"Call budget exceeded: {'; '.join(violations)}. Calls: {delta}")
+
+
+def log_call_summary():
+    snapshot = accounting.snapshot()
+    if not snapshot:
+        return {}
+    call_summary = summary(snapshot)
+    logger.info(f"AWS call budget: {call_summary}")
+
+    if API_CALL_BUDGET:
+        violations = budget_violations(snapshot, *parse_budget(API_CALL_BUDGET))
+        if violations:
+            message = f"Call budget {API_CALL_BUDGET} exceeded: {'; '.join(violations)}."
+            if API_CALL_BUDGET_MODE == "raise":
+                raise CallBudgetExceeded(message)
+            logger.warning(message)
+    return call_summary
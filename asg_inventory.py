@@ -0,0 +1,255 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import async_operations
+import metrics
+from aws_clients import get_client
+from inventory_readers import (
+    iter_instances,
+    iter_pages,
+    shape_eni,
+    shape_instance,
+    shape_volume,
+)
+
+logger = logging.getLogger()
+
+LIVE_INSTANCE_STATES = ["pending", "running", "stopping", "stopped", "shutting-down"]
+
+
+def _tag_dict(tags):
+    return {tag.get("Key"): tag.get("Value") for tag in tags or []}
+
+
+class AsgInventory:
+    """Snapshot of one ASG's instances, ENIs, volumes and tags, shared by every handler
+    of an invocation. Call invalidate() after mutating anything it describes."""
+
+    def __init__(self, asg_name, ec2_client=None, autoscaling_client=None):
+        self.asg_name = asg_name
+        self.ec2_client = ec2_client or get_client('ec2')
+        self.autoscaling_client = autoscaling_client or get_client('autoscaling')
+        self.loaded_at = None
+        self.load_count = 0
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.asg = None
+        self.instances = {}
+        self.enis = {}
+        self.volumes = {}
+        self._instances_by_az = defaultdict(list)
+        self._instances_by_status = defaultdict(list)
+        self._enis_by_az = defaultdict(list)
+        self._enis_by_subnet = defaultdict(list)
+        self._enis_by_status = defaultdict(list)
+        self._enis_by_instance = {}
+        self._volumes_by_az = defaultdict(list)
+        self._volumes_by_status = defaultdict(list)
+        self._volumes_by_instance = {}
+
+    # Loading
+
+    def _read_asg(self):
+        for page in iter_pages(self.autoscaling_client, "describe_auto_scaling_groups", AutoScalingGroupNames=[self.asg_name]):
+            for asg in page.get("AutoScalingGroups", []):
+                return asg
+        raise Exception(f"No Auto Scaling Group found with the name '{self.asg_name}'")
+
+    def _read_instances(self):
+        filters = [
+            {'Name': 'tag:aws:autoscaling:groupName', 'Values': [self.asg_name]},
+            {'Name': 'instance-state-name', 'Values': LIVE_INSTANCE_STATES},
+        ]
+        instances = []
+        for page in iter_pages(self.ec2_client, "describe_instances", Filters=filters):
+            for reservation in page.get("Reservations", []):
+                instances.extend(reservation.get("Instances", []))
+        return instances
+
+    def _read_enis(self):
+        filters = [{'Name': 'tag:AutoscaleGroup', 'Values': [self.asg_name]}]
+        enis = []
+        for page in iter_pages(self.ec2_client, "describe_network_interfaces", Filters=filters):
+            enis.extend(page.get("NetworkInterfaces", []))
+        return enis
+
+    def _read_volumes(self):
+        filters = [{'Name': 'tag:AsgName', 'Values': [self.asg_name]}]
+        volumes = []
+        for page in iter_pages(self.ec2_client, "describe_volumes", Filters=filters):
+            volumes.extend(page.get("Volumes", []))
+        return volumes
+
+    def load(self):
+        started = time.monotonic()
+        runner = async_operations.runner()
+        with metrics.span("InventoryLoad"):
+            if runner:
+                asg, instances, enis, volumes = runner.run(async_operations.load_inventory(runner, self))
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+
+                with ThreadPoolExecutor(max_workers=4) as pool:
+                    asg = pool.submit(self._read_asg)
+                    instances = pool.submit(self._read_instances)
+                    enis = pool.submit(self._read_enis)
+                    volumes = pool.submit(self._read_volumes)
+                    asg, instances, enis, volumes = asg.result(), instances.result(), enis.result(), volumes.result()
+
+        with self._lock:
+            self._reset()
+            self.asg = asg
+            lifecycle_states = {item["InstanceId"]: item.get("LifecycleState") for item in asg.get("Instances", [])}
+            for instance in instances:
+                self._add_instance(instance, lifecycle_states.get(instance["InstanceId"]))
+            for eni in enis:
+                self._add_eni(eni)
+            for volume in volumes:
+                self._add_volume(volume)
+            self.loaded_at = time.time()
+            self.load_count += 1
+
+        logger.info(
+            f"Loaded inventory of {self.asg_name} in {time.monotonic() - started:.2f}s: "
+            f"{len(self.instances)} instances, {len(self.enis)} ENIs, {len(self.volumes)} volumes."
+        )
+        return self
+
+    def _add_instance(self, instance, lifecycle_state=None):
+        record = shape_instance(instance)
+        record["Tags"] = _tag_dict(instance.get("Tags"))
+        record["State"] = instance.get("State", {}).get("Name")
+        record["LifecycleState"] = lifecycle_state
+        self.instances[record["InstanceId"]] = record
+        self._instances_by_az[record["AvailabilityZone"]].append(record)
+        self._instances_by_status[record["Tags"].get("Status")].append(record)
+        return record
+
+    def _add_eni(self, eni):
+        record = shape_eni(eni)
+        record["tags"] = _tag_dict(eni.get("TagSet"))
+        record["attachment_id"] = (eni.get("Attachment") or {}).get("AttachmentId")
+        self.enis[record["eni_id"]] = record
+        self._enis_by_az[record["availability_zone"]].append(record)
+        self._enis_by_subnet[record["subnet_id"]].append(record)
+        self._enis_by_status[record["status"]].append(record)
+        if record["instance_id"]:
+            self._enis_by_instance[record["instance_id"]] = record
+
+    def _add_volume(self, volume):
+        record = shape_volume(volume)
+        record["Tags"] = _tag_dict(volume.get("Tags"))
+        record["State"] = volume.get("State")
+        record["Size"] = volume.get("Size")
+        record["InstanceId"] = next((item.get("InstanceId") for item in volume.get("Attachments", [])), None)
+        self.volumes[record["VolumeId"]] = record
+        self._volumes_by_az[record["AvailabilityZone"]].append(record)
+        self._volumes_by_status[record["Tags"].get("Status")].append(record)
+        if record["InstanceId"]:
+            self._volumes_by_instance[record["InstanceId"]] = record
+
+    def ensure_loaded(self):
+        with self._lock:
+            if self.loaded_at is None:
+                self.load()
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded_at = None
+            self._reset()
+
+    def refresh(self):
+        self.invalidate()
+        return self.load()
+
+    def refresh_if_older_than(self, timestamp):
+        # A snapshot taken before the ASG lock was acquired may predate another
+        # invocation's mutations.
+        with self._lock:
+            if self.loaded_at is not None and self.loaded_at >= timestamp:
+                return self
+        return self.refresh()
+
+    def drop_asg_tags(self, keys):
+        # Keeps the snapshot in line with tags deleted from the ASG.
+        with self._lock:
+            if self.asg is not None:
+                self.asg["Tags"] = [tag for tag in self.asg.get("Tags", []) if tag.get("Key") not in keys]
+
+    # Lookups
+
+    @property
+    def asg_tags(self):
+        self.ensure_loaded()
+        return self.asg.get("Tags", [])
+
+    def asg_instance_ids(self, lifecycle_state="InService"):
+        self.ensure_loaded()
+        return [
+            item["InstanceId"] for item in self.asg.get("Instances", [])
+            if lifecycle_state is None or item.get("LifecycleState") == lifecycle_state
+        ]
+
+    def instance(self, instance_id):
+        self.ensure_loaded()
+        with self._lock:
+            record = self.instances.get(instance_id)
+            if record is None:
+                # Instances launched moments ago may not match the tag filter yet.
+                for instance in iter_instances(self.ec2_client, [instance_id]):
+                    record = self._add_instance(instance)
+            return record
+
+    def instance_details(self, instance_ids=None, status="available", lifecycle_state="InService"):
+        if instance_ids is None:
+            instance_ids = self.asg_instance_ids(lifecycle_state)
+        records = [self.instance(instance_id) for instance_id in instance_ids]
+        return [record for record in records if record and record["Tags"].get("Status") == status]
+
+    def instances_in_az(self, availability_zone):
+        self.ensure_loaded()
+        return list(self._instances_by_az.get(availability_zone, []))
+
+    def instances_with_status(self, status):
+        self.ensure_loaded()
+        return list(self._instances_by_status.get(status, []))
+
+    def eni(self, eni_id):
+        self.ensure_loaded()
+        return self.enis.get(eni_id)
+
+    def eni_of_instance(self, instance_id):
+        self.ensure_loaded()
+        return self._enis_by_instance.get(instance_id)
+
+    def available_enis(self, availability_zone=None, subnet_id=None):
+        self.ensure_loaded()
+        if subnet_id:
+            candidates = self._enis_by_subnet.get(subnet_id, [])
+        elif availability_zone:
+            candidates = self._enis_by_az.get(availability_zone, [])
+        else:
+            candidates = self._enis_by_status.get("available", [])
+        return [
+            eni for eni in candidates
+            if eni["status"] == "available"
+            and (not availability_zone or eni["availability_zone"] == availability_zone)
+        ]
+
+    def volume(self, volume_id):
+        self.ensure_loaded()
+        return self.volumes.get(volume_id)
+
+    def volume_of_instance(self, instance_id):
+        self.ensure_loaded()
+        return self._volumes_by_instance.get(instance_id)
+
+    def available_volumes(self, availability_zone=None):
+        self.ensure_loaded()
+        candidates = self._volumes_by_az.get(availability_zone, []) if availability_zone else self._volumes_by_status.get("available", [])
+        return [volume for volume in candidates if volume["Tags"].get("Status") == "available"]
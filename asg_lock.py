@@ -0,0 +1,270 @@
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import metrics
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+LOCK_BACKEND = os.environ.get("ASG_LOCK_BACKEND", "dynamodb")
+LOCK_TABLE = os.environ.get("ASG_LOCK_TABLE", "asg-lock")
+LEASE_SECONDS = float(os.environ.get("ASG_LOCK_LEASE_SECONDS", "300"))
+WAIT_SECONDS = float(os.environ.get("ASG_LOCK_WAIT_SECONDS", "600"))
+INITIAL_BACKOFF_SECONDS = 0.2
+MAX_BACKOFF_SECONDS = 5.0
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class LockLost(Exception):
+    pass
+
+
+class LockLease:
+    def __init__(self, key, owner, token, expires_at):
+        self.key = key
+        self.owner = owner
+        # Fencing token: strictly increases on every successful acquire of the key,
+        # so a holder whose lease expired can be told apart from the current one.
+        self.token = token
+        self.expires_at = expires_at
+
+    def __repr__(self):
+        return f"LockLease(key={self.key}, owner={self.owner}, token={self.token}, expires_at={self.expires_at})"
+
+
+class InMemoryLockBackend:
+    """Process-local backend for tests and local runs. Waiters are woken on release."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._holders = {}
+        self._tokens = {}
+        self._first_attempts = {}
+        # Seconds from the first attempt of an owner to its acquisition, per key; for load tests.
+        self.waits = {}
+
+    def try_acquire(self, key, owner, lease_seconds):
+        with self._condition:
+            now = time.time()
+            first_attempt = self._first_attempts.setdefault((key, owner), now)
+            holder = self._holders.get(key)
+            if holder and holder.expires_at > now:
+                return None
+            token = self._tokens.get(key, 0) + 1
+            self._tokens[key] = token
+            lease = LockLease(key, owner, token, now + lease_seconds)
+            self._holders[key] = lease
+            del self._first_attempts[(key, owner)]
+            self.waits.setdefault(key, []).append(now - first_attempt)
+            return lease
+
+    def renew(self, lease, lease_seconds):
+        with self._condition:
+            if not self._is_current(lease):
+                return False
+            lease.expires_at = time.time() + lease_seconds
+            return True
+
+    def release(self, lease):
+        with self._condition:
+            if not self._is_current(lease):
+                return False
+            del self._holders[lease.key]
+            self._condition.notify_all()
+            return True
+
+    def is_current(self, lease):
+        with self._condition:
+            return self._is_current(lease)
+
+    def wait_for_release(self, key, timeout):
+        with self._condition:
+            holder = self._holders.get(key)
+            if holder:
+                # Wake up on release, or when the current lease runs out.
+                timeout = min(timeout, max(holder.expires_at - time.time(), 0))
+            self._condition.wait(timeout)
+
+    def _is_current(self, lease):
+        holder = self._holders.get(lease.key)
+        return (
+            holder is not None
+            and holder.owner == lease.owner
+            and holder.token == lease.token
+            and holder.expires_at > time.time()
+        )
+
+
+class DynamoDbLockBackend:
+    """Lease lock on a DynamoDB table keyed by `lock_key`, using conditional writes."""
+
+    def __init__(self, client, table_name=LOCK_TABLE):
+        self.client = client
+        self.table_name = table_name
+
+    def try_acquire(self, key, owner, lease_seconds):
+        now = time.time()
+        expires_at = now + lease_seconds
+        try:
+            response = self.client.update_item(
+                TableName=self.table_name,
+                Key={"lock_key": {"S": key}},
+                UpdateExpression="SET #owner = :owner, expires_at = :expires ADD fencing_token :one",
+                ConditionExpression="attribute_not_exists(#owner) OR expires_at < :now",
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={
+                    ":owner": {"S": owner},
+                    ":expires": {"N": str(expires_at)},
+                    ":now": {"N": str(now)},
+                    ":one": {"N": "1"},
+                },
+                ReturnValues="ALL_NEW",
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return None
+
+        token = int(response["Attributes"]["fencing_token"]["N"])
+        return LockLease(key, owner, token, expires_at)
+
+    def renew(self, lease, lease_seconds):
+        expires_at = time.time() + lease_seconds
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"lock_key": {"S": lease.key}},
+                UpdateExpression="SET expires_at = :expires",
+                ConditionExpression="#owner = :owner AND fencing_token = :token AND expires_at >= :now",
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={
+                    ":owner": {"S": lease.owner},
+                    ":token": {"N": str(lease.token)},
+                    ":expires": {"N": str(expires_at)},
+                    ":now": {"N": str(time.time())},
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        lease.expires_at = expires_at
+        return True
+
+    def release(self, lease):
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"lock_key": {"S": lease.key}},
+                UpdateExpression="REMOVE #owner SET expires_at = :zero",
+                ConditionExpression="#owner = :owner AND fencing_token = :token",
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={
+                    ":owner": {"S": lease.owner},
+                    ":token": {"N": str(lease.token)},
+                    ":zero": {"N": "0"},
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def is_current(self, lease):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"lock_key": {"S": lease.key}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        if not item or "owner" not in item:
+            return False
+        return (
+            item["owner"]["S"] == lease.owner
+            and int(item["fencing_token"]["N"]) == lease.token
+            and float(item["expires_at"]["N"]) > time.time()
+        )
+
+    def wait_for_release(self, key, timeout):
+        # DynamoDB has no release notification; sleep with jitter so waiters spread out.
+        time.sleep(random.uniform(timeout / 2, timeout))
+
+
+_memory_backend = InMemoryLockBackend()
+
+
+def get_lock_backend():
+    if LOCK_BACKEND == "memory":
+        return _memory_backend
+    elif LOCK_BACKEND == "dynamodb":
+        return DynamoDbLockBackend(get_client("dynamodb"), LOCK_TABLE)
+    else:
+        raise Exception(f"Unknown lock backend {LOCK_BACKEND}.")
+
+
+class AsgLock:
+    def __init__(self, asg_name, backend=None, owner=None, lease_seconds=LEASE_SECONDS):
+        self.key = f"asg_lock#{asg_name}"
+        self.backend = backend or get_lock_backend()
+        self.owner = owner or uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self.lease = None
+        self.wait_seconds = 0.0
+        self.acquired_at = None
+
+    def acquire(self, timeout=WAIT_SECONDS, on_wait=None):
+        # on_wait runs before every wait, e.g. to heartbeat the lifecycle hooks that
+        # would otherwise time out behind a long lock convoy.
+        started = time.monotonic()
+        deadline = started + timeout
+        backoff = INITIAL_BACKOFF_SECONDS
+
+        while True:
+            lease = self.backend.try_acquire(self.key, self.owner, self.lease_seconds)
+            if lease:
+                self.lease = lease
+                self.wait_seconds = time.monotonic() - started
+                self.acquired_at = time.time()
+                metrics.put("LockWait", self.wait_seconds * 1000)
+                logger.info(f"Acquired lock {self.key} with fencing token {lease.token} after {self.wait_seconds:.2f}s.")
+                return lease
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.wait_seconds = time.monotonic() - started
+                metrics.put("LockWait", self.wait_seconds * 1000)
+                metrics.put("LockTimeouts", 1, "Count")
+                raise LockTimeout(f"Timed out after {timeout}s waiting for lock {self.key}.")
+
+            logger.info(f"Lock {self.key} is held by another invocation. Waiting up to {backoff:.2f}s.")
+            if on_wait:
+                on_wait()
+            self.backend.wait_for_release(self.key, min(backoff, remaining))
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def renew(self):
+        if not self.lease or not self.backend.renew(self.lease, self.lease_seconds):
+            raise LockLost(f"Lease on {self.key} was lost.")
+
+    def ensure_held(self):
+        if not self.lease or not self.backend.is_current(self.lease):
+            raise LockLost(f"Lease on {self.key} is no longer held by {self.owner}.")
+
+    def release(self):
+        if not self.lease:
+            return
+        if not self.backend.release(self.lease):
+            logger.warning(f"Lease on {self.key} expired before release (token {self.lease.token}).")
+        else:
+            logger.info(f"Released lock {self.key}.")
+        self.lease = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
@@ -1,55 +1,90 @@
-import boto3
 import json
 import logging
-from collections import defaultdict
-import time
-import random
-
-ec2_client = boto3.client('ec2')
-autoscaling_client = boto3.client('autoscaling')
+import metrics
+from api_accounting import accounting, log_call_summary
+from asg_lock import AsgLock, LockTimeout
+from readiness import ReadinessTimeout, wait_for_instances_running
+from tagging import TagBatch
+from log_utils import payload
+from detach import detach_instance_resources
+from attach_pipeline import run_batch
+from assignment import plan_assignments
+from aws_clients import get_client
+from rate_limiter import log_rate_limiter_counters, rate_limiter
+from asg_inventory import AsgInventory
+from binding_store import get_binding_store, make_binding, migrate_asg_tag_bindings
+from refresh_swap import find_incoming_instance, plan_swap, record_incoming_instance
+from lifecycle_hooks import LifecycleAction, complete_many, complete_pending, heartbeat_all
+from provision_workflow import ProvisionWorkflow, WorkflowYielded, deadline_near, remaining_ms, start_invocation
+from idempotency import claim, get_idempotency_store, idempotency_key, record_outcome
+from lifecycle_records import (
+    LAUNCHING,
+    TERMINATING,
+    group_lifecycle_records,
+    is_sqs_event,
+    parse_lifecycle_records,
+)
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def update_asg_tags(auto_scaling_group_name, old_instance_id, new_instance_id, eni_id, ebs_id, subnet_id):
-    logger.info(f"Updating ASG {auto_scaling_group_name} tags. Replacing {old_instance_id} with {new_instance_id}")
-
-    autoscaling_client = boto3.client('autoscaling')
+def update_instance_binding(auto_scaling_group_name, old_instance_id, new_instance_id, eni_id, ebs_id, subnet_id, availability_zone=None,
+                            slot=None, server_group=None):
+    logger.info(f"Updating bindings of ASG {auto_scaling_group_name}. Replacing {old_instance_id} with {new_instance_id}")
 
-    # Step 1: Remove old instance tags
-    delete_tags = [
-        {"Key": f"subnet_{old_instance_id}"},
-        {"Key": f"eni_{old_instance_id}"},
-        {"Key": f"ebs_{old_instance_id}"}
-    ]
+    binding_store = get_binding_store()
     try:
-        autoscaling_client.delete_tags(
-            Tags=[{"ResourceId": auto_scaling_group_name, "ResourceType": "auto-scaling-group", **tag} for tag in delete_tags]
-        )
-        logger.info(f"Successfully removed old instance {old_instance_id} tags.")
+        binding_store.delete(auto_scaling_group_name, old_instance_id)
+        binding_store.put(make_binding(
+            auto_scaling_group_name, new_instance_id, eni_id, ebs_id, subnet_id, availability_zone, slot, server_group
+        ))
+        logger.info(f"Successfully updated ASG {auto_scaling_group_name} bindings with new instance {new_instance_id}.")
     except Exception as e:
-        logger.error(f"Error removing tags for old instance {old_instance_id}. {e}")
+        logger.error(f"Error updating ASG {auto_scaling_group_name} bindings with new instance {new_instance_id}. {e}")
 
-    # Step 2: Add new instance tags
-    new_tags = [
-        {"Key": f"subnet_{new_instance_id}", "Value": subnet_id},
-        {"Key": f"eni_{new_instance_id}", "Value": eni_id},
-        {"Key": f"ebs_{new_instance_id}", "Value": ebs_id}
-    ]
+
+def lambda_handler(event, context):
+    rate_limiter.reset_counters()
+    accounting.reset()
+    start_invocation(context)
     try:
-        autoscaling_client.create_or_update_tags(
-            Tags=[{"ResourceId": auto_scaling_group_name, "ResourceType": "auto-scaling-group", "PropagateAtLaunch": True, **tag} for tag in new_tags]
-        )
-        logger.info(f"Successfully updated ASG {auto_scaling_group_name} with new instance {new_instance_id}.")
-    except Exception as e:
-        logger.error(f"Error updating ASG {auto_scaling_group_name} with new instance {new_instance_id}. {e}")
+        with metrics.invocation():
+            return handle_once(event, context)
+    finally:
+        log_rate_limiter_counters()
+        log_call_summary()
+
+
+def handle_once(event, context):
+    # Redelivered single events return the stored outcome; batches are deduplicated per record in handle_batch.
+    if len(event.get('Records', [])) != 1 or is_sqs_event(event):
+        return handle_event(event, context)
+    record = parse_lifecycle_records(event)[0]
+    if record["error"]:
+        return handle_event(event, context)
+
+    store = get_idempotency_store()
+    key = idempotency_key(record)
+    duplicate = claim(store, key, remaining_ms())
+    if duplicate:
+        return duplicate
+    try:
+        response = handle_event(event, context)
+    except Exception:
+        record_outcome(store, key, None)
+        raise
+    record_outcome(store, key, response)
+    return response
 
 
-def lambda_handler(event, context):
-    logger.info(f"Event: {json.dumps(event)}")
+def handle_event(event, context):
+    logger.info("Event: %s", payload(event))
+
+    if len(event.get('Records', [])) > 1 or is_sqs_event(event):
+        return handle_batch(parse_lifecycle_records(event))
     
     lifecycle_event_Records = event.get('Records', {})
-    logger.info(f"Records: {lifecycle_event_Records}")
+    logger.info("Records: %s", payload(lifecycle_event_Records))
     if len(lifecycle_event_Records) != 0:
         lifecycle_event_string = lifecycle_event_Records[0].get("Sns", {}).get("Message")
         lifecycle_event = json.loads(lifecycle_event_string)
@@ -61,13 +96,14 @@ def lambda_handler(event, context):
             "body": "No event records found."
         } 
     
-    logger.info(f"Message: {lifecycle_event}")
+    logger.info("Message: %s", payload(lifecycle_event))
     lifecycle_action_token = lifecycle_event.get('LifecycleActionToken')
     auto_scaling_group_name = lifecycle_event.get('AutoScalingGroupName')
     instance_id = lifecycle_event.get('EC2InstanceId')
     lifecycle_transition = lifecycle_event.get('LifecycleTransition')
     lifecycle_event = lifecycle_event.get('Event')
     lifecycle_hook_name = lifecycle_event_copy.get('LifecycleHookName')
+    metrics.set_dimensions(auto_scaling_group_name, lifecycle_transition or lifecycle_event)
 
 
     if not auto_scaling_group_name:
@@ -77,94 +113,206 @@ def lambda_handler(event, context):
         }
 
     if lifecycle_event == "autoscaling:TEST_NOTIFICATION" and not lifecycle_transition:
-        return handle__new_provision(event)
+        response = handle__new_provision(event)
     else:
-        return handle_autoscale(auto_scaling_group_name, instance_id, event)
+        response = handle_autoscale(auto_scaling_group_name, instance_id, event)
 
+    if response and response.get("deferred"):
+        # Failing the invocation makes Lambda deliver the SNS event again; the retry resumes from the checkpoint.
+        raise WorkflowYielded(response["body"])
+    return response
 
-def complete_lifecycle_action(asg_name, lifecycle_hook_name, lifecycle_action_token, result="CONTINUE"):
-    autoscaling_client = boto3.client('autoscaling')
+
+def handle_batch(records):
+    results = {}
+    store = get_idempotency_store()
+    claimed = {}
+    to_handle = []
+    for record in records:
+        if record["error"]:
+            results[record["record_id"]] = {"statusCode": 400, "body": record["error"]}
+        elif not record["asg_name"]:
+            results[record["record_id"]] = {"statusCode": 400, "body": "Missing AutoScalingGroupName in the event."}
+        else:
+            key = idempotency_key(record)
+            if key not in claimed:
+                duplicate = claim(store, key, remaining_ms())
+                if duplicate:
+                    results[record["record_id"]] = duplicate
+                    continue
+                claimed[key] = []
+            # Duplicates within the batch share the outcome of the first record.
+            claimed[key].append(record["record_id"])
+            to_handle.append(record)
 
     try:
-        response = autoscaling_client.complete_lifecycle_action(
-            AutoScalingGroupName=asg_name,
-            LifecycleHookName=lifecycle_hook_name,
-            LifecycleActionToken=lifecycle_action_token,
-            LifecycleActionResult=result
-        )
-        print("Lifecycle action completed successfully:", response)
-    except Exception as e:
-        print("Error completing lifecycle action:", str(e))
+        handle_record_groups(to_handle, results)
+    finally:
+        for key, record_ids in claimed.items():
+            outcomes = [results.get(record_id) for record_id in record_ids]
+            failed = next((outcome for outcome in outcomes if not outcome or outcome["statusCode"] >= 400), None)
+            record_outcome(store, key, failed or outcomes[0])
 
-def handle_autoscale(auto_scaling_group_name, instance_id, event):
-    logger.info(f"Handling autoscale for instance: {instance_id} in ASG: {auto_scaling_group_name}")
+    failures = [record_id for record_id, result in results.items() if result["statusCode"] >= 400]
+    for record_id in failures:
+        logger.error(f"Record {record_id} failed. {results[record_id]['body']}")
 
-    # Step 1: Get Availability Zone (AZ) of the instance
-    instance_details = get_instance_details([instance_id], "available")
-    
-    if not instance_details or len(instance_details) == 0:
-        logger.error(f"Instance {instance_id} not found or not in available state.")
-        return {"statusCode": 400, "body": f"Instance {instance_id} not found."}
-    
-    instance_az = instance_details[0].get("AvailabilityZone")
-    logger.info(f"Instance {instance_id} is in Availability Zone: {instance_az}")
+    return {
+        "statusCode": 400 if failures else 200,
+        "body": f"Processed {len(results)} record(s), {len(failures)} failed.",
+        "results": [{"itemIdentifier": record["record_id"], **results[record["record_id"]]} for record in records],
+        "batchItemFailures": [{"itemIdentifier": record_id} for record_id in failures]
+    }
 
-    # Step 2: Get Available ENIs & EBS Volumes in the AZ
-    while True:
-        available_ebs = get_ebs_volumes_with_tag("AsgName", auto_scaling_group_name)
-        available_eni = get_networkinterfaces(auto_scaling_group_name)
 
-        # Filter based on AZ
-        available_ebs = [ebs for ebs in available_ebs if ebs["AvailabilityZone"] == instance_az]
-        available_eni = [eni for eni in available_eni if eni["availability_zone"] == instance_az and eni["status"] == "available"]
+def handle_record_groups(records, results):
+    for (auto_scaling_group_name, lifecycle_transition), group in group_lifecycle_records(records).items():
+        if deadline_near():
+            # Failed records are delivered again, to an invocation with time left.
+            for record in group:
+                results[record["record_id"]] = {"statusCode": 503, "body": "Deferred as the Lambda deadline is near."}
+            continue
+        logger.info(f"Processing {len(group)} record(s) for {auto_scaling_group_name} ({lifecycle_transition}).")
+        results.update(process_record_group(auto_scaling_group_name, lifecycle_transition, group))
+
+
+def process_record_group(auto_scaling_group_name, lifecycle_transition, records):
+    # One lock acquisition and one inventory snapshot for every record of the group.
+    metrics.set_dimensions(auto_scaling_group_name, lifecycle_transition)
+    inventory = AsgInventory(auto_scaling_group_name)
+    asg_lock = AsgLock(auto_scaling_group_name)
+    lifecycle_actions = {
+        instance_id: LifecycleAction.from_message(duplicates[0]["message"])
+        for instance_id, duplicates in _records_by_instance(records).items() if instance_id
+    }
+    try:
+        asg_lock.acquire(on_wait=lambda: heartbeat_all(lifecycle_actions))
+    except LockTimeout as e:
+        logger.error(f"Autoscaling group {auto_scaling_group_name} is still locked. {e}")
+        return {record["record_id"]: {"statusCode": 409, "body": f"{e}"} for record in records}
 
-        if available_ebs and available_eni:
-            break  # Resources found, proceed to attachment
+    try:
+        if lifecycle_transition == TERMINATING:
+            return terminate_record_group(auto_scaling_group_name, records, asg_lock, inventory, lifecycle_actions)
+        elif lifecycle_transition == LAUNCHING:
+            return launch_record_group(auto_scaling_group_name, records, asg_lock, inventory, lifecycle_actions)
+        else:
+            response = provision_asg(auto_scaling_group_name, None, lifecycle_transition, asg_lock, inventory)
+            return {record["record_id"]: {"statusCode": response["statusCode"], "body": response["body"]} for record in records}
+    except Exception as e:
+        logger.error(f"Error in processing records of {auto_scaling_group_name}. {e}")
+        return {record["record_id"]: {"statusCode": 500, "body": f"{e}"} for record in records}
+    finally:
+        asg_lock.release()
+
+
+def terminate_record_group(auto_scaling_group_name, records, asg_lock, inventory, lifecycle_actions):
+    results = {}
+    released = []
+    swapped = {}
+    binding_store = get_binding_store()
+    for instance_id, duplicates in _records_by_instance(records).items():
+        try:
+            response = terminate_instance(
+                auto_scaling_group_name, instance_id, asg_lock, inventory, binding_store, provision=False,
+                lifecycle_actions=lifecycle_actions
+            )
+            if response:
+                swapped[instance_id] = response
+            released.append((instance_id, duplicates))
+        except Exception as e:
+            complete_pending(lifecycle_actions, instance_id, "ABANDON", f"Failed to release resources of {instance_id}. {e}")
+            for record in duplicates:
+                results[record["record_id"]] = {"statusCode": 500, "body": f"Failed to release resources of {instance_id}. {e}"}
+
+    response = None
+    if len(swapped) < len(released):
+        response = provision_asg(auto_scaling_group_name, None, TERMINATING, asg_lock, inventory, lifecycle_actions)
+        if response["statusCode"] >= 400 and not response.get("deferred"):
+            # The launch records of the affected instances carry this failure; the released
+            # terminations are done and must not be delivered again.
+            logger.error(f"Provisioning {auto_scaling_group_name} after releasing resources failed. {response['body']}")
+    complete_many(lifecycle_actions, [instance_id for instance_id, _ in released])
+    for instance_id, duplicates in released:
+        if instance_id in swapped:
+            result = {"statusCode": 200, "body": swapped[instance_id]["body"]}
+        elif response.get("deferred"):
+            # A deferred run fails the record, so the batch delivers it again and the next run resumes.
+            result = {"statusCode": 503, "body": f"Released resources of {instance_id}. {response['body']}",
+                      "deferred": response["deferred"]}
         else:
-            logger.info(f"No available EBS or ENI in AZ {instance_az}. Waiting...")
-            time.sleep(5)  # Wait before checking again
+            result = {"statusCode": 200, "body": f"Released resources of {instance_id}. {response['body']}"}
+        for record in duplicates:
+            results[record["record_id"]] = dict(result)
+    return results
 
-    # Step 3: Attach First Available ENI to the Instance
-    eni_id = available_eni[0]["eni_id"]
-    logger.info(f"Attaching ENI {eni_id} to instance {instance_id}")
 
+def launch_record_group(auto_scaling_group_name, records, asg_lock, inventory, lifecycle_actions):
+    results = {}
+    by_instance = _records_by_instance(records)
     try:
-        response = ec2_client.attach_network_interface(
-            NetworkInterfaceId=eni_id,
-            InstanceId=instance_id,
-            DeviceIndex=1
-        )
-        logger.info(f"Successfully attached ENI {eni_id} to {instance_id}.")
-    except Exception as e:
-        logger.error(f"Failed to attach ENI {eni_id} to {instance_id}. Error: {e}")
-        return {"statusCode": 500, "body": f"Error attaching ENI {eni_id} to {instance_id}. {e}"}
+        with metrics.span("WaitInstanceRunning"):
+            wait_for_instances_running(get_client('ec2'), list(by_instance), on_wait=keep_alive(asg_lock, lifecycle_actions))
+    except ReadinessTimeout as e:
+        for instance_id in by_instance:
+            complete_pending(lifecycle_actions, instance_id, "ABANDON", f"{e}")
+        return {record["record_id"]: {"statusCode": 500, "body": f"{e}"} for record in records}
+
+    to_provision = []
+    for instance_id, duplicates in by_instance.items():
+        instance_details = inventory.instance_details([instance_id], "available")
+        if not instance_details:
+            if inventory.eni_of_instance(instance_id):
+                # Already attached by an earlier run (e.g. a termination in the same batch).
+                complete_pending(lifecycle_actions, instance_id)
+            for record in duplicates:
+                results[record["record_id"]] = {"statusCode": 200, "body": "No action is required."}
+        elif not inventory.available_enis(subnet_id=instance_details[0].get("SubnetId")):
+            # Instance refresh: the resources arrive with the termination of the node being replaced.
+            record_incoming_instance(get_binding_store(), auto_scaling_group_name, instance_details[0])
+            complete_pending(lifecycle_actions, instance_id)
+            for record in duplicates:
+                results[record["record_id"]] = {"statusCode": 200, "body": f"Launching opeation is completed for instance {instance_id}"}
+        else:
+            to_provision.append(instance_id)
+
+    if to_provision:
+        response = provision_asg(auto_scaling_group_name, to_provision, LAUNCHING, asg_lock, inventory, lifecycle_actions)
+        errors = {item["InstanceId"]: item["error"] for item in response["failed"]}
+        deferred = response.get("deferred", [])
+        for instance_id in to_provision:
+            if instance_id in deferred:
+                result = {"statusCode": 503, "body": f"Attaching devices to {instance_id} deferred as the Lambda deadline is near."}
+            elif instance_id in errors:
+                result = {"statusCode": 400, "body": f"Error in attaching devices to {instance_id}. {errors[instance_id]}"}
+            elif instance_id in response["attached"]:
+                result = {"statusCode": 200, "body": f"Successfully attached devices to {instance_id}."}
+            else:
+                result = {"statusCode": response["statusCode"], "body": response["body"]}
+            for record in by_instance[instance_id]:
+                results[record["record_id"]] = result
+    return results
 
-    # Step 4: Attach First Available EBS to the Instance
-    volume_id = available_ebs[0]["VolumeId"]
-    logger.info(f"Attaching EBS {volume_id} to instance {instance_id}")
 
-    try:
-        response = attach_ebs_volumes_to_ec2(instance_id, volume_id)
-        logger.info(f"Successfully attached EBS {volume_id} to {instance_id}.")
-    except Exception as e:
-        logger.error(f"Failed to attach EBS {volume_id} to {instance_id}. Error: {e}")
-        return {"statusCode": 500, "body": f"Error attaching EBS {volume_id} to {instance_id}. {e}"}
+def _records_by_instance(records):
+    by_instance = {}
+    for record in records:
+        by_instance.setdefault(record["instance_id"], []).append(record)
+    return by_instance
 
-    # Step 5: Tag the ENI & EBS as "in-use"
-    tags = [
-        {"Key": "Instance", "Value": instance_id},
-        {"Key": "AsgName", "Value": auto_scaling_group_name},
-        {"Key": "Status", "Value": "in-use"}
-    ]
-    tag_eni(eni_id, tags)
-    tag_ebs(volume_id, tags)
 
-    logger.info(f"Successfully tagged ENI {eni_id} and EBS {volume_id} as in-use.")
+def complete_lifecycle_action(asg_name, lifecycle_hook_name, lifecycle_action_token, result="CONTINUE"):
+    return LifecycleAction(asg_name, lifecycle_hook_name, lifecycle_action_token).complete(result)
 
-    return {"statusCode": 200, "body": f"Successfully attached ENI {eni_id} and EBS {volume_id} to instance {instance_id}."}
 
+def keep_alive(asg_lock, lifecycle_actions=None):
+    # on_wait callback for long readiness waits: keeps the ASG lock and the pending hooks alive.
+    def on_wait():
+        asg_lock.renew()
+        heartbeat_all(lifecycle_actions)
+    return on_wait
 
-def handle_autoscale(auto_scaling_group_name, instance_id, event):
+def handle_autoscale(auto_scaling_group_name, instance_id, event, inventory=None):
     lifecycle_event_Records = event.get('Records', {})    
     lifecycle_event_string = lifecycle_event_Records[0].get("Sns", {}).get("Message")
     lifecycle_event = json.loads(lifecycle_event_string)
@@ -183,37 +331,51 @@ def handle_autoscale(auto_scaling_group_name, instance_id, event):
         instance_status = "available"
 
     logger.info(f"Filtering with status: {instance_status}")
+    lifecycle_action = LifecycleAction.from_message(lifecycle_event_copy)
+    if lifecycle_transition == "autoscaling:EC2_INSTANCE_LAUNCHING":
+        try:
+            with metrics.span("WaitInstanceRunning"):
+                wait_for_instances_running(get_client('ec2'), [instance_id], on_wait=lifecycle_action.heartbeat)
+        except ReadinessTimeout as e:
+            logger.error(f"{e}")
+            lifecycle_action.abandon(f"{e}")
+            return {"statusCode": 500, "body": f"{e}"}
+
+    inventory = inventory or AsgInventory(auto_scaling_group_name)
+    if lifecycle_transition == "autoscaling:EC2_INSTANCE_TERMINATING":
+        return handle_instance_termination(auto_scaling_group_name, instance_id, event, inventory, lifecycle_action)
+
     logger.info(f"Fetching the information of all EC2 instances created as part of Autoscaling group: {auto_scaling_group_name}")
-    instance_details = get_instances_in_asg(auto_scaling_group_name, instance_id, instance_status)
-    logger.info(f"Instance details: {instance_details}")
+    instance_details = inventory.instance_details([instance_id], instance_status)
+    logger.info("Instance details: %s", payload(instance_details))
     
     if len(instance_details) == 0:
+        if lifecycle_transition == "autoscaling:EC2_INSTANCE_LAUNCHING" and inventory.eni_of_instance(instance_id):
+            # Already attached by an earlier run; nothing to wait for.
+            lifecycle_action.complete()
         return {
             "statusCode": 200,
             "body": f"No action is required."
         }
         
     instance_details = instance_details[0]
-    subnet_id = instance_details.get("subnet_id")
-    subnets = get_subnets(auto_scaling_group_name, subnet_id)
+    subnet_id = instance_details.get("SubnetId")
+    subnets = inventory.available_enis(subnet_id=subnet_id)
 
     if not subnets or len(subnets) == 0:
         logger.info("This seems to be ASG operation for instance refresh. This gets handled during termination of other instance.")
-        if lifecycle_transition == "autoscaling:EC2_INSTANCE_LAUNCHING":
-            complete_lifecycle_action(auto_scaling_group_name, lifecycle_hook_name, lifecycle_action_token)
-        else:
-            handle_instance_termination(auto_scaling_group_name, instance_id, event)
+        record_incoming_instance(get_binding_store(), auto_scaling_group_name, instance_details)
+        lifecycle_action.complete()
         return {
             "statusCode": 200,
             "body": f"Launching opeation is completed for instance {instance_id}"
         }
     else:
-        handle__new_provision(event)
+        return handle__new_provision(event, inventory, lifecycle_action=lifecycle_action)
 
 
-def handle_instance_termination(auto_scaling_group_name, instance_id, event):
-    tags = read_asg_tags(auto_scaling_group_name)
-    instance_resources = get_instance_components(instance_id, tags)
+def handle_instance_termination(auto_scaling_group_name, instance_id, event, inventory=None, lifecycle_action=None):
+    inventory = inventory or AsgInventory(auto_scaling_group_name)
 
     lifecycle_event_Records = event.get('Records', {})    
     lifecycle_event_string = lifecycle_event_Records[0].get("Sns", {}).get("Message")
@@ -227,177 +389,172 @@ def handle_instance_termination(auto_scaling_group_name, instance_id, event):
     lifecycle_event = lifecycle_event.get('Event')
     lifecycle_hook_name = lifecycle_event_copy.get('LifecycleHookName')
 
-    if instance_resources.get("ebs_id"):
-        detach_ebs_volume(instance_id, instance_resources.get("ebs_id"))
-    
-    if instance_resources.get("eni_id"):
-        detach_eni(instance_id, instance_resources.get("eni_id"))
-
-    tags_others = [
-        {
-            'Key': 'Instance',
-            'Value': instance_id
-        },
-        {
-            'Key': 'Status',
-            'Value': 'available'
+    lifecycle_action = lifecycle_action or LifecycleAction.from_message(lifecycle_event_copy)
+    asg_lock = AsgLock(auto_scaling_group_name)
+    try:
+        asg_lock.acquire(on_wait=lifecycle_action.heartbeat)
+    except LockTimeout as e:
+        logger.error(f"Autoscaling group {auto_scaling_group_name} is still locked. {e}")
+        return {
+            "statusCode": 409,
+            "body": f"Autoscaling group {auto_scaling_group_name} is locked by another operation."
         }
-    ]
-
-    tag_eni(instance_resources.get("eni_id"), tags_others)
-    tag_ebs(instance_resources.get("ebs_id"), tags_others)
-    
-    response = handle__new_provision(event)
-    complete_lifecycle_action(auto_scaling_group_name, lifecycle_hook_name, lifecycle_action_token)
-
-    return response
 
-def detach_ebs_volume(instance_id, volume_id):
-    ec2_client = boto3.client('ec2')
     try:
-        response = ec2_client.detach_volume(
-            VolumeId=volume_id,
-            InstanceId=instance_id,
-            Force=True
+        response = terminate_instance(
+            auto_scaling_group_name, instance_id, asg_lock, inventory, lifecycle_actions={instance_id: lifecycle_action}
         )
-
-        # tags_others = [
-        #     {
-        #         'Key': 'Status',
-        #         'Value': 'available'
-        #     }
-        # ]
-
-        # tag_ebs(volume_id, tags_others)
-        logger.info(f"Successfully detached EBS volume {volume_id} from instance {instance_id}")
-        return response
-
+    except ReadinessTimeout as e:
+        logger.error(f"Detached resources of {instance_id} did not become available. {e}")
+        lifecycle_action.abandon(f"Detached resources of {instance_id} did not become available. {e}")
+        return {"statusCode": 500, "body": f"{e}"}
     except Exception as e:
-        raise Exception(f"Failed to detach EBS volume {volume_id} from instance {instance_id}. {e}")
+        logger.error(f"Failed to release resources of {instance_id}. {e}")
+        lifecycle_action.abandon(f"Failed to release resources of {instance_id}. {e}")
+        return {"statusCode": 500, "body": f"Failed to release resources of {instance_id}. {e}"}
+    finally:
+        asg_lock.release()
 
-def detach_eni(instance_id, eni_id):
+    lifecycle_action.complete()
 
-    attachment_id = get_attachment_id_from_eni(eni_id)
-    try:
-        response = ec2_client.detach_network_interface(
-                    AttachmentId=attachment_id,
-                    Force=True
-                )
-        tags_others = [
-            {
-                'Key': 'Status',
-                'Value': 'available'
-            }
-        ]
-
-        logger.info(f"Successfully detached ENI  {eni_id} from instance {instance_id}")
-        tag_eni(instance_id, tags_others)
-
-        return response
-    except Exception as e:
-        raise Exception(f"Failed to detach ENI {eni_id} from instance {instance_id}. {e}")
+    return response
 
-def get_attachment_id_from_eni(eni_id):
-    ec2_client = boto3.client('ec2')
 
+def terminate_instance(auto_scaling_group_name, instance_id, asg_lock, inventory, binding_store=None, provision=True,
+                       lifecycle_actions=None):
+    # Must be called with the ASG lock held. Returns None when provision is False and
+    # no waiting replacement took the resources over directly.
+    binding_store = binding_store or get_binding_store()
+    on_wait = keep_alive(asg_lock, lifecycle_actions)
     try:
-        response = ec2_client.describe_network_interfaces(
-            NetworkInterfaceIds=[eni_id]
-        ) 
-
-        network_interface = response["NetworkInterfaces"][0]
-        attachment = network_interface.get("Attachment")
-
-        if attachment:
-            attachment_id = attachment.get("AttachmentId")
-            return attachment_id
-        else:
-            logger.info(f"No Attachment id found. ENI {eni_id} is not attached to any instance.")
-            return None
+        response = refresh_swap(auto_scaling_group_name, instance_id, asg_lock, inventory, binding_store, on_wait)
+        if response:
+            return response
+    except ReadinessTimeout:
+        raise
     except Exception as e:
-        raise Exception(f"Failed to read ENI for attachment id {e}")
+        logger.error(f"Refresh swap of {instance_id} failed, falling back to a provisioning run. {e}")
+        inventory.invalidate()
+        if not binding_store.get(auto_scaling_group_name, instance_id):
+            if not provision:
+                return None
+            return provision_asg(auto_scaling_group_name, None, TERMINATING, asg_lock, inventory, lifecycle_actions)
+
+    release_instance_resources(auto_scaling_group_name, instance_id, inventory, binding_store, on_wait)
+    if not provision:
+        return None
+
+    # The released ENI and volume go to whichever replacement instance is waiting for them.
+    return provision_asg(auto_scaling_group_name, None, TERMINATING, asg_lock, inventory, lifecycle_actions)
+
+
+def refresh_swap(auto_scaling_group_name, instance_id, asg_lock, inventory, binding_store, on_wait=None):
+    # Instance refresh fast path: move the ENI and volume of the terminating instance
+    # straight to the replacement recorded at its launch, without a scan of the ASG.
+    outgoing = get_instance_components(auto_scaling_group_name, instance_id, binding_store, inventory)
+    if not outgoing.get("eni_id") or not outgoing.get("ebs_id"):
+        return None
+    incoming = find_incoming_instance(binding_store, auto_scaling_group_name, outgoing, inventory)
+    if not incoming:
+        return None
+
+    item = plan_swap(outgoing, incoming, inventory)
+    logger.info(f"Moving ENI {item['AssignedENI']} and EBS {item['AssignedVolumeId']} from {instance_id} to {item['InstanceId']}.")
+
+    eni = inventory.eni(outgoing["eni_id"])
+    try:
+        with metrics.span("DetachAndWait"):
+            detach_instance_resources(
+                instance_id, outgoing["eni_id"], outgoing["ebs_id"], eni.get("attachment_id") if eni else None,
+                on_wait=on_wait or asg_lock.renew
+            )
+    finally:
+        inventory.invalidate()
 
-def read_asg_tags(asg_name):
-    client = boto3.client('autoscaling')
+    tag_batch = TagBatch()
     try:
-        response = client.describe_auto_scaling_groups(
-                AutoScalingGroupNames=[asg_name])
-        asg_details = response.get('AutoScalingGroups', [])
-        if not asg_details:
-            raise Exception(f"No Auto Scaling Group found with the name '{asg_name}'")
-        tags = asg_details[0].get('Tags', [])
-        return tags 
-    except Exception as e:
-        raise Exception(f"Error in reading tags of Autoscaling group. {e}")
+        with metrics.span("Attach"):
+            for resource_ids, tags in attach_instance_resources(item, auto_scaling_group_name):
+                tag_batch.add(resource_ids, tags)
+    except Exception:
+        # Leave the pair free and unbound; the provisioning run of the caller places it.
+        tag_batch.add([outgoing["eni_id"], outgoing["ebs_id"]], [
+            {'Key': 'Instance', 'Value': instance_id},
+            {'Key': 'Status', 'Value': 'available'}
+        ])
+        tag_batch.flush(get_client('ec2'))
+        binding_store.delete(auto_scaling_group_name, instance_id)
+        raise
+
+    asg_lock.ensure_held()
+    with metrics.span("TagFlush"):
+        tag_batch.flush(get_client('ec2'))
+    update_instance_binding(
+        auto_scaling_group_name, instance_id, item["InstanceId"], item["AssignedENI"], item["AssignedVolumeId"],
+        item["SubnetId"], item["availability_zone"], item["NodeSlot"], item["CouchbaseServerGroup"]
+    )
 
-def get_instance_components(instance_name, tags):
-    resources = {
-        "subnet_id": None,
-        "eni_id": None,
-        "ebs_id": None
+    return {
+        "statusCode": 200,
+        "body": f"Moved ENI {item['AssignedENI']} and EBS {item['AssignedVolumeId']} from {instance_id} to {item['InstanceId']}.",
+        "attached": [item["InstanceId"]],
+        "failed": []
     }
 
-    for tag in tags:
-        key = tag.get("Key")
-        value = tag.get("Value")
-        
-        if key == f"subnet_{instance_name}":
-            resources["subnet_id"] = value
-        elif key == f"eni_{instance_name}":
-            resources["eni_id"] = value
-        elif key == f"ebs_{instance_name}":
-            resources["ebs_id"] = value
-
-    return resources
-
-
-def get_subnets(auto_scaling_group_name, subnet_id):
-    networks = get_networkinterfaces(auto_scaling_group_name)
-    if not networks or len(networks) == 0:
-        return []
-    else:
-        return [eni for eni in networks if eni.get("subnet_id") == subnet_id]
-
-def lock_asg(asg_name):
-    initial_tag = [{ 
-        "Key" : "asg_lock",
-        "Value": "lock"
-    }]
+def release_instance_resources(auto_scaling_group_name, instance_id, inventory, binding_store=None, on_wait=None):
+    binding_store = binding_store or get_binding_store()
+    instance_resources = get_instance_components(auto_scaling_group_name, instance_id, binding_store, inventory)
 
+    eni = inventory.eni(instance_resources.get("eni_id")) if instance_resources.get("eni_id") else None
     try:
-        response = tag_asg(asg_name, initial_tag)
-        return True
-    except Exception as e:
-        raise Exception(f"Error unlocking autoscaling group.")
-
-def unlock_asg(asg_name):
-    initial_tag = [{ 
-        "Key" : "asg_lock",
-        "Value": "free"
-    }]
+        # Both are tagged available below only once the detach has finished.
+        with metrics.span("DetachAndWait"):
+            detach_instance_resources(
+                instance_id, instance_resources.get("eni_id"), instance_resources.get("ebs_id"),
+                eni.get("attachment_id") if eni else None, on_wait=on_wait
+            )
+    finally:
+        inventory.invalidate()
 
-    try:
-        response = tag_asg(asg_name, initial_tag)
-        return True
-    except Exception as e:
-        raise Exception(f"Error locking autoscaling group.")
+    tags_others = [
+        {
+            'Key': 'Instance',
+            'Value': instance_id
+        },
+        {
+            'Key': 'Status',
+            'Value': 'available'
+        }
+    ]
 
-def asg_status(asg_name):
-    fraction = random.uniform(0, 10)
-    time.sleep(fraction)
-    tags = read_asg_tags(asg_name)
-    logger.info(f"Current ASG tags: {tags}")
-    asg_status = "free"
-    for tag in tags:
-        if tag["Key"] == "asg_lock":
-            asg_status = tag.get("Value")
-            break
+    tag_batch = TagBatch()
+    tag_batch.add([instance_resources.get("eni_id"), instance_resources.get("ebs_id")], tags_others)
+    with metrics.span("TagFlush"):
+        tag_batch.flush(get_client('ec2'))
+    binding_store.delete(auto_scaling_group_name, instance_id)
+    return instance_resources
+
+def get_instance_components(auto_scaling_group_name, instance_id, binding_store, inventory):
+    binding = binding_store.get(auto_scaling_group_name, instance_id)
+    if binding is None:
+        # Bindings written before the store existed still live in ASG tags. They are imported
+        # once and the tags removed, so a binding released later is not imported again.
+        migrate_asg_tag_bindings(
+            binding_store, auto_scaling_group_name, inventory.asg_tags, inventory=inventory, delete_tags=True
+        )
+        binding = binding_store.get(auto_scaling_group_name, instance_id) or {}
 
-    logger.info(f"Current asg status: {asg_status}")
-    return asg_status
+    return {
+        "instance_id": instance_id,
+        "subnet_id": binding.get("subnet_id"),
+        "eni_id": binding.get("eni_id"),
+        "ebs_id": binding.get("ebs_id"),
+        "availability_zone": binding.get("availability_zone"),
+        "slot": binding.get("slot")
+    }
 
 
-def handle__new_provision(event):
+def handle__new_provision(event, inventory=None, asg_lock=None, lifecycle_action=None):
 
     lifecycle_event_Records = event.get('Records', {})    
     lifecycle_event_string = lifecycle_event_Records[0].get("Sns", {}).get("Message")
@@ -410,283 +567,316 @@ def handle__new_provision(event):
     lifecycle_transition = lifecycle_event.get('LifecycleTransition')
     lifecycle_event = lifecycle_event.get('Event')
     lifecycle_hook_name = lifecycle_event_copy.get('LifecycleHookName')
-    fraction = random.uniform(0, 10)
-    time.sleep(fraction)
-
-    while True:
-        fraction = random.uniform(0, 10)
-        asg_lock_status = asg_status(auto_scaling_group_name)
-        if asg_lock_status == "free":
-            lock_asg(auto_scaling_group_name)
-            break
-        else:
-            logger.info(f"Autoscaling group currently {auto_scaling_group_name} is currently locked. ")
-            time.sleep(2)
 
-    
-    time.sleep(30)
+    lifecycle_actions = None
+    if instance_id and lifecycle_action_token:
+        lifecycle_actions = {instance_id: lifecycle_action or LifecycleAction.from_message(lifecycle_event_copy)}
+
+    return provision_with_lock(
+        auto_scaling_group_name, [instance_id] if instance_id else None, lifecycle_transition, inventory, asg_lock,
+        lifecycle_actions
+    )
+
+
+def provision_with_lock(auto_scaling_group_name, instance_ids, lifecycle_transition, inventory=None, asg_lock=None,
+                        lifecycle_actions=None):
+    inventory = inventory or AsgInventory(auto_scaling_group_name)
+    if asg_lock is not None:
+        # The caller already holds the ASG lock (batch processing).
+        return provision_asg(auto_scaling_group_name, instance_ids, lifecycle_transition, asg_lock, inventory, lifecycle_actions)
+
+    asg_lock = AsgLock(auto_scaling_group_name)
+    try:
+        asg_lock.acquire(on_wait=lambda: heartbeat_all(lifecycle_actions))
+    except LockTimeout as e:
+        logger.error(f"Autoscaling group {auto_scaling_group_name} is still locked. {e}")
+        return {
+            "statusCode": 409,
+            "body": f"Autoscaling group {auto_scaling_group_name} is locked by another operation."
+        }
+
+    try:
+        return provision_asg(auto_scaling_group_name, instance_ids, lifecycle_transition, asg_lock, inventory, lifecycle_actions)
+    finally:
+        asg_lock.release()
+
+
+def provision_asg(auto_scaling_group_name, instance_ids, lifecycle_transition, asg_lock, inventory, lifecycle_actions=None):
+    # lifecycle_actions maps instance ids to their pending LifecycleAction. Launch hooks
+    # complete as soon as their instance has its devices and are abandoned on failure;
+    # all of them receive heartbeats during the waits.
     if not lifecycle_transition:
         logger.info("New cluster provisioning request started. ")
     else:
         logger.info("New Autoscale event processing started. ")
 
+    inventory.refresh_if_older_than(asg_lock.acquired_at)
+    workflow = ProvisionWorkflow(auto_scaling_group_name).load()
+
     logger.info(f"Autoscaling group name: {auto_scaling_group_name}")
-    interfaces = get_networkinterfaces(auto_scaling_group_name)
-    logger.info(f"Available Intarfaces: {interfaces}")
+    interfaces = inventory.available_enis()
+    logger.info("Available Intarfaces: %s", payload(interfaces))
     logger.info(f"Fetching the information of all EC2 instances created as part of Autoscaling group: {auto_scaling_group_name}")
 
-    instance_details = get_instances_in_asg(auto_scaling_group_name, instance_id, "available")
+    instance_details = inventory.instance_details(instance_ids, "available")
+
+    # Instances an earlier, interrupted run attached only need their tags and bindings;
+    # those it left with just the ENI still need their volume.
+    resumed = []
+    partial = []
+    for instance_id, item in workflow.checkpointed().items():
+        eni = inventory.eni_of_instance(instance_id)
+        volume = inventory.volume_of_instance(instance_id)
+        if not eni or eni["eni_id"] != item.get("AssignedENI"):
+            logger.warning(f"Checkpointed devices of {instance_id} are no longer attached to it.")
+            workflow.forget(instance_id)
+        elif workflow.is_done(instance_id, "attached") or (volume and volume["VolumeId"] == item.get("AssignedVolumeId")):
+            resumed.append(item)
+        else:
+            partial.append(item)
+    resumed_ids = {item["InstanceId"] for item in resumed + partial}
+    instance_details = [item for item in instance_details if item["InstanceId"] not in resumed_ids]
 
-    logger.info(f"Instance details are below: {instance_details}")
-    if not instance_details or len(instance_details) == 0:
+    logger.info("Instance details are below: %s", payload(instance_details))
+    if not instance_details and not resumed and not partial:
+        workflow.finish()
         return {
             "statusCode": 200,
-            "body": f"No instances found in Auto Scaling Group to be handled: {auto_scaling_group_name}"
+            "body": f"No instances found in Auto Scaling Group to be handled: {auto_scaling_group_name}",
+            "attached": [],
+            "failed": []
         }
 
-    ec2_subnet_mapping = map_ec2_subnet(interfaces, instance_details)
-    logger.info(f"Mapping of EC2 & Subnet: {ec2_subnet_mapping}")
-
-    ebs_data = get_ebs_volumes_with_tag("AsgName", auto_scaling_group_name)
-    logger.info(f"Available EBS volumes: {ebs_data}")
-
-    ec2_subnet_mapping = distribute_ebs_volumes_to_ec2(ec2_subnet_mapping, ebs_data)
-    logger.info(f"Final Data with EBS volume mapping: {ec2_subnet_mapping}")
+    failed = []
+    if instance_details and deadline_near():
+        for item in instance_details:
+            workflow.defer_if_deadline_near(item["InstanceId"])
+        instance_details = []
 
-    for item in ec2_subnet_mapping:
+    if instance_details:
         try:
-            eni_id = item.get("AssignedENI")
-            ec2_id = item.get("InstanceId")
-            subnet_id = item.get("SubnetId")
-            volume_id = item.get("AssignedVolumeId")
-            
-            logger.info(f"Attaching eni id {eni_id} to {ec2_id}")
-            
-            response = ec2_client.attach_network_interface(
-                    NetworkInterfaceId=eni_id,
-                    InstanceId=ec2_id,
-                    DeviceIndex=1
+            with metrics.span("WaitInstanceRunning"):
+                wait_for_instances_running(
+                    get_client('ec2'),
+                    [item["InstanceId"] for item in instance_details],
+                    on_wait=keep_alive(asg_lock, lifecycle_actions)
                 )
-            logger.info(f"Successfully attached {eni_id} to {ec2_id}.")
-
-            response = attach_ebs_volumes_to_ec2(ec2_id, volume_id)
-
-            tags = [
-                {
-                    'Key': 'Subnet',
-                    'Value': subnet_id
-                },
-                {
-                    'Key': 'NetworkInterfaceId',
-                    'Value': eni_id
-                },
-                {
-                    'Key': 'Status',
-                    'Value': 'in-use'
-                },
-                {
-                    'Key': 'AsgName',
-                    'Value': auto_scaling_group_name
-                },
-                {
-                    'Key': 'SubnetAttachStatus',
-                    'Value': 'Attached'
-                },
-            ]
-
-            tags_others = [
-                {
-                    'Key': 'Instance',
-                    'Value': ec2_id
-                },
-                {
-                    'Key': 'AsgName',
-                    'Value': auto_scaling_group_name
-                },
-                {
-                    'Key': 'Status',
-                    'Value': 'in-use'
+        except ReadinessTimeout as e:
+            logger.error(f"{e}")
+            for item in instance_details:
+                complete_pending(lifecycle_actions, item["InstanceId"], "ABANDON", f"{e}")
+            if not resumed and not partial:
+                workflow.finish()
+                return {
+                    "statusCode": 500,
+                    "body": f"{e}",
+                    "attached": [],
+                    "failed": [{"InstanceId": item["InstanceId"], "error": f"{e}"} for item in instance_details]
                 }
-            ]
+            failed.extend({"InstanceId": item["InstanceId"], "error": f"{e}"} for item in instance_details)
+            instance_details = []
 
-            tag_eni(eni_id, tags_others)
-            tag_ebs(volume_id, tags_others)
+    ec2_subnet_mapping = []
+    if instance_details:
+        ebs_data = inventory.available_volumes()
+        logger.info("Available EBS volumes: %s", payload(ebs_data))
 
-            logger.info(f"Adding network interface tags {tags}")
+        with metrics.span("PlanAssignments"):
+            ec2_subnet_mapping, unassignable = plan_assignments(instance_details, interfaces, ebs_data)
+        logger.info("Final Data with ENI & EBS volume mapping: %s", payload(ec2_subnet_mapping))
 
-            final_tag_ec2s(ec2_id, tags)
+        for item in unassignable:
+            logger.error(f"Cannot attach devices to {item['InstanceId']}. {item['reason']}")
+            failed.append({"InstanceId": item["InstanceId"], "error": item["reason"]})
+            complete_pending(lifecycle_actions, item["InstanceId"], "ABANDON", item["reason"])
 
-            logger.info(f"Successfully added network interface tags. ")
+    def attach(item):
+        if workflow.defer_if_deadline_near(item["InstanceId"]):
+            return None
+        value = attach_instance_resources(
+            item, auto_scaling_group_name,
+            on_eni_attached=lambda: workflow.mark([item], "eni_attached"),
+            eni_attached=workflow.is_done(item["InstanceId"], "eni_attached")
+        )
+        workflow.mark([item], "attached")
+        # The instance has its devices; it need not wait in Pending:Wait for the rest of the batch.
+        complete_pending(lifecycle_actions, item["InstanceId"])
+        workflow.mark([item], "completed")
+        return value
+
+    with metrics.span("Attach"):
+        results = run_batch(partial + ec2_subnet_mapping, attach)
+    inventory.invalidate()
+
+    tag_batch = TagBatch()
+    attached = []
+    for item in resumed:
+        for resource_ids, tags in instance_resource_tags(item, auto_scaling_group_name):
+            tag_batch.add(resource_ids, tags)
+        if not workflow.is_done(item["InstanceId"], "completed"):
+            complete_pending(lifecycle_actions, item["InstanceId"])
+            workflow.mark([item], "completed")
+        attached.append(item)
+    for result in results:
+        if result["item"].get("InstanceId") in workflow.deferred:
+            continue
+        if result["ok"]:
+            for resource_ids, tags in result["value"]:
+                tag_batch.add(resource_ids, tags)
+            attached.append(result["item"])
+        else:
+            logger.error(f"Error in attaching devices to {result['item'].get('InstanceId')}. {result['error']}")
+            failed.append({"InstanceId": result["item"].get("InstanceId"), "error": result["error"]})
+            complete_pending(lifecycle_actions, result["item"].get("InstanceId"), "ABANDON", result["error"])
 
-        except Exception as e:
-            logger.error(f"Error in attaching interface {eni_id} to {ec2_id}. {e}")
-            return {
-                    "statusCode": 400,
-                    "body": f"Error in attaching interface {eni_id} to {ec2_id}. {e}"
-                }
     try:
-        response = add_final_tags(auto_scaling_group_name, ec2_subnet_mapping)
+        asg_lock.ensure_held()
+        with metrics.span("TagFlush"):
+            response = tag_batch.flush(get_client('ec2'))
+        workflow.mark(attached, "tagged")
+        with metrics.span("SaveBindings"):
+            save_instance_bindings(auto_scaling_group_name, attached)
+        workflow.mark(attached, "bound")
     except Exception as e:
+        # The checkpoint keeps these instances; the next run records them again.
         return {
                 "statusCode": 400,
-                "body": f"Failed to add final tags to autoscaling group. {e}"
+                "body": f"Failed to record attached devices. {e}",
+                "attached": [],
+                "failed": failed + [{"InstanceId": item.get("InstanceId"), "error": f"{e}"} for item in attached]
             }
-    
-    # if lifecycle_hook_name and auto_scaling_group_name and lifecycle_action_token:
-    #     complete_lifecycle_action(auto_scaling_group_name, lifecycle_hook_name, lifecycle_action_token)
-    
-    unlock_asg(auto_scaling_group_name)
+    workflow.finish()
+
+    attached_ids = [item.get("InstanceId") for item in attached]
+    if workflow.deferred:
+        deferred = sorted(workflow.deferred)
+        # The hooks of deferred instances have to outlast the redelivery of the event.
+        for instance_id in deferred:
+            if lifecycle_actions and instance_id in lifecycle_actions:
+                lifecycle_actions[instance_id].heartbeat(force=True)
+        return {
+            "statusCode": 503,
+            "body": f"Attached devices to {len(attached)} instance(s); {len(deferred)} deferred to the next invocation "
+                    f"as the Lambda deadline is near, failed for {len(failed)}: {failed}",
+            "attached": attached_ids,
+            "failed": failed,
+            "deferred": deferred
+        }
+
+    if failed:
+        return {
+            "statusCode": 400,
+            "body": f"Attached devices to {len(attached)} instance(s), failed for {len(failed)}: {failed}",
+            "attached": attached_ids,
+            "failed": failed
+        }
+
     return {
         "statusCode": 200,
-        "body": "Successfully attached all devices."
+        "body": "Successfully attached all devices.",
+        "attached": attached_ids,
+        "failed": []
      }
 
-def add_final_tags(auto_scaling_group_name, ec2_subnet_mapping):
-    logger.info("Adding final tags to Auto scaling group.")
-    asg_tags = []
-    
-    for item in ec2_subnet_mapping:
-        instance_id = item.get("InstanceId")
-        subnet_id = item.get("SubnetId")
-        eni_id = item.get("AssignedENI")
-        ebs_id = item.get("AssignedVolumeId")
-        
-        asg_tags.append ({
-                'Key': f'subnet_{instance_id}', 
-                'Value': subnet_id
-            })
-
-        asg_tags.append ({
-                'Key': f'eni_{instance_id}', 
-                'Value': eni_id
-            })
-
-        asg_tags.append ({
-                'Key': f'ebs_{instance_id}', 
-                'Value': ebs_id
-            })
-        
-        asg_tags.append(
-            { 
-            "Key" : "asg_lock",
-            "Value": "unlocked"
-        })
-        
-    try:
-        response = tag_asg(auto_scaling_group_name, asg_tags)
-        return response
-    except Exception as e:
-        raise Exception(f"Error  in tagging Autoscaling group with final tags {e}")
+def attach_instance_resources(item, auto_scaling_group_name, on_eni_attached=None, eni_attached=False):
+    # on_eni_attached runs between the two attach calls; eni_attached skips the ENI of a
+    # resumed instance that already has it.
+    eni_id = item.get("AssignedENI")
+    ec2_id = item.get("InstanceId")
+    subnet_id = item.get("SubnetId")
+    volume_id = item.get("AssignedVolumeId")
 
-def tag_eni(id, tags):
-    try:
-        response = ec2_client.create_tags(Resources=[id], Tags=tags)
-        logger.info(f"Successfully tagged. ENI {id} with tags {tags}")
-        return response
-    except Exception as e:
-        logger.error(f"Error in tagging ENI with id {id} with tags {tags}")
-        raise Exception(f"Error in tagging ENI with id {id} with tags {tags}")
+    if not eni_id or not volume_id:
+        raise Exception(f"No available ENI or EBS volume for {ec2_id} in {item.get('availability_zone')}.")
 
-def tag_ebs(id, tags):
-    try:
-        response = ec2_client.create_tags(Resources=[id], Tags=tags)
-        logger.info(f"Successfully tagged. EBS {id} with tags {tags}")
-        return response
-    except Exception as e:
-        logger.error(f"Error in tagging EBS with id {id} with tags {tags}")
-        raise Exception(f"Error in tagging EBS with id {id} with tags {tags}")
+    if not eni_attached:
+        logger.info(f"Attaching eni id {eni_id} to {ec2_id}")
 
-def final_tag_ec2s(instance_id, tags):
-    try:
-        response = ec2_client.create_tags(
-            Resources=[instance_id],
-            Tags=tags
-         )
-        
-        return response
+        response = get_client('ec2').attach_network_interface(
+                NetworkInterfaceId=eni_id,
+                InstanceId=ec2_id,
+                DeviceIndex=1
+            )
+        logger.info(f"Successfully attached {eni_id} to {ec2_id}.")
+        if on_eni_attached:
+            on_eni_attached()
 
-    except Exception as e:
-        raise Exception(f"Exception during tagging. {tags}")
+    response = attach_ebs_volumes_to_ec2(ec2_id, volume_id)
+    return instance_resource_tags(item, auto_scaling_group_name)
 
 
-def get_networkinterfaces(ags_name):
-    
-    filters = [
-            {
-                'Name': 'tag:AutoscaleGroup',  
-                'Values': [ags_name]      
-            },
-            {
-                'Name': 'status',         
-                'Values': ["available"]        
-            }
-        ]    
-    logger.info(f"filters: {filters}")
-    response = ec2_client.describe_network_interfaces(Filters=filters)
-    logger.info(f"All interfaces:{response}")
-    network_interfaces = response['NetworkInterfaces']
-
-    eni_details = []
-    for eni in network_interfaces:
-        eni_id = eni['NetworkInterfaceId']
-        subnet_id = eni['SubnetId']
-        vpc_id = eni['VpcId']
-        status = eni['Status']
-        az = eni['AvailabilityZone']
-        
-        attachment_details = None
-        private_ips = []
-        if 'Attachment' in eni:
-            attachment_details = eni['Attachment']
-            instance_id = attachment_details['InstanceId']
-            private_ips = [ip['PrivateIpAddress'] for ip in eni.get('PrivateIpAddresses', [])]
-        else:
-            instance_id = None  
-            private_ips = [ip['PrivateIpAddress'] for ip in eni.get('PrivateIpAddresses', [])]
-        
-        eni_details.append({
-            'eni_id': eni_id,
-            'subnet_id': subnet_id,
-            'vpc_id': vpc_id,
-            'status': status,
-            'availability_zone': az,
-            'instance_id': instance_id,
-            'private_ips': private_ips
-        })
-    
-    return eni_details
+def instance_resource_tags(item, auto_scaling_group_name):
+    # (resource ids, tags) pairs marking the devices of an attached instance as in use.
+    eni_id = item.get("AssignedENI")
+    ec2_id = item.get("InstanceId")
+    subnet_id = item.get("SubnetId")
+    volume_id = item.get("AssignedVolumeId")
 
+    tags = [
+        {
+            'Key': 'Subnet',
+            'Value': subnet_id
+        },
+        {
+            'Key': 'NetworkInterfaceId',
+            'Value': eni_id
+        },
+        {
+            'Key': 'Status',
+            'Value': 'in-use'
+        },
+        {
+            'Key': 'AsgName',
+            'Value': auto_scaling_group_name
+        },
+        {
+            'Key': 'SubnetAttachStatus',
+            'Value': 'Attached'
+        },
+    ]
 
-    
-def get_instances_in_asg(asg_name, instance_identifier, instance_status="available"):
+    tags_others = [
+        {
+            'Key': 'Instance',
+            'Value': ec2_id
+        },
+        {
+            'Key': 'AsgName',
+            'Value': auto_scaling_group_name
+        },
+        {
+            'Key': 'Status',
+            'Value': 'in-use'
+        }
+    ]
 
-    instance_ids = []
-    logger.info(f"Incoming instance: {instance_identifier}")
-    if instance_identifier:
-        instance_ids.append(instance_identifier)
-    else:
+    if item.get("NodeSlot"):
+        # The volume remembers its slot so a replacement of this node receives the same pair.
+        tags.append({'Key': 'NodeSlot', 'Value': item.get("NodeSlot")})
+        tags.append({'Key': 'CouchbaseServerGroup', 'Value': item.get("CouchbaseServerGroup")})
+        tags_others.append({'Key': 'NodeSlot', 'Value': item.get("NodeSlot")})
+
+    return [([eni_id, volume_id], tags_others), (ec2_id, tags)]
+
+def save_instance_bindings(auto_scaling_group_name, ec2_subnet_mapping):
+    logger.info("Recording instance bindings of Auto scaling group.")
+    binding_store = get_binding_store()
+
+    for item in ec2_subnet_mapping:
         try:
-            response = autoscaling_client.describe_auto_scaling_groups(
-                AutoScalingGroupNames=[asg_name]
-            )
-            logger.info(f"Response of Autoscaling group: {response}")
-            instance_ids = []
-            for asg in response.get("AutoScalingGroups", []):
-                for instance in asg.get("Instances", []):
-                    if instance.get("LifecycleState") == "InService":
-                        instance_ids.append(instance["InstanceId"])
-        
-            logger.info(f"Instance ids are: {instance_ids}")
-            instance_details = get_instance_details(instance_ids, instance_status)
-        
-            return instance_details
+            binding_store.put(make_binding(
+                auto_scaling_group_name,
+                item.get("InstanceId"),
+                eni_id=item.get("AssignedENI"),
+                ebs_id=item.get("AssignedVolumeId"),
+                subnet_id=item.get("SubnetId"),
+                availability_zone=item.get("availability_zone"),
+                slot=item.get("NodeSlot"),
+                server_group=item.get("CouchbaseServerGroup")
+            ))
         except Exception as e:
-            print(f"Error fetching instances for ASG {asg_name}: {e}")
-            return []
-    
-    instance_details = get_instance_details(instance_ids, instance_status)
+            raise Exception(f"Error in recording bindings of instance {item.get('InstanceId')}. {e}")
 
-    return instance_details
 
 def filter_tags(tags, filter):
     tag_list = []
@@ -711,132 +901,10 @@ def filter_tags(tags, filter):
             return False
                 
         
-def get_instance_details(instance_ids, instance_status):
-    try:
-        filter= {
-                'Name': 'Status',
-                'Value': instance_status
-            }
-        response = ec2_client.describe_instances(
-            InstanceIds=instance_ids )
-            
-        logger.info(f"Response of read instance: {response}")
-        instance_details = []
-        for reservation in response.get("Reservations", []):
-            for instance in reservation.get("Instances", []):
-                tags = instance.get("Tags")
-                logger.info(f"Available tags of EC2: {tags}")
-                logger.info(f"Filters: {filter}")
-                if not filter_tags(tags, filter):
-                    continue
-                else:
-                    network_interfaces = []
-                    for eni in instance.get("NetworkInterfaces", []):
-                        network_interfaces.append({
-                            "NetworkInterfaceId": eni["NetworkInterfaceId"],
-                            "PrivateIpAddress": eni.get("PrivateIpAddress"),
-                            "Status": eni.get("Status")
-                        })
-                    instance_details.append({
-                        "InstanceId": instance["InstanceId"],
-                        "SubnetId": instance["SubnetId"],
-                        "AvailabilityZone": instance["Placement"]["AvailabilityZone"],
-                        "NetworkInterfaces": network_interfaces
-                    })
-        return instance_details
-    except Exception as e:
-        print(f"Error fetching details for instances: {e}")
-        return []
-
-
-
-def map_ec2_subnet(subnet_data, ec2_data):
-
-    subnet_to_eni_map = defaultdict(list)
-    for eni in subnet_data:
-        if eni["status"] == "available":  
-            subnet_to_eni_map[eni["subnet_id"]].append(eni)
-
-    ec2_eni_mapping = []
-
-    for ec2 in ec2_data:
-        subnet_id = ec2["SubnetId"]
-        if subnet_id in subnet_to_eni_map and subnet_to_eni_map[subnet_id]:
-            assigned_eni = subnet_to_eni_map[subnet_id].pop(0)
-            ec2_eni_mapping.append({
-                "InstanceId": ec2["InstanceId"],
-                "SubnetId": subnet_id,
-                "AssignedENI": assigned_eni["eni_id"],
-                "availability_zone": ec2["AvailabilityZone"]
-            })
-        else:
-            ec2_eni_mapping.append({
-                "InstanceId": ec2["InstanceId"],
-                "SubnetId": subnet_id,
-                "AssignedENI": None,
-                "availability_zone": ec2["AvailabilityZone"]
-            })
-
-    
-    return ec2_eni_mapping
-
-def get_ebs_volumes_with_tag(tag_key, tag_value):
-    try:
-        response = ec2_client.describe_volumes(
-            Filters=[
-                {
-                    'Name': 'tag:' + tag_key,
-                    'Values': [tag_value]
-                },
-                {
-                    'Name': 'tag:Status',
-                    'Values': ['available']
-                }
-            ]
-        )
-        volumes = response.get('Volumes', [])
-        
-        volume_details = []
-        for volume in volumes:
-            volume_id = volume.get('VolumeId')
-            availability_zone = volume.get('AvailabilityZone')
-            
-            volume_details.append({
-                'VolumeId': volume_id,
-                'AvailabilityZone': availability_zone
-            })
-        
-        return volume_details
-    
-    except Exception as e:
-        logger.error(f"Error fetching EBS volumes with tag {tag_key}:{tag_value}. {e}")
-        return []
-
-def distribute_ebs_volumes_to_ec2(ec2_subnet_mapping, ebs_volumes):
-    volumes_by_az = defaultdict(list)
-    for volume in ebs_volumes:
-        az = volume.get('AvailabilityZone')
-        volume_id = volume.get('VolumeId')
-        volumes_by_az[az].append(volume_id)
-    
-    for ec2_instance in ec2_subnet_mapping:
-        instance_id = ec2_instance.get("InstanceId")
-        az = ec2_instance.get("availability_zone")
-        
-        if az in volumes_by_az and volumes_by_az[az]:
-            volume_id = volumes_by_az[az].pop(0)  
-            ec2_instance["AssignedVolumeId"] = volume_id 
-            logger.info(f"Successfully assigned EBS volume {volume_id} to EC2 instance {instance_id} in AZ {az}.")
-        else:
-            ec2_instance["AssignedVolumeId"] = None  
-            logger.warning(f"No available EBS volume for EC2 instance {instance_id} in AZ {az}.")
-    
-    return ec2_subnet_mapping
-
 def attach_ebs_volumes_to_ec2(instance_id, volume_id):
     try:
         logger.info(f"Attaching volume {volume_id} to instance {instance_id}.")
-        response = ec2_client.attach_volume(
+        response = get_client('ec2').attach_volume(
             VolumeId=volume_id,
             InstanceId=instance_id,
             Device='/dev/xvdf'
@@ -846,25 +914,3 @@ def attach_ebs_volumes_to_ec2(instance_id, volume_id):
         return response
     except Exception as e:
         raise Exception(f"Failed to attach volume {volume_id} to instance {instance_id}. Error: {e}")
-        
-def tag_asg(asg_name, tags):
-    logger.info(f"adding tags {tags} to {asg_name}")
-    autoscaling_client = boto3.client('autoscaling')
-    formatted_tags = [
-        {
-            'ResourceId': asg_name,
-            'ResourceType': 'auto-scaling-group',
-            'Key': tag['Key'],
-            'Value': tag['Value'],
-            'PropagateAtLaunch': tag.get('PropagateAtLaunch', True)
-        }
-        for tag in tags
-     ]
-    
-    try:
-        autoscaling_client.create_or_update_tags(Tags=formatted_tags)
-        print(f"Tags successfully added to Auto Scaling group {asg_name}.")
-    except Exception as e:
-        raise Exception(f"Error adding tags to Auto Scaling group {asg_name}. {e}")
-
- 
@@ -0,0 +1,188 @@
+import heapq
+import logging
+import os
+from collections import defaultdict, deque
+
+logger = logging.getLogger()
+
+# Order in which free volumes of an AZ are handed out: "fifo", "largest" or "smallest".
+VOLUME_ORDER = os.environ.get("ASSIGN_VOLUME_ORDER", "fifo")
+PREFER_PREVIOUS_OWNER = os.environ.get("ASSIGN_PREFER_PREVIOUS_OWNER", "true").lower() == "true"
+# Hand a replacement the exact ENI and volume of the node slot it replaces.
+STICKY_SLOTS = os.environ.get("STICKY_SLOTS", "true").lower() == "true"
+
+# A node slot is named after its ENI's UniqueTag (data_N, see cluster1.tf); the
+# volume of the slot carries the same name in its NodeSlot tag.
+ENI_SLOT_TAG = "UniqueTag"
+VOLUME_SLOT_TAG = "NodeSlot"
+
+VOLUME_PRIORITIES = {
+    "largest": lambda volume: -(volume.get("Size") or 0),
+    "smallest": lambda volume: volume.get("Size") or 0,
+}
+
+
+class ResourcePool:
+    """Free resources of one placement (a subnet or an AZ). Without a priority the pool
+    is first in, first out; with one it is a heap. take() can also claim a specific
+    resource, which is skipped lazily when it surfaces later."""
+
+    def __init__(self, priority=None):
+        self.priority = priority
+        self._queue = [] if priority else deque()
+        self._members = set()
+        self._taken = set()
+
+    def __len__(self):
+        return len(self._members) - len(self._taken)
+
+    def is_free(self, resource_id):
+        return resource_id in self._members and resource_id not in self._taken
+
+    def push(self, resource_id, record=None):
+        if resource_id in self._members:
+            return
+        self._members.add(resource_id)
+        if self.priority:
+            heapq.heappush(self._queue, (self.priority(record or {}), len(self._members), resource_id))
+        else:
+            self._queue.append(resource_id)
+
+    def _pop(self):
+        return heapq.heappop(self._queue)[-1] if self.priority else self._queue.popleft()
+
+    def take(self, preferred_id=None):
+        if preferred_id in self._members and preferred_id not in self._taken:
+            self._taken.add(preferred_id)
+            return preferred_id
+        while self._queue:
+            resource_id = self._pop()
+            if resource_id not in self._taken:
+                self._taken.add(resource_id)
+                return resource_id
+        return None
+
+
+def server_group_of(availability_zone):
+    # couchbase.sh puts every node into the server group "CB" + the AZ letter (CB_GROUPS).
+    return f"CB{availability_zone[-1]}" if availability_zone else None
+
+
+def _previous_owner(tags):
+    # Released ENIs and volumes keep an Instance tag naming the node they belonged to.
+    return (tags or {}).get("Instance")
+
+
+def plan_assignments(instances, enis, volumes, volume_order=VOLUME_ORDER, prefer_previous_owner=PREFER_PREVIOUS_OWNER,
+                     sticky_slots=STICKY_SLOTS):
+    """Matches every instance to an (ENI, volume) pair: an available ENI in the
+    instance's subnet and an available volume in its AZ. Resources are only taken
+    when both halves of the pair exist, so an instance never ends up with one of
+    them. With sticky_slots, the ENI and volume of a vacated node slot go out
+    together, and free pairs are only split once no loose resource is left.
+    Returns (assignments, unassignable), both in the order of `instances`."""
+    enis = [eni for eni in enis if eni.get("status", "available") == "available"]
+    slot_volumes = {}
+    if sticky_slots:
+        for volume in volumes:
+            slot = (volume.get("Tags") or {}).get(VOLUME_SLOT_TAG)
+            if slot:
+                slot_volumes[slot] = volume
+    slot_pairs = {}
+    for eni in enis:
+        slot = (eni.get("tags") or {}).get(ENI_SLOT_TAG)
+        volume = slot_volumes.get(slot)
+        if volume and volume["AvailabilityZone"] == eni["availability_zone"]:
+            slot_pairs[slot] = (eni["eni_id"], volume["VolumeId"])
+    paired = {resource_id for pair in slot_pairs.values() for resource_id in pair}
+
+    volume_priority = VOLUME_PRIORITIES.get(volume_order)
+    if paired:
+        eni_pools = defaultdict(lambda: ResourcePool(lambda eni: eni["eni_id"] in paired))
+        volume_pools = defaultdict(lambda: ResourcePool(
+            lambda volume: (volume["VolumeId"] in paired, volume_priority(volume) if volume_priority else 0)
+        ))
+    else:
+        eni_pools = defaultdict(ResourcePool)
+        volume_pools = defaultdict(lambda: ResourcePool(volume_priority))
+    slot_pools = defaultdict(deque)
+    eni_owners = {}
+    volume_owners = {}
+
+    for eni in enis:
+        eni_pools[eni["subnet_id"]].push(eni["eni_id"], eni)
+        slot = (eni.get("tags") or {}).get(ENI_SLOT_TAG)
+        if slot in slot_pairs:
+            slot_pools[eni["subnet_id"]].append(slot)
+        owner = _previous_owner(eni.get("tags"))
+        if owner:
+            eni_owners[owner] = eni["eni_id"]
+
+    for volume in volumes:
+        volume_pools[volume["AvailabilityZone"]].push(volume["VolumeId"], volume)
+        owner = _previous_owner(volume.get("Tags"))
+        if owner:
+            volume_owners[owner] = volume["VolumeId"]
+
+    eni_slots = {eni["eni_id"]: (eni.get("tags") or {}).get(ENI_SLOT_TAG) for eni in enis}
+
+    def take_slot(subnet_id, eni_pool, volume_pool):
+        slots = slot_pools.get(subnet_id)
+        while slots:
+            eni_id, volume_id = slot_pairs[slots.popleft()]
+            if eni_pool.is_free(eni_id) and volume_pool.is_free(volume_id):
+                return eni_pool.take(eni_id), volume_pool.take(volume_id)
+        return None, None
+
+    # Instances with a previous claim go first so nobody else takes their resources.
+    order = sorted(
+        range(len(instances)),
+        key=lambda index: not (prefer_previous_owner and (
+            instances[index]["InstanceId"] in eni_owners or instances[index]["InstanceId"] in volume_owners
+        ))
+    )
+
+    planned = {}
+    for index in order:
+        instance = instances[index]
+        instance_id = instance["InstanceId"]
+        subnet_id = instance.get("SubnetId")
+        availability_zone = instance.get("AvailabilityZone")
+        eni_pool = eni_pools.get(subnet_id)
+        volume_pool = volume_pools.get(availability_zone)
+
+        item = {
+            "InstanceId": instance_id,
+            "SubnetId": subnet_id,
+            "AssignedENI": None,
+            "AssignedVolumeId": None,
+            "availability_zone": availability_zone,
+        }
+        if not eni_pool:
+            item["reason"] = f"No available ENI in subnet {subnet_id}."
+        elif not volume_pool:
+            item["reason"] = f"No available EBS volume in {availability_zone}."
+        else:
+            eni_id = volume_id = None
+            if prefer_previous_owner:
+                eni_id = eni_pool.take(eni_owners.get(instance_id)) if eni_pool.is_free(eni_owners.get(instance_id)) else None
+                volume_id = volume_pool.take(volume_owners.get(instance_id)) if volume_pool.is_free(volume_owners.get(instance_id)) else None
+            if sticky_slots and not eni_id and not volume_id:
+                eni_id, volume_id = take_slot(subnet_id, eni_pool, volume_pool)
+            item["AssignedENI"] = eni_id or eni_pool.take()
+            item["AssignedVolumeId"] = volume_id or volume_pool.take()
+            item["NodeSlot"] = eni_slots.get(item["AssignedENI"])
+            item["CouchbaseServerGroup"] = server_group_of(availability_zone)
+        planned[index] = item
+
+    assignments = []
+    unassignable = []
+    for index in range(len(instances)):
+        item = planned[index]
+        if item.get("reason"):
+            unassignable.append(item)
+        else:
+            assignments.append(item)
+
+    logger.info(f"Planned {len(assignments)} assignment(s), {len(unassignable)} instance(s) cannot be assigned.")
+    return assignments, unassignable
@@ -0,0 +1,125 @@
+"""asyncio execution mode (EXECUTION_MODE=asyncio).
+
+The handlers stay synchronous; their fan-out points (inventory load, attach batches,
+detaches, tag flushes and lifecycle completions) hand coroutines to one event loop
+running next to them, and every AWS call of those coroutines runs through
+asyncio.to_thread under a single semaphore of ASYNC_CONCURRENCY slots. boto3 has no
+async client, so the calls still block a worker thread each; what the loop adds is
+that all network waits of one invocation overlap under one bound instead of each
+fan-out point sizing its own pool.
+
+The loop is started on first use and kept for the life of the execution
+environment, like the cached clients. asyncio itself is imported on first use, so
+the default threads mode does not pay for it at cold start.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "threads")
+ASYNC_CONCURRENCY = int(os.environ.get("ASYNC_CONCURRENCY", "16"))
+
+
+class AsyncRunner:
+
+    def __init__(self, concurrency=ASYNC_CONCURRENCY):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="asg-async"))
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.thread = threading.Thread(target=self.loop.run_forever, name="asg-event-loop", daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        # Blocks the calling (handler) thread until the coroutine finishes on the loop.
+        if threading.current_thread() is self.thread:
+            raise Exception("AsyncRunner.run() cannot wait on its own event loop.")
+        import asyncio
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def call(self, function, *args, **kwargs):
+        import asyncio
+
+        async with self.semaphore:
+            return await asyncio.to_thread(function, *args, **kwargs)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def runner():
+    # The shared runner in asyncio mode, None in the default threads mode.
+    global _runner
+    if EXECUTION_MODE != "asyncio":
+        return None
+    with _runner_lock:
+        if _runner is None:
+            _runner = AsyncRunner(ASYNC_CONCURRENCY)
+            logger.info(f"Started the asyncio runner with {ASYNC_CONCURRENCY} slot(s).")
+        return _runner
+
+
+async def load_inventory(runner, inventory):
+    import asyncio
+
+    asg, instances, enis, volumes = await asyncio.gather(
+        runner.call(inventory._read_asg),
+        runner.call(inventory._read_instances),
+        runner.call(inventory._read_enis),
+        runner.call(inventory._read_volumes),
+    )
+    return asg, instances, enis, volumes
+
+
+async def run_batch(runner, items, worker, per_az_limit, az_key):
+    # Same results as attach_pipeline.run_batch: one dict per item, in input order.
+    import asyncio
+
+    az_slots = {}
+    for item in items:
+        az_slots.setdefault(az_key(item), asyncio.Semaphore(per_az_limit))
+
+    async def run(item):
+        started = time.monotonic()
+        async with az_slots[az_key(item)]:
+            try:
+                value = await runner.call(worker, item)
+                return {"item": item, "ok": True, "value": value, "error": None,
+                        "duration": time.monotonic() - started}
+            except Exception as e:
+                return {"item": item, "ok": False, "value": None, "error": f"{e}",
+                        "duration": time.monotonic() - started}
+
+    return list(await asyncio.gather(*(run(item) for item in items)))
+
+
+async def gather_calls(runner, calls):
+    # `calls` are (function, args) pairs; returns (value, error) pairs in the same order.
+    import asyncio
+
+    async def run(function, args):
+        try:
+            return await runner.call(function, *args), None
+        except Exception as e:
+            return None, e
+
+    return list(await asyncio.gather(*(run(function, args) for function, args in calls)))
+
+
+async def flush_tags(runner, requests, ec2_client):
+    calls = [(lambda resources, tags: ec2_client.create_tags(Resources=resources, Tags=tags), request)
+             for request in requests]
+    return await gather_calls(runner, calls)
+
+
+async def complete_actions(runner, actions, result="CONTINUE", reason=None):
+    outcomes = await gather_calls(runner, [(action.complete, (result, reason)) for action in actions])
+    return [value for value, _ in outcomes]
@@ -0,0 +1,50 @@
+import logging
+import os
+import threading
+import time
+
+import async_operations
+
+logger = logging.getLogger()
+
+MAX_CONCURRENCY = int(os.environ.get("ATTACH_CONCURRENCY", "8"))
+MAX_CONCURRENCY_PER_AZ = int(os.environ.get("ATTACH_CONCURRENCY_PER_AZ", "4"))
+
+
+def run_batch(items, worker, max_workers=MAX_CONCURRENCY, per_az_limit=MAX_CONCURRENCY_PER_AZ,
+              az_key=lambda item: item.get("availability_zone")):
+    # Runs `worker(item)` for every item on a bounded thread pool. A failing item does
+    # not stop the others; results come back in input order.
+    if not items:
+        return []
+
+    runner = async_operations.runner()
+    if runner:
+        # The runner's semaphore bounds the calls instead of max_workers.
+        results = runner.run(async_operations.run_batch(runner, items, worker, per_az_limit, az_key))
+        failed = [result for result in results if not result["ok"]]
+        logger.info(f"Processed {len(results)} item(s) with {len(failed)} failure(s) on the event loop.")
+        return results
+
+    # Imported here so handler paths that never attach do not pay for it at cold start.
+    from concurrent.futures import ThreadPoolExecutor
+
+    az_slots = {az_key(item): threading.BoundedSemaphore(per_az_limit) for item in items}
+
+    def run(item):
+        started = time.monotonic()
+        with az_slots[az_key(item)]:
+            try:
+                value = worker(item)
+                return {"item": item, "ok": True, "value": value, "error": None,
+                        "duration": time.monotonic() - started}
+            except Exception as e:
+                return {"item": item, "ok": False, "value": None, "error": f"{e}",
+                        "duration": time.monotonic() - started}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        results = list(pool.map(run, items))
+
+    failed = [result for result in results if not result["ok"]]
+    logger.info(f"Processed {len(results)} item(s) with {len(failed)} failure(s).")
+    return results
@@ -0,0 +1,88 @@
+import os
+import threading
+
+from api_accounting import API_ACCOUNTING_ENABLED, accounting
+from async_operations import ASYNC_CONCURRENCY
+from attach_pipeline import MAX_CONCURRENCY
+from rate_limiter import RATE_LIMITER_ENABLED, rate_limiter
+
+# Every attach worker (or asyncio slot) holds at most one connection at a time; keep a
+# little headroom for the describe and tagging calls made from the main thread.
+MAX_POOL_CONNECTIONS = int(os.environ.get(
+    "AWS_MAX_POOL_CONNECTIONS", str(max(10, max(MAX_CONCURRENCY, ASYNC_CONCURRENCY) + 4))
+))
+MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", "8"))
+CONNECT_TIMEOUT_SECONDS = 5
+READ_TIMEOUT_SECONDS = 30
+
+_clients = {}
+_session = None
+_lock = threading.Lock()
+# Called with every newly created client; aws_simulator uses this to take over the calls.
+_client_hooks = []
+
+
+def _client_config():
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=CONNECT_TIMEOUT_SECONDS,
+        read_timeout=READ_TIMEOUT_SECONDS,
+        retries={"mode": "adaptive", "max_attempts": MAX_ATTEMPTS},
+    )
+
+
+def get_client(service, region=None):
+    # Clients are created on first use and shared for the lifetime of the process,
+    # so warm invocations reuse resolved endpoints and open connections.
+    global _session
+
+    key = (service, region)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+            client = _session.client(service, region_name=region, config=_client_config())
+            if RATE_LIMITER_ENABLED:
+                rate_limiter.install(client)
+            if API_ACCOUNTING_ENABLED:
+                accounting.install(client)
+            for hook in _client_hooks:
+                hook(client)
+            _clients[key] = client
+    return client
+
+
+def reset_clients():
+    global _session
+
+    with _lock:
+        _clients.clear()
+        _session = None
+
+
+def use_session(session, client_hook=None):
+    # Replaces the session (and drops existing clients) so that e.g. an offline
+    # backend can be plugged in; reset_clients() and remove_client_hook() undo it.
+    global _session
+
+    with _lock:
+        _clients.clear()
+        _session = session
+        if client_hook is not None and client_hook not in _client_hooks:
+            _client_hooks.append(client_hook)
+
+
+def remove_client_hook(client_hook):
+    with _lock:
+        if client_hook in _client_hooks:
+            _client_hooks.remove(client_hook)
+        _clients.clear()
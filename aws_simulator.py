@@ -0,0 +1,838 @@
+"""In-memory stand-in for the EC2 and Auto Scaling calls the handlers make.
+
+SimulatedAws answers the calls of real botocore clients from a before-call handler
+(the way botocore's Stubber does), so the rate limiter, call accounting and retry
+handlers still see every attempt. Per-call latency, throttling and the delays of
+attach/detach, instance launch and tag visibility are configurable:
+
+    sim = SimulatedAws(latency_ms={"describe": 80, "mutate": 150}, throttle_rate=0.02)
+    sim.create_cluster("asg-bench", nodes=30)
+    with sim:
+        asg_operations.lambda_handler(sim.test_notification_event("asg-bench"), None)
+
+Only the ASG lock and the binding store are not simulated; the benchmark runs them
+on the memory and sqlite backends. --time-scale shrinks the simulated latencies and
+delays, not the client-side API_RATE_* limits, which bound large clusters.
+
+    python aws_simulator.py --nodes 3 30 300 --time-scale 0.2 --output sim_bench.json
+    python aws_simulator.py --nodes 30 --execution-mode asyncio
+"""
+import argparse
+import copy
+import functools
+import heapq
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from rate_limiter import api_category
+
+REGION = "us-east-1"
+AVAILABILITY_ZONES = ("us-east-1a", "us-east-1b", "us-east-1c")
+VPC_ID = "vpc-0simulated0000001"
+
+# Mean service-side latency of one attempt per API category, in milliseconds.
+DEFAULT_LATENCY_MS = {
+    "describe": 60,
+    "mutate": 120,
+    "tag": 60,
+    "lifecycle": 40,
+    "other": 60,
+}
+# Seconds, before time_scale.
+DEFAULT_LAUNCH_DELAY = 1.0
+DEFAULT_ATTACH_DELAY = 0.5
+DEFAULT_DETACH_DELAY = 1.0
+DEFAULT_VISIBILITY_DELAY = 0.0
+
+HTTP_STATUS = {
+    "RequestLimitExceeded": 503,
+    "Throttling": 400,
+    "ValidationError": 400,
+}
+
+
+class SimulatedError(Exception):
+
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+def _tag_list(tags, key_name="Key"):
+    return [{key_name: key, "Value": value} for key, value in tags.items()]
+
+
+class _Bucket:
+    # Account-side request rate of one API category; calls beyond it are throttled.
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class SimulatedAws:
+
+    def __init__(self, region=REGION, latency_ms=None, jitter=0.25, throttle_rate=0.0, api_rates=None,
+                 launch_delay=DEFAULT_LAUNCH_DELAY, attach_delay=DEFAULT_ATTACH_DELAY,
+                 detach_delay=DEFAULT_DETACH_DELAY, visibility_delay=DEFAULT_VISIBILITY_DELAY,
+                 time_scale=1.0, seed=None):
+        self.region = region
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.time_scale = time_scale
+        self.launch_delay = launch_delay * time_scale
+        self.attach_delay = attach_delay * time_scale
+        self.detach_delay = detach_delay * time_scale
+        self.visibility_delay = visibility_delay * time_scale
+        self._buckets = {category: _Bucket(*rate) for category, rate in (api_rates or {}).items()}
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._scheduled = []
+        self._sequence = itertools.count()
+
+        self.instances = {}
+        self.enis = {}
+        self.volumes = {}
+        self.asgs = {}
+        self.lifecycle_actions = {}
+        self.calls = {}
+        self.throttled = 0
+
+    # ----- clock and eventual consistency
+
+    def _new_id(self, prefix):
+        return f"{prefix}-{next(self._ids):017x}"
+
+    def _schedule(self, delay, change):
+        if delay <= 0:
+            change()
+        else:
+            heapq.heappush(self._scheduled, (time.monotonic() + delay, next(self._sequence), change))
+
+    def _advance(self):
+        now = time.monotonic()
+        while self._scheduled and self._scheduled[0][0] <= now:
+            _, _, change = heapq.heappop(self._scheduled)
+            change()
+
+    def settle(self):
+        # Applies every pending change now; for assertions after a scenario.
+        with self._lock:
+            while self._scheduled:
+                _, _, change = heapq.heappop(self._scheduled)
+                change()
+
+    def _visible(self, resource):
+        return resource["visible_at"] <= time.monotonic()
+
+    # ----- cluster setup
+
+    def create_cluster(self, asg_name, nodes, availability_zones=AVAILABILITY_ZONES, running=True):
+        """Creates the ASG with `nodes` instances, one tagged ENI per node in the subnet of
+        its AZ and one tagged volume per node, laid out like cluster1.tf."""
+        with self._lock:
+            subnets = {az: self._new_id("subnet") for az in availability_zones}
+            self.asgs[asg_name] = {
+                "name": asg_name,
+                "subnets": subnets,
+                "tags": {"Name": ("asg-cb-data", True), "Status": ("available", True)},
+                "instances": [],
+                "launch_hook": f"asg-lifecyclehook-{asg_name}_launch",
+                "termination_hook": f"asg-lifecyclehook-{asg_name}_termination",
+            }
+            for index in range(nodes):
+                az = availability_zones[index % len(availability_zones)]
+                self._create_eni(subnets[az], az, {
+                    "Subnet": subnets[az],
+                    "UniqueTag": f"data_{index}",
+                    "AutoscaleGroup": asg_name,
+                    "NodeStatus": "available",
+                })
+                self._create_volume(az, {"AvailabilityZone": az, "AsgName": asg_name, "Status": "available"})
+            if running:
+                for index in range(nodes):
+                    instance = self._create_instance(asg_name, availability_zones[index % len(availability_zones)])
+                    instance["state"] = "running"
+                    instance["lifecycle_state"] = "InService"
+        return asg_name
+
+    def _create_eni(self, subnet_id, az, tags, primary_of=None):
+        eni_id = self._new_id("eni")
+        self.enis[eni_id] = {
+            "id": eni_id,
+            "subnet_id": subnet_id,
+            "az": az,
+            "status": "available",
+            "attachment": None,
+            "tags": dict(tags),
+            "private_ip": f"10.{next(self._ids) % 250}.{self._random.randrange(250)}.{self._random.randrange(1, 250)}",
+            "primary_of": primary_of,
+            "visible_at": 0,
+        }
+        return self.enis[eni_id]
+
+    def _create_volume(self, az, tags, size=8):
+        volume_id = self._new_id("vol")
+        self.volumes[volume_id] = {
+            "id": volume_id,
+            "az": az,
+            "state": "available",
+            "attachment": None,
+            "size": size,
+            "tags": dict(tags),
+            "visible_at": 0,
+        }
+        return self.volumes[volume_id]
+
+    def _create_instance(self, asg_name, az):
+        asg = self.asgs[asg_name]
+        instance_id = self._new_id("i")
+        tags = {key: value for key, (value, propagate) in asg["tags"].items() if propagate}
+        tags["aws:autoscaling:groupName"] = asg_name
+        instance = {
+            "id": instance_id,
+            "asg": asg_name,
+            "az": az,
+            "subnet_id": asg["subnets"][az],
+            "state": "pending",
+            "lifecycle_state": "Pending",
+            "tags": tags,
+            "visible_at": time.monotonic() + self.visibility_delay,
+        }
+        self.instances[instance_id] = instance
+        primary = self._create_eni(instance["subnet_id"], az, {}, primary_of=instance_id)
+        primary.update(status="in-use", attachment=self._attachment(instance_id, 0, "attached"))
+        instance["primary_eni"] = primary["id"]
+        asg["instances"].append(instance_id)
+        return instance
+
+    def _attachment(self, instance_id, device_index, status):
+        return {"AttachmentId": self._new_id("eni-attach"), "InstanceId": instance_id, "DeviceIndex": device_index, "Status": status}
+
+    # ----- lifecycle events
+
+    def _start_lifecycle_action(self, instance, transition, hook_name):
+        token = str(uuid.uuid4())
+        self.lifecycle_actions[token] = {
+            "asg": instance["asg"],
+            "hook": hook_name,
+            "instance_id": instance["id"],
+            "transition": transition,
+            "result": None,
+            "heartbeats": 0,
+        }
+        return {
+            "Origin": "EC2",
+            "LifecycleHookName": hook_name,
+            "Destination": "AutoScalingGroup",
+            "AccountId": "000000000000",
+            "RequestId": str(uuid.uuid4()),
+            "LifecycleTransition": transition,
+            "AutoScalingGroupName": instance["asg"],
+            "Service": "AWS Auto Scaling",
+            "Time": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+            "EC2InstanceId": instance["id"],
+            "LifecycleActionToken": token,
+        }
+
+    def launch_instance(self, asg_name, availability_zone=None):
+        """Launches a replacement into Pending:Wait and returns its lifecycle message;
+        the instance turns running after launch_delay."""
+        with self._lock:
+            asg = self.asgs[asg_name]
+            availability_zone = availability_zone or self._random.choice(sorted(asg["subnets"]))
+            instance = self._create_instance(asg_name, availability_zone)
+            instance["lifecycle_state"] = "Pending:Wait"
+            self._schedule(self.launch_delay, lambda: instance["state"] == "pending" and instance.update(state="running"))
+            return self._start_lifecycle_action(instance, "autoscaling:EC2_INSTANCE_LAUNCHING", asg["launch_hook"])
+
+    def terminate_instance(self, instance_id):
+        with self._lock:
+            instance = self.instances[instance_id]
+            instance["lifecycle_state"] = "Terminating:Wait"
+            return self._start_lifecycle_action(
+                instance, "autoscaling:EC2_INSTANCE_TERMINATING", self.asgs[instance["asg"]]["termination_hook"]
+            )
+
+    def _finish_termination(self, instance):
+        instance.update(state="terminated", lifecycle_state="Terminated")
+        self.asgs[instance["asg"]]["instances"].remove(instance["id"])
+        for eni in self.enis.values():
+            if eni["attachment"] and eni["attachment"]["InstanceId"] == instance["id"]:
+                eni.update(status="available", attachment=None)
+        for volume in self.volumes.values():
+            if volume["attachment"] and volume["attachment"]["InstanceId"] == instance["id"]:
+                volume.update(state="available", attachment=None)
+        self.enis.pop(instance["primary_eni"], None)
+
+    @staticmethod
+    def sns_event(*messages):
+        return {"Records": [
+            {"EventSource": "aws:sns", "Sns": {"MessageId": str(uuid.uuid4()), "Message": json.dumps(message)}}
+            for message in messages
+        ]}
+
+    @staticmethod
+    def sqs_event(*messages):
+        return {"Records": [
+            {"eventSource": "aws:sqs", "messageId": str(uuid.uuid4()), "body": json.dumps(message)}
+            for message in messages
+        ]}
+
+    def test_notification_event(self, asg_name):
+        return self.sns_event({
+            "AccountId": "000000000000",
+            "RequestId": str(uuid.uuid4()),
+            "AutoScalingGroupARN": f"arn:aws:autoscaling:{self.region}:000000000000:autoScalingGroup:{asg_name}",
+            "AutoScalingGroupName": asg_name,
+            "Service": "AWS Auto Scaling",
+            "Event": "autoscaling:TEST_NOTIFICATION",
+            "Time": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        })
+
+    # ----- botocore integration
+
+    def session(self):
+        import boto3
+
+        return boto3.session.Session(
+            aws_access_key_id="simulated", aws_secret_access_key="simulated", region_name=self.region
+        )
+
+    def install_client(self, client):
+        events = client.meta.events
+        events.register_first("before-parameter-build.*.*", self._capture_params, unique_id="aws-simulator-params")
+        events.register("before-call.*.*", functools.partial(self._handle_call, events), unique_id="aws-simulator-call")
+        return client
+
+    def install(self):
+        import aws_clients
+
+        aws_clients.use_session(self.session(), self.install_client)
+        return self
+
+    def uninstall(self):
+        import aws_clients
+
+        aws_clients.remove_client_hook(self.install_client)
+        aws_clients.reset_clients()
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.uninstall()
+
+    @staticmethod
+    def _capture_params(params, context=None, **kwargs):
+        # before-call only sees the serialized request; keep the API parameters for it.
+        if context is not None:
+            context["simulator_params"] = copy.deepcopy(params)
+
+    def _handle_call(self, events, model, params, context=None, **kwargs):
+        from botocore.awsrequest import AWSResponse
+        from botocore.hooks import first_non_none_response
+
+        service_id = model.service_model.service_id.hyphenize()
+        api_params = (context or {}).get("simulator_params", {})
+        attempts = 0
+        while True:
+            attempts += 1
+            events.emit(f"before-send.{service_id}.{model.name}", request=None)
+            status, parsed = self._attempt(model.name, api_params)
+            parsed.setdefault("ResponseMetadata", {}).update(
+                {"RequestId": str(uuid.uuid4()), "HTTPStatusCode": status, "HTTPHeaders": {}, "RetryAttempts": attempts - 1}
+            )
+            http = AWSResponse(None, status, {}, None)
+            # The same decision botocore's endpoint makes after every attempt.
+            delay = first_non_none_response(events.emit(
+                f"needs-retry.{service_id}.{model.name}", response=(http, parsed), endpoint=None,
+                operation=model, attempts=attempts, caught_exception=None, request_dict=params,
+            ))
+            if not delay:
+                parsed["ResponseMetadata"]["RetryAttempts"] = attempts - 1
+                return http, parsed
+            time.sleep(delay)
+
+    def _attempt(self, operation_name, params):
+        category = api_category(operation_name)
+        latency = self.latency_ms.get(category, self.latency_ms["other"]) / 1000 * self.time_scale
+        if latency > 0:
+            time.sleep(max(0.0, self._random.gauss(latency, latency * self.jitter)))
+
+        with self._lock:
+            self.calls[operation_name] = self.calls.get(operation_name, 0) + 1
+            bucket = self._buckets.get(category)
+            if (bucket is not None and not bucket.take()) or self._random.random() < self.throttle_rate:
+                self.throttled += 1
+                return HTTP_STATUS["RequestLimitExceeded"], {
+                    "Error": {"Code": "RequestLimitExceeded", "Message": "Request limit exceeded."}
+                }
+            handler = getattr(self, f"_op_{operation_name}", None)
+            if handler is None:
+                return 400, {"Error": {"Code": "UnsupportedOperation", "Message": f"{operation_name} is not simulated."}}
+            self._advance()
+            try:
+                return 200, handler(**params)
+            except SimulatedError as e:
+                return HTTP_STATUS.get(e.code, 400), {"Error": {"Code": e.code, "Message": e.message}}
+
+    # ----- describes
+
+    FILTERS = {
+        "instance": {
+            "instance-id": lambda r: [r["id"]],
+            "instance-state-name": lambda r: [r["state"]],
+            "availability-zone": lambda r: [r["az"]],
+            "subnet-id": lambda r: [r["subnet_id"]],
+        },
+        "eni": {
+            "network-interface-id": lambda r: [r["id"]],
+            "status": lambda r: [r["status"]],
+            "availability-zone": lambda r: [r["az"]],
+            "subnet-id": lambda r: [r["subnet_id"]],
+            "attachment.instance-id": lambda r: [r["attachment"]["InstanceId"]] if r["attachment"] else [],
+        },
+        "volume": {
+            "volume-id": lambda r: [r["id"]],
+            "status": lambda r: [r["state"]],
+            "availability-zone": lambda r: [r["az"]],
+            "attachment.instance-id": lambda r: [r["attachment"]["InstanceId"]] if r["attachment"] else [],
+        },
+    }
+
+    def _matches(self, kind, resource, filters):
+        for item in filters or []:
+            name, values = item["Name"], item["Values"]
+            if name.startswith("tag:"):
+                actual = [resource["tags"][name[4:]]] if name[4:] in resource["tags"] else []
+            elif name == "tag-key":
+                actual = list(resource["tags"])
+            elif name in self.FILTERS[kind]:
+                actual = self.FILTERS[kind][name](resource)
+            else:
+                raise SimulatedError("InvalidParameterValue", f"The filter '{name}' is invalid.")
+            if not set(actual) & set(values):
+                return False
+        return True
+
+    def _select(self, kind, table, ids, filters, not_found_code):
+        if ids:
+            missing = [resource_id for resource_id in ids if resource_id not in table or not self._visible(table[resource_id])]
+            if missing:
+                raise SimulatedError(not_found_code, f"The ID(s) {missing} do not exist.")
+            resources = [table[resource_id] for resource_id in ids]
+        else:
+            resources = [resource for resource in table.values() if self._visible(resource)]
+        return [resource for resource in resources if self._matches(kind, resource, filters)]
+
+    @staticmethod
+    def _page(items, max_results, next_token):
+        start = int(next_token or 0)
+        end = len(items) if not max_results else start + max_results
+        return items[start:end], (str(end) if end < len(items) else None)
+
+    def _instance_shape(self, instance):
+        interfaces = []
+        for eni in self.enis.values():
+            if eni["attachment"] and eni["attachment"]["InstanceId"] == instance["id"]:
+                interfaces.append({
+                    "NetworkInterfaceId": eni["id"],
+                    "PrivateIpAddress": eni["private_ip"],
+                    "Status": eni["status"],
+                    "SubnetId": eni["subnet_id"],
+                    "Attachment": dict(eni["attachment"]),
+                })
+        return {
+            "InstanceId": instance["id"],
+            "InstanceType": "t3.medium",
+            "SubnetId": instance["subnet_id"],
+            "VpcId": VPC_ID,
+            "Placement": {"AvailabilityZone": instance["az"]},
+            "State": {"Name": instance["state"], "Code": {"pending": 0, "running": 16, "terminated": 48}.get(instance["state"], 32)},
+            "Tags": _tag_list(instance["tags"]),
+            "NetworkInterfaces": sorted(interfaces, key=lambda eni: eni["Attachment"]["DeviceIndex"]),
+        }
+
+    def _eni_shape(self, eni):
+        shape = {
+            "NetworkInterfaceId": eni["id"],
+            "SubnetId": eni["subnet_id"],
+            "VpcId": VPC_ID,
+            "AvailabilityZone": eni["az"],
+            "Status": eni["status"],
+            "PrivateIpAddress": eni["private_ip"],
+            "PrivateIpAddresses": [{"PrivateIpAddress": eni["private_ip"], "Primary": True}],
+            "TagSet": _tag_list(eni["tags"]),
+        }
+        if eni["attachment"]:
+            shape["Attachment"] = dict(eni["attachment"])
+        return shape
+
+    def _volume_shape(self, volume):
+        attachments = []
+        if volume["attachment"]:
+            attachments.append({**volume["attachment"], "VolumeId": volume["id"]})
+        return {
+            "VolumeId": volume["id"],
+            "AvailabilityZone": volume["az"],
+            "State": volume["state"],
+            "Size": volume["size"],
+            "VolumeType": "gp2",
+            "Attachments": attachments,
+            "Tags": _tag_list(volume["tags"]),
+        }
+
+    def _op_DescribeInstances(self, InstanceIds=None, Filters=None, MaxResults=None, NextToken=None, **kwargs):
+        instances = self._select("instance", self.instances, InstanceIds, Filters, "InvalidInstanceID.NotFound")
+        page, token = self._page(instances, MaxResults, NextToken)
+        response = {"Reservations": [{"ReservationId": self._new_id("r"), "Instances": [self._instance_shape(i) for i in page]}] if page else []}
+        if token:
+            response["NextToken"] = token
+        return response
+
+    def _op_DescribeNetworkInterfaces(self, NetworkInterfaceIds=None, Filters=None, MaxResults=None, NextToken=None, **kwargs):
+        enis = self._select("eni", self.enis, NetworkInterfaceIds, Filters, "InvalidNetworkInterfaceID.NotFound")
+        page, token = self._page(enis, MaxResults, NextToken)
+        response = {"NetworkInterfaces": [self._eni_shape(eni) for eni in page]}
+        if token:
+            response["NextToken"] = token
+        return response
+
+    def _op_DescribeVolumes(self, VolumeIds=None, Filters=None, MaxResults=None, NextToken=None, **kwargs):
+        volumes = self._select("volume", self.volumes, VolumeIds, Filters, "InvalidVolume.NotFound")
+        page, token = self._page(volumes, MaxResults, NextToken)
+        response = {"Volumes": [self._volume_shape(volume) for volume in page]}
+        if token:
+            response["NextToken"] = token
+        return response
+
+    # ----- attach, detach and tags
+
+    def _running_instance(self, instance_id):
+        instance = self.instances.get(instance_id)
+        if instance is None or not self._visible(instance):
+            raise SimulatedError("InvalidInstanceID.NotFound", f"The instance ID '{instance_id}' does not exist")
+        if instance["state"] != "running":
+            raise SimulatedError("IncorrectInstanceState", f"The instance '{instance_id}' is not in the 'running' state.")
+        return instance
+
+    def _op_AttachNetworkInterface(self, NetworkInterfaceId, InstanceId, DeviceIndex, **kwargs):
+        eni = self.enis.get(NetworkInterfaceId)
+        if eni is None:
+            raise SimulatedError("InvalidNetworkInterfaceID.NotFound", f"The networkInterface ID '{NetworkInterfaceId}' does not exist")
+        instance = self._running_instance(InstanceId)
+        if eni["status"] != "available":
+            raise SimulatedError("InvalidParameterValue", f"Interface: [{NetworkInterfaceId}] in use.")
+        if eni["az"] != instance["az"]:
+            raise SimulatedError("InvalidParameterCombination", "The network interface and instance are in different availability zones.")
+        for other in self.enis.values():
+            if other["attachment"] and other["attachment"]["InstanceId"] == InstanceId and other["attachment"]["DeviceIndex"] == DeviceIndex:
+                raise SimulatedError("InvalidParameterValue", f"Instance '{InstanceId}' already has an interface attached at device index '{DeviceIndex}'.")
+
+        attachment = self._attachment(InstanceId, DeviceIndex, "attaching")
+        eni.update(status="in-use", attachment=attachment)
+        self._schedule(self.attach_delay, lambda: attachment.update(Status="attached"))
+        return {"AttachmentId": attachment["AttachmentId"], "NetworkCardIndex": 0}
+
+    def _op_DetachNetworkInterface(self, AttachmentId, Force=False, **kwargs):
+        for eni in self.enis.values():
+            if eni["attachment"] and eni["attachment"]["AttachmentId"] == AttachmentId:
+                break
+        else:
+            raise SimulatedError("InvalidAttachmentID.NotFound", f"Interface attachment '{AttachmentId}' does not exist.")
+        if eni["attachment"]["DeviceIndex"] == 0:
+            raise SimulatedError("OperationNotPermitted", "The network interface at device index 0 cannot be detached.")
+
+        eni["attachment"]["Status"] = "detaching"
+        eni["status"] = "detaching"
+
+        def detached():
+            if eni["attachment"] and eni["attachment"]["AttachmentId"] == AttachmentId:
+                eni.update(status="available", attachment=None)
+
+        self._schedule(self.detach_delay, detached)
+        return {}
+
+    def _op_AttachVolume(self, VolumeId, InstanceId, Device, **kwargs):
+        volume = self.volumes.get(VolumeId)
+        if volume is None:
+            raise SimulatedError("InvalidVolume.NotFound", f"The volume '{VolumeId}' does not exist.")
+        instance = self._running_instance(InstanceId)
+        if volume["state"] != "available":
+            raise SimulatedError("VolumeInUse", f"{VolumeId} is already attached to an instance")
+        if volume["az"] != instance["az"]:
+            raise SimulatedError("InvalidVolume.ZoneMismatch", f"The volume '{VolumeId}' is not in the same availability zone as instance '{InstanceId}'")
+        for other in self.volumes.values():
+            if other["attachment"] and other["attachment"]["InstanceId"] == InstanceId and other["attachment"]["Device"] == Device:
+                raise SimulatedError("InvalidParameterValue", f"Attachment point {Device} is already in use")
+
+        attachment = {"InstanceId": InstanceId, "Device": Device, "State": "attaching"}
+        volume.update(state="in-use", attachment=attachment)
+        self._schedule(self.attach_delay, lambda: attachment.update(State="attached"))
+        return {"VolumeId": VolumeId, "InstanceId": InstanceId, "Device": Device, "State": "attaching"}
+
+    def _op_DetachVolume(self, VolumeId, InstanceId=None, Force=False, **kwargs):
+        volume = self.volumes.get(VolumeId)
+        if volume is None:
+            raise SimulatedError("InvalidVolume.NotFound", f"The volume '{VolumeId}' does not exist.")
+        attachment = volume["attachment"]
+        if attachment is None or (InstanceId and attachment["InstanceId"] != InstanceId):
+            raise SimulatedError("IncorrectState", f"Volume '{VolumeId}' is in the 'available' state.")
+
+        attachment["State"] = "detaching"
+
+        def detached():
+            if volume["attachment"] is attachment:
+                volume.update(state="available", attachment=None)
+
+        self._schedule(self.detach_delay, detached)
+        return {"VolumeId": VolumeId, "InstanceId": attachment["InstanceId"], "Device": attachment["Device"], "State": "detaching"}
+
+    def _op_CreateTags(self, Resources, Tags, **kwargs):
+        resources = []
+        for resource_id in Resources:
+            resource = self.instances.get(resource_id) or self.enis.get(resource_id) or self.volumes.get(resource_id)
+            if resource is None:
+                raise SimulatedError("InvalidID", f"The ID '{resource_id}' is not valid")
+            resources.append(resource)
+        tags = {tag["Key"]: tag.get("Value", "") for tag in Tags}
+
+        def apply():
+            for resource in resources:
+                resource["tags"].update(tags)
+
+        # Describes keep returning the old tags for visibility_delay.
+        self._schedule(self.visibility_delay, apply)
+        return {}
+
+    # ----- Auto Scaling
+
+    def _asg(self, name):
+        asg = self.asgs.get(name)
+        if asg is None:
+            raise SimulatedError("ValidationError", f"AutoScalingGroup name not found - {name}")
+        return asg
+
+    def _op_DescribeAutoScalingGroups(self, AutoScalingGroupNames=None, MaxRecords=None, NextToken=None, **kwargs):
+        names = AutoScalingGroupNames or sorted(self.asgs)
+        groups = []
+        for name in names:
+            asg = self.asgs.get(name)
+            if asg is None:
+                continue
+            groups.append({
+                "AutoScalingGroupName": name,
+                "DesiredCapacity": len(asg["instances"]),
+                "AvailabilityZones": sorted(asg["subnets"]),
+                "VPCZoneIdentifier": ",".join(asg["subnets"][az] for az in sorted(asg["subnets"])),
+                "Instances": [
+                    {
+                        "InstanceId": instance_id,
+                        "AvailabilityZone": self.instances[instance_id]["az"],
+                        "LifecycleState": self.instances[instance_id]["lifecycle_state"],
+                        "HealthStatus": "Healthy",
+                    }
+                    for instance_id in asg["instances"]
+                ],
+                "Tags": [
+                    {"ResourceId": name, "ResourceType": "auto-scaling-group", "Key": key, "Value": value, "PropagateAtLaunch": propagate}
+                    for key, (value, propagate) in asg["tags"].items()
+                ],
+            })
+        page, token = self._page(groups, MaxRecords, NextToken)
+        response = {"AutoScalingGroups": page}
+        if token:
+            response["NextToken"] = token
+        return response
+
+    def _op_CreateOrUpdateTags(self, Tags, **kwargs):
+        for tag in Tags:
+            self._asg(tag["ResourceId"])["tags"][tag["Key"]] = (tag.get("Value", ""), bool(tag.get("PropagateAtLaunch")))
+        return {}
+
+    def _op_DeleteTags(self, Tags, **kwargs):
+        for tag in Tags:
+            self._asg(tag["ResourceId"])["tags"].pop(tag["Key"], None)
+        return {}
+
+    def _lifecycle_action(self, AutoScalingGroupName, LifecycleHookName, LifecycleActionToken=None, InstanceId=None):
+        for token, action in self.lifecycle_actions.items():
+            if (action["result"] is None and action["asg"] == AutoScalingGroupName and action["hook"] == LifecycleHookName
+                    and (token == LifecycleActionToken or (not LifecycleActionToken and action["instance_id"] == InstanceId))):
+                return action
+        raise SimulatedError("ValidationError", "No active Lifecycle Action found with token " + str(LifecycleActionToken))
+
+    def _op_RecordLifecycleActionHeartbeat(self, AutoScalingGroupName, LifecycleHookName, LifecycleActionToken=None,
+                                           InstanceId=None, **kwargs):
+        self._lifecycle_action(AutoScalingGroupName, LifecycleHookName, LifecycleActionToken, InstanceId)["heartbeats"] += 1
+        return {}
+
+    def _op_CompleteLifecycleAction(self, AutoScalingGroupName, LifecycleHookName, LifecycleActionResult,
+                                    LifecycleActionToken=None, InstanceId=None, **kwargs):
+        action = self._lifecycle_action(AutoScalingGroupName, LifecycleHookName, LifecycleActionToken, InstanceId)
+        action["result"] = LifecycleActionResult
+        action["completed_at"] = time.monotonic()
+        instance = self.instances[action["instance_id"]]
+        if action["transition"] == "autoscaling:EC2_INSTANCE_LAUNCHING" and LifecycleActionResult == "CONTINUE":
+            instance["lifecycle_state"] = "InService"
+        else:
+            instance["lifecycle_state"] = "Terminating:Proceed"
+            self._schedule(self.detach_delay, lambda: self._finish_termination(instance))
+        return {}
+
+    # ----- inspection
+
+    def attached_resources(self, instance_id):
+        with self._lock:
+            self._advance()
+            enis = [eni["id"] for eni in self.enis.values()
+                    if eni["attachment"] and eni["attachment"]["InstanceId"] == instance_id and eni["attachment"]["DeviceIndex"] == 1]
+            volumes = [volume["id"] for volume in self.volumes.values()
+                       if volume["attachment"] and volume["attachment"]["InstanceId"] == instance_id]
+        return enis, volumes
+
+    def unprovisioned_instances(self, asg_name):
+        # Running instances of the ASG without exactly one data ENI and one volume. Changes
+        # that are due are applied first: polls run while no handler is calling in.
+        with self._lock:
+            self._advance()
+            instance_ids = [instance_id for instance_id in self.asgs[asg_name]["instances"]
+                            if self.instances[instance_id]["state"] == "running"]
+        return [instance_id for instance_id in instance_ids if tuple(map(len, self.attached_resources(instance_id))) != (1, 1)]
+
+
+def _timed(handler, event):
+    import api_accounting
+
+    api_accounting.accounting.reset()
+    started = time.perf_counter()
+    response = handler(event, None)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return {
+        "status": response.get("statusCode"),
+        "handler_ms": round(elapsed_ms, 1),
+        "api": {key: value for key, value in api_accounting.summary().items() if key != "operations"},
+        "calls": {key.split(":", 1)[1]: stats["calls"] for key, stats in api_accounting.accounting.snapshot().items()},
+    }
+
+
+def run_scenario(nodes, options):
+    """Provisions a fresh `nodes`-node cluster, then replaces one node (termination
+    followed by the launch of its replacement) and reports every handler call."""
+    import asg_operations
+
+    sim = SimulatedAws(
+        latency_ms={category: options.latency_ms for category in DEFAULT_LATENCY_MS} if options.latency_ms is not None else None,
+        throttle_rate=options.throttle_rate,
+        visibility_delay=options.visibility_delay,
+        time_scale=options.time_scale,
+        seed=options.seed,
+    )
+    asg_name = sim.create_cluster("asg-simulated", nodes)
+    results = {"nodes": nodes}
+    with sim:
+        results["provision"] = _timed(asg_operations.lambda_handler, sim.test_notification_event(asg_name))
+        sim.settle()
+        results["provision"]["unprovisioned"] = len(sim.unprovisioned_instances(asg_name))
+
+        victim = sim.asgs[asg_name]["instances"][0]
+        results["terminate"] = _timed(asg_operations.lambda_handler, sim.sns_event(sim.terminate_instance(victim)))
+        sim.settle()
+        launch = sim.launch_instance(asg_name, sim.instances[victim]["az"])
+        results["launch"] = _timed(asg_operations.lambda_handler, sim.sns_event(launch))
+        sim.settle()
+        results["launch"]["unprovisioned"] = len(sim.unprovisioned_instances(asg_name))
+        results["throttled"] = sim.throttled
+    return results
+
+
+def run_child(nodes, options):
+    import logging
+
+    logging.getLogger().setLevel(logging.WARNING)
+    print(json.dumps(run_scenario(nodes, options)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[3, 30, 300])
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplies every simulated latency and delay")
+    parser.add_argument("--latency-ms", type=float, help="one latency for every API category")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="probability of a throttling error per attempt")
+    parser.add_argument("--visibility-delay", type=float, default=DEFAULT_VISIBILITY_DELAY)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--execution-mode", choices=["threads", "asyncio"], default="threads",
+                        help="EXECUTION_MODE of the handlers")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        run_child(options.child, options)
+        return
+
+    child_args = [
+        "--time-scale", str(options.time_scale),
+        "--throttle-rate", str(options.throttle_rate),
+        "--visibility-delay", str(options.visibility_delay),
+        "--seed", str(options.seed),
+    ]
+    if options.latency_ms is not None:
+        child_args += ["--latency-ms", str(options.latency_ms)]
+    results = []
+    for nodes in options.nodes:
+        # A fresh interpreter per size: the lock, binding store and client caches start empty.
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(
+                os.environ,
+                AWS_DEFAULT_REGION=REGION,
+                ASG_LOCK_BACKEND="memory",
+                BINDING_STORE_BACKEND="sqlite",
+                BINDING_STORE_PATH=os.path.join(directory, "bindings.sqlite3"),
+                CHECKPOINT_BACKEND="file",
+                IDEMPOTENCY_BACKEND="memory",
+                EXECUTION_MODE=options.execution_mode,
+                CHECKPOINT_DIR=os.path.join(directory, "checkpoints"),
+                METRICS_MODE=os.environ.get("METRICS_MODE", "off"),
+            )
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", str(nodes)] + child_args,
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{nodes:>4} nodes: " + ", ".join(
+            f"{phase} {result[phase]['handler_ms']:.0f} ms / {result[phase]['api']['calls']} calls (status {result[phase]['status']})"
+            for phase in ("provision", "terminate", "launch")
+        ) + f", throttled {result['throttled']}")
+
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+BINDING_BACKEND = os.environ.get("BINDING_STORE_BACKEND", "dynamodb")
+BINDING_TABLE = os.environ.get("BINDING_TABLE", "asg-bindings")
+BINDING_STORE_PATH = os.environ.get("BINDING_STORE_PATH", "/tmp/asg_bindings.sqlite3")
+
+BINDING_FIELDS = ["asg_name", "instance_id", "eni_id", "ebs_id", "subnet_id", "availability_zone", "slot", "server_group"]
+TAG_PREFIXES = {"subnet_": "subnet_id", "eni_": "eni_id", "ebs_": "ebs_id"}
+
+
+def make_binding(asg_name, instance_id, eni_id=None, ebs_id=None, subnet_id=None, availability_zone=None,
+                 slot=None, server_group=None):
+    return {
+        "asg_name": asg_name,
+        "instance_id": instance_id,
+        "eni_id": eni_id,
+        "ebs_id": ebs_id,
+        "subnet_id": subnet_id,
+        "availability_zone": availability_zone,
+        "slot": slot,
+        "server_group": server_group,
+    }
+
+
+class SqliteBindingStore:
+    """Local file (or ":memory:") stand-in for the binding table."""
+
+    def __init__(self, path=BINDING_STORE_PATH):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS bindings ("
+                " asg_name TEXT NOT NULL, instance_id TEXT NOT NULL,"
+                " eni_id TEXT, ebs_id TEXT, subnet_id TEXT, availability_zone TEXT,"
+                " slot TEXT, server_group TEXT,"
+                " updated_at REAL, PRIMARY KEY (asg_name, instance_id))"
+            )
+            # Files written before slots were recorded lack the newer columns.
+            columns = {row["name"] for row in self._connection.execute("PRAGMA table_info(bindings)")}
+            for field in BINDING_FIELDS:
+                if field not in columns:
+                    self._connection.execute(f"ALTER TABLE bindings ADD COLUMN {field} TEXT")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS bindings_eni ON bindings (eni_id)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS bindings_ebs ON bindings (ebs_id)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS bindings_az ON bindings (asg_name, availability_zone)")
+
+    def _rows(self, query, params):
+        with self._lock:
+            return [dict((field, row[field]) for field in BINDING_FIELDS) for row in self._connection.execute(query, params)]
+
+    def put(self, binding):
+        with self._lock, self._connection:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO bindings ({', '.join(BINDING_FIELDS)}, updated_at)"
+                f" VALUES ({', '.join('?' for _ in BINDING_FIELDS)}, ?)",
+                [binding.get(field) for field in BINDING_FIELDS] + [time.time()],
+            )
+
+    def get(self, asg_name, instance_id):
+        rows = self._rows("SELECT * FROM bindings WHERE asg_name = ? AND instance_id = ?", (asg_name, instance_id))
+        return rows[0] if rows else None
+
+    def delete(self, asg_name, instance_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM bindings WHERE asg_name = ? AND instance_id = ?", (asg_name, instance_id))
+
+    def find_by_resource(self, asg_name, resource_id):
+        rows = self._rows(
+            "SELECT * FROM bindings WHERE asg_name = ? AND (eni_id = ? OR ebs_id = ?)",
+            (asg_name, resource_id, resource_id),
+        )
+        return rows[0] if rows else None
+
+    def list_by_az(self, asg_name, availability_zone):
+        return self._rows(
+            "SELECT * FROM bindings WHERE asg_name = ? AND availability_zone = ?", (asg_name, availability_zone)
+        )
+
+    def list(self, asg_name):
+        return self._rows("SELECT * FROM bindings WHERE asg_name = ?", (asg_name,))
+
+
+class DynamoDbBindingStore:
+    """Bindings in DynamoDB: one item per (asg_name, instance_id), with sparse
+    eni_id/ebs_id indexes and an (asg_name, availability_zone) index."""
+
+    def __init__(self, client, table_name=BINDING_TABLE):
+        self.client = client
+        self.table_name = table_name
+
+    @staticmethod
+    def _to_item(binding):
+        item = {field: {"S": binding[field]} for field in BINDING_FIELDS if binding.get(field)}
+        item["updated_at"] = {"N": str(time.time())}
+        return item
+
+    @staticmethod
+    def _from_item(item):
+        return make_binding(**{field: item[field]["S"] for field in BINDING_FIELDS if field in item})
+
+    def _query(self, **kwargs):
+        paginator = self.client.get_paginator("query")
+        for page in paginator.paginate(TableName=self.table_name, **kwargs):
+            for item in page.get("Items", []):
+                yield self._from_item(item)
+
+    def put(self, binding):
+        self.client.put_item(TableName=self.table_name, Item=self._to_item(binding))
+
+    def get(self, asg_name, instance_id):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"asg_name": {"S": asg_name}, "instance_id": {"S": instance_id}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        return self._from_item(item) if item else None
+
+    def delete(self, asg_name, instance_id):
+        self.client.delete_item(
+            TableName=self.table_name,
+            Key={"asg_name": {"S": asg_name}, "instance_id": {"S": instance_id}},
+        )
+
+    def find_by_resource(self, asg_name, resource_id):
+        for index, attribute in (("eni_index", "eni_id"), ("ebs_index", "ebs_id")):
+            for binding in self._query(
+                IndexName=index,
+                KeyConditionExpression=f"{attribute} = :resource",
+                ExpressionAttributeValues={":resource": {"S": resource_id}},
+            ):
+                if binding["asg_name"] == asg_name:
+                    return binding
+        return None
+
+    def list_by_az(self, asg_name, availability_zone):
+        return list(self._query(
+            IndexName="az_index",
+            KeyConditionExpression="asg_name = :asg AND availability_zone = :az",
+            ExpressionAttributeValues={":asg": {"S": asg_name}, ":az": {"S": availability_zone}},
+        ))
+
+    def list(self, asg_name):
+        return list(self._query(
+            KeyConditionExpression="asg_name = :asg",
+            ExpressionAttributeValues={":asg": {"S": asg_name}},
+            ConsistentRead=True,
+        ))
+
+
+_sqlite_stores = {}
+_sqlite_lock = threading.Lock()
+
+
+def get_binding_store():
+    if BINDING_BACKEND == "sqlite":
+        with _sqlite_lock:
+            if BINDING_STORE_PATH not in _sqlite_stores:
+                _sqlite_stores[BINDING_STORE_PATH] = SqliteBindingStore(BINDING_STORE_PATH)
+            return _sqlite_stores[BINDING_STORE_PATH]
+    elif BINDING_BACKEND == "dynamodb":
+        return DynamoDbBindingStore(get_client("dynamodb"), BINDING_TABLE)
+    else:
+        raise Exception(f"Unknown binding store backend {BINDING_BACKEND}.")
+
+
+def bindings_from_asg_tags(asg_name, tags):
+    # Legacy layout: one subnet_<instance>, eni_<instance> and ebs_<instance> tag per instance on the ASG.
+    bindings = {}
+    for tag in tags:
+        key = tag.get("Key", "")
+        for prefix, field in TAG_PREFIXES.items():
+            if key.startswith(prefix):
+                instance_id = key[len(prefix):]
+                binding = bindings.setdefault(instance_id, make_binding(asg_name, instance_id))
+                binding[field] = tag.get("Value")
+    return list(bindings.values())
+
+
+def migrate_asg_tag_bindings(store, asg_name, tags, inventory=None, autoscaling_client=None, delete_tags=False):
+    legacy_keys = [tag["Key"] for tag in tags if any(tag.get("Key", "").startswith(prefix) for prefix in TAG_PREFIXES)]
+    if not legacy_keys:
+        return []
+
+    migrated = []
+    live_instances = inventory.ensure_loaded().instances if inventory is not None else None
+    for binding in bindings_from_asg_tags(asg_name, tags):
+        if live_instances is not None and binding["instance_id"] not in live_instances:
+            # Left behind by an instance that is gone; its ENI and volume belong to nobody now.
+            continue
+        if store.get(asg_name, binding["instance_id"]):
+            continue
+        if inventory is not None and binding["eni_id"]:
+            eni = inventory.eni(binding["eni_id"])
+            if eni:
+                binding["availability_zone"] = eni["availability_zone"]
+        store.put(binding)
+        migrated.append(binding)
+    logger.info(f"Migrated {len(migrated)} instance binding(s) of {asg_name} from ASG tags.")
+
+    if delete_tags:
+        # Once the tags are gone a binding deleted from the store stays deleted.
+        autoscaling_client = autoscaling_client or get_client("autoscaling")
+        autoscaling_client.delete_tags(
+            Tags=[{"ResourceId": asg_name, "ResourceType": "auto-scaling-group", "Key": key} for key in legacy_keys]
+        )
+        if inventory is not None:
+            inventory.drop_asg_tags(legacy_keys)
+        logger.info(f"Deleted {len(legacy_keys)} legacy binding tag(s) from {asg_name}.")
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import instance bindings stored as ASG tags into the binding store.")
+    parser.add_argument("asg_name")
+    parser.add_argument("--delete-tags", action="store_true", help="remove the legacy tags from the ASG afterwards")
+    args = parser.parse_args()
+
+    from asg_inventory import AsgInventory
+
+    inventory = AsgInventory(args.asg_name)
+    migrated = migrate_asg_tag_bindings(
+        get_binding_store(), args.asg_name, inventory.asg_tags, inventory=inventory, delete_tags=args.delete_tags
+    )
+    for binding in migrated:
+        print(binding)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
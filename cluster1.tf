@@ -311,6 +311,120 @@ resource "aws_ebs_volume" "data_ebs" {
 }
 
 
+resource "aws_dynamodb_table" "asg_lock" {
+  name         = "asg-lock"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "lock_key"
+
+  attribute {
+    name = "lock_key"
+    type = "S"
+  }
+
+  tags = {
+    AsgName = local.asg_name
+  }
+}
+
+
+resource "aws_dynamodb_table" "asg_bindings" {
+  name         = "asg-bindings"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "asg_name"
+  range_key    = "instance_id"
+
+  attribute {
+    name = "asg_name"
+    type = "S"
+  }
+
+  attribute {
+    name = "instance_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "eni_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "ebs_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "availability_zone"
+    type = "S"
+  }
+
+  global_secondary_index {
+    name            = "eni_index"
+    hash_key        = "eni_id"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "ebs_index"
+    hash_key        = "ebs_id"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "az_index"
+    hash_key        = "asg_name"
+    range_key       = "availability_zone"
+    projection_type = "ALL"
+  }
+
+  tags = {
+    AsgName = local.asg_name
+  }
+}
+
+
+resource "aws_dynamodb_table" "asg_workflows" {
+  name         = "asg-workflows"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "workflow_key"
+
+  attribute {
+    name = "workflow_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    AsgName = local.asg_name
+  }
+}
+
+
+resource "aws_dynamodb_table" "asg_idempotency" {
+  name         = "asg-idempotency"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    AsgName = local.asg_name
+  }
+}
+
+
 resource "aws_iam_role" "example_lifecycle_role" {
   name = "example-lifecycle-role"
   assume_role_policy = <<EOF
@@ -351,7 +465,7 @@ resource "aws_autoscaling_lifecycle_hook" "data_launch_hook" {
   name                   = "asg-lifecyclehook-${aws_autoscaling_group.couchbase_data.name}_launch"
   lifecycle_transition   = "autoscaling:EC2_INSTANCE_LAUNCHING"
   default_result         = "CONTINUE"
-  heartbeat_timeout      = 1800
+  heartbeat_timeout      = 300
 
   notification_target_arn = "arn:aws:sns:us-east-1:911167901101:asg_launch"
   role_arn                = aws_iam_role.example_lifecycle_role.arn
@@ -362,7 +476,7 @@ resource "aws_autoscaling_lifecycle_hook" "data_termination_hook" {
   name                   = "asg-lifecyclehook-${aws_autoscaling_group.couchbase_data.name}_termination"
   lifecycle_transition   = "autoscaling:EC2_INSTANCE_TERMINATING"
   default_result         = "CONTINUE"
-  heartbeat_timeout      = 1800
+  heartbeat_timeout      = 300
 
   notification_target_arn = "arn:aws:sns:us-east-1:911167901101:asg_launch"
   role_arn                = aws_iam_role.example_lifecycle_role.arn
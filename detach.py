@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+
+import async_operations
+
+from aws_clients import get_client
+from readiness import (
+    ENI_TIMEOUT_SECONDS,
+    VOLUME_TIMEOUT_SECONDS,
+    ReadinessTimeout,
+    wait_for_enis_available,
+    wait_for_volumes_available,
+)
+
+logger = logging.getLogger()
+
+
+def detach_ebs_volume(instance_id, volume_id):
+    try:
+        response = get_client('ec2').detach_volume(
+            VolumeId=volume_id,
+            InstanceId=instance_id,
+            Force=True
+        )
+        logger.info(f"Successfully detached EBS volume {volume_id} from instance {instance_id}")
+        return response
+
+    except Exception as e:
+        raise Exception(f"Failed to detach EBS volume {volume_id} from instance {instance_id}. {e}")
+
+
+def detach_eni(instance_id, eni_id, attachment_id=None):
+
+    if not attachment_id:
+        attachment_id = get_attachment_id_from_eni(eni_id)
+    if not attachment_id:
+        return None
+    try:
+        response = get_client('ec2').detach_network_interface(
+                    AttachmentId=attachment_id,
+                    Force=True
+                )
+        logger.info(f"Successfully detached ENI  {eni_id} from instance {instance_id}")
+        return response
+    except Exception as e:
+        raise Exception(f"Failed to detach ENI {eni_id} from instance {instance_id}. {e}")
+
+
+def get_attachment_id_from_eni(eni_id):
+
+    try:
+        response = get_client('ec2').describe_network_interfaces(
+            NetworkInterfaceIds=[eni_id]
+        )
+
+        network_interface = response["NetworkInterfaces"][0]
+        attachment = network_interface.get("Attachment")
+
+        if attachment:
+            attachment_id = attachment.get("AttachmentId")
+            return attachment_id
+        else:
+            logger.info(f"No Attachment id found. ENI {eni_id} is not attached to any instance.")
+            return None
+    except Exception as e:
+        raise Exception(f"Failed to read ENI for attachment id {e}")
+
+
+def _detach_and_wait(resource, instance_id, on_wait):
+    started = time.monotonic()
+    if resource["type"] == "volume":
+        detach_ebs_volume(instance_id, resource["resource_id"])
+        detached = time.monotonic()
+        wait_for_volumes_available(get_client('ec2'), [resource["resource_id"]], timeout=VOLUME_TIMEOUT_SECONDS, on_wait=on_wait)
+    else:
+        detach_eni(instance_id, resource["resource_id"], resource.get("attachment_id"))
+        detached = time.monotonic()
+        wait_for_enis_available(get_client('ec2'), [resource["resource_id"]], timeout=ENI_TIMEOUT_SECONDS, on_wait=on_wait)
+    finished = time.monotonic()
+    return {"detach_seconds": detached - started, "available_seconds": finished - started}
+
+
+def detach_instance_resources(instance_id, eni_id=None, volume_id=None, attachment_id=None, on_wait=None):
+    """Detaches the ENI and the volume of an instance concurrently and returns once both
+    are available again, so callers only publish them to the pool when the next attach
+    can succeed. Returns one timing record per resource; raises ReadinessTimeout (or the
+    detach error) once both have finished if either of them failed."""
+    resources = []
+    if volume_id:
+        resources.append({"type": "volume", "resource_id": volume_id})
+    if eni_id:
+        resources.append({"type": "eni", "resource_id": eni_id, "attachment_id": attachment_id})
+    if not resources:
+        return []
+
+    # Both waiters call on_wait; renewing the lock or sending heartbeats twice at once is pointless.
+    on_wait_lock = threading.Lock()
+
+    def guarded_on_wait():
+        if on_wait and on_wait_lock.acquire(blocking=False):
+            try:
+                on_wait()
+            finally:
+                on_wait_lock.release()
+
+    runner = async_operations.runner()
+    if runner:
+        outcomes = runner.run(async_operations.gather_calls(
+            runner, [(_detach_and_wait, (resource, instance_id, guarded_on_wait)) for resource in resources]
+        ))
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(resources)) as pool:
+            futures = [pool.submit(_detach_and_wait, resource, instance_id, guarded_on_wait) for resource in resources]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append((future.result(), None))
+            except Exception as e:
+                outcomes.append((None, e))
+
+    reports = []
+    errors = []
+    for resource, (timings, error) in zip(resources, outcomes):
+        report = {"type": resource["type"], "resource_id": resource["resource_id"], "ok": True, "error": None}
+        if error is None:
+            report.update(timings)
+        else:
+            report.update(ok=False, error=f"{error}")
+            errors.append(error)
+        reports.append(report)
+        logger.info(
+            f"Detach of {resource['type']} {resource['resource_id']} from {instance_id}: "
+            + (f"detached in {report['detach_seconds']:.2f}s, available after {report['available_seconds']:.2f}s."
+               if report["ok"] else f"failed. {report['error']}")
+        )
+
+    for error in errors:
+        if isinstance(error, ReadinessTimeout):
+            raise error
+    if errors:
+        raise errors[0]
+    return reports
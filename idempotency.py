@@ -0,0 +1,163 @@
+"""Remembers which lifecycle events were handled, so redelivered SNS/SQS messages and
+Lambda retries return the stored outcome instead of running again.
+
+Events are keyed on their LifecycleActionToken (the RequestId of test notifications,
+the message id otherwise). A key is claimed before the event runs; a successful
+outcome is kept for IDEMPOTENCY_TTL_SECONDS, a failed one releases the claim so the
+retry runs. A claim left by a crashed invocation lapses with that invocation's
+deadline. IDEMPOTENCY_BACKEND=memory keeps the records in the process for local
+runs; "off" disables the cache.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+IDEMPOTENCY_BACKEND = os.environ.get("IDEMPOTENCY_BACKEND", "dynamodb")
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE", "asg-idempotency")
+# Lifecycle hooks time out within 48 hours; a day covers SNS and Lambda redeliveries.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# Claim lifetime when the invocation's deadline is unknown (the Lambda maximum).
+IN_PROGRESS_SECONDS = int(os.environ.get("IDEMPOTENCY_IN_PROGRESS_SECONDS", "900"))
+
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+
+def idempotency_key(record):
+    message = record.get("message") or {}
+    if message.get("LifecycleActionToken"):
+        return f"token#{message['LifecycleActionToken']}"
+    if message.get("RequestId"):
+        return f"request#{message['RequestId']}"
+    return f"message#{record['record_id']}"
+
+
+class MemoryIdempotencyStore:
+    """Process-local records; stand-in for the DynamoDB table in local runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def claim(self, key, expires_at):
+        # Returns None when the key is now ours, otherwise the record holding it.
+        with self._lock:
+            record = self._records.get(key)
+            if record and record["expires_at"] > time.time():
+                return dict(record)
+            self._records[key] = {"status": IN_PROGRESS, "response": None, "expires_at": expires_at}
+            return None
+
+    def complete(self, key, response, expires_at):
+        with self._lock:
+            self._records[key] = {"status": DONE, "response": response, "expires_at": expires_at}
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+
+class DynamoDbIdempotencyStore:
+    """Records keyed by `idempotency_key`, claimed with a conditional write; expired
+    items are removed by TTL."""
+
+    def __init__(self, client, table_name=IDEMPOTENCY_TABLE):
+        self.client = client
+        self.table_name = table_name
+
+    def claim(self, key, expires_at):
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "idempotency_key": {"S": key},
+                    "status": {"S": IN_PROGRESS},
+                    "expires_at": {"N": str(int(expires_at))},
+                },
+                ConditionExpression="attribute_not_exists(idempotency_key) OR expires_at < :now",
+                ExpressionAttributeValues={":now": {"N": str(int(time.time()))}},
+            )
+            return None
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+        item = self.client.get_item(
+            TableName=self.table_name,
+            Key={"idempotency_key": {"S": key}},
+            ConsistentRead=True,
+        ).get("Item")
+        if not item:
+            # Released between the two calls; the retry of the sender will claim it.
+            return {"status": IN_PROGRESS, "response": None, "expires_at": 0}
+        return {
+            "status": item["status"]["S"],
+            "response": json.loads(item["response"]["S"]) if "response" in item else None,
+            "expires_at": float(item["expires_at"]["N"]),
+        }
+
+    def complete(self, key, response, expires_at):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "idempotency_key": {"S": key},
+                "status": {"S": DONE},
+                "response": {"S": json.dumps(response, default=str)},
+                "expires_at": {"N": str(int(expires_at))},
+            },
+        )
+
+    def release(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={"idempotency_key": {"S": key}})
+
+
+_memory_store = MemoryIdempotencyStore()
+
+
+def get_idempotency_store():
+    if IDEMPOTENCY_BACKEND == "off":
+        return None
+    elif IDEMPOTENCY_BACKEND == "memory":
+        return _memory_store
+    elif IDEMPOTENCY_BACKEND == "dynamodb":
+        return DynamoDbIdempotencyStore(get_client("dynamodb"), IDEMPOTENCY_TABLE)
+    else:
+        raise Exception(f"Unknown idempotency backend {IDEMPOTENCY_BACKEND}.")
+
+
+def claim(store, key, remaining_ms=None):
+    """None if the caller should handle the event, otherwise the response to return
+    for the duplicate."""
+    if store is None:
+        return None
+    lifetime = remaining_ms / 1000 if remaining_ms is not None else IN_PROGRESS_SECONDS
+    try:
+        record = store.claim(key, time.time() + lifetime)
+    except Exception as e:
+        # Handling a duplicate is safe, just slow; never drop an event over the cache.
+        logger.warning(f"Failed to claim idempotency key {key}. {e}")
+        return None
+    if record is None:
+        return None
+    if record["status"] == DONE and record["response"] is not None:
+        logger.info(f"Event {key} was already handled; returning the stored result.")
+        return {**record["response"], "duplicate": True}
+    logger.info(f"Event {key} is being handled by another invocation.")
+    return {"statusCode": 200, "body": f"Duplicate of event {key}, which is still being handled.", "duplicate": True}
+
+
+def record_outcome(store, key, response):
+    if store is None:
+        return
+    try:
+        if response and response.get("statusCode", 500) < 400 and not response.get("deferred"):
+            store.complete(key, response, time.time() + IDEMPOTENCY_TTL_SECONDS)
+        else:
+            store.release(key)
+    except Exception as e:
+        logger.warning(f"Failed to record the outcome of event {key}. {e}")
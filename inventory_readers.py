@@ -0,0 +1,138 @@
+import logging
+import os
+
+logger = logging.getLogger()
+
+PAGE_SIZE = int(os.environ.get("INVENTORY_PAGE_SIZE", "200"))
+
+# Allowed MaxResults/MaxRecords range of each describe call.
+PAGE_LIMITS = {
+    "describe_network_interfaces": (5, 1000),
+    "describe_volumes": (5, 500),
+    "describe_instances": (5, 1000),
+    "describe_auto_scaling_groups": (1, 100),
+}
+
+# EC2 accepts at most 200 values per filter.
+FILTER_VALUES_LIMIT = 200
+
+
+def iter_pages(client, operation, page_size=PAGE_SIZE, **kwargs):
+    low, high = PAGE_LIMITS[operation]
+    paginator = client.get_paginator(operation)
+    page_count = 0
+    for page in paginator.paginate(PaginationConfig={"PageSize": max(low, min(page_size, high))}, **kwargs):
+        page_count += 1
+        yield page
+    logger.info(f"{operation} read {page_count} page(s).")
+
+
+def _take(records, limit):
+    # Stops pulling pages as soon as `limit` records have been produced.
+    if limit is None:
+        yield from records
+        return
+    if limit <= 0:
+        return
+    for count, record in enumerate(records, start=1):
+        yield record
+        if count >= limit:
+            return
+
+
+def shape_eni(eni):
+    attachment = eni.get("Attachment")
+    return {
+        'eni_id': eni['NetworkInterfaceId'],
+        'subnet_id': eni['SubnetId'],
+        'vpc_id': eni['VpcId'],
+        'status': eni['Status'],
+        'availability_zone': eni['AvailabilityZone'],
+        'instance_id': attachment.get('InstanceId') if attachment else None,
+        'private_ips': [ip['PrivateIpAddress'] for ip in eni.get('PrivateIpAddresses', [])]
+    }
+
+
+def shape_volume(volume):
+    return {
+        'VolumeId': volume.get('VolumeId'),
+        'AvailabilityZone': volume.get('AvailabilityZone')
+    }
+
+
+def shape_instance(instance):
+    network_interfaces = []
+    for eni in instance.get("NetworkInterfaces", []):
+        network_interfaces.append({
+            "NetworkInterfaceId": eni["NetworkInterfaceId"],
+            "PrivateIpAddress": eni.get("PrivateIpAddress"),
+            "Status": eni.get("Status")
+        })
+    return {
+        "InstanceId": instance["InstanceId"],
+        "SubnetId": instance["SubnetId"],
+        "AvailabilityZone": instance["Placement"]["AvailabilityZone"],
+        "NetworkInterfaces": network_interfaces
+    }
+
+
+def iter_network_interfaces(ec2_client, asg_name, status="available", availability_zone=None, subnet_id=None, limit=None, page_size=PAGE_SIZE):
+    filters = [{'Name': 'tag:AutoscaleGroup', 'Values': [asg_name]}]
+    if status:
+        filters.append({'Name': 'status', 'Values': [status]})
+    if availability_zone:
+        filters.append({'Name': 'availability-zone', 'Values': [availability_zone]})
+    if subnet_id:
+        filters.append({'Name': 'subnet-id', 'Values': [subnet_id]})
+
+    def records():
+        for page in iter_pages(ec2_client, "describe_network_interfaces", page_size, Filters=filters):
+            for eni in page.get('NetworkInterfaces', []):
+                yield shape_eni(eni)
+
+    return _take(records(), limit)
+
+
+def iter_ebs_volumes(ec2_client, tag_key, tag_value, status="available", availability_zone=None, limit=None, page_size=PAGE_SIZE):
+    filters = [{'Name': 'tag:' + tag_key, 'Values': [tag_value]}]
+    if status:
+        filters.append({'Name': 'tag:Status', 'Values': [status]})
+    if availability_zone:
+        filters.append({'Name': 'availability-zone', 'Values': [availability_zone]})
+
+    def records():
+        for page in iter_pages(ec2_client, "describe_volumes", page_size, Filters=filters):
+            for volume in page.get('Volumes', []):
+                yield shape_volume(volume)
+
+    return _take(records(), limit)
+
+
+def iter_instances(ec2_client, instance_ids, page_size=PAGE_SIZE):
+    # InstanceIds cannot be combined with MaxResults, so the ids go through an
+    # instance-id filter in chunks instead.
+    instance_ids = list(instance_ids)
+    for start in range(0, len(instance_ids), FILTER_VALUES_LIMIT):
+        chunk = instance_ids[start:start + FILTER_VALUES_LIMIT]
+        filters = [{'Name': 'instance-id', 'Values': chunk}]
+        for page in iter_pages(ec2_client, "describe_instances", page_size, Filters=filters):
+            for reservation in page.get("Reservations", []):
+                yield from reservation.get("Instances", [])
+
+
+def iter_instance_details(ec2_client, instance_ids, include=None, limit=None, page_size=PAGE_SIZE):
+    def records():
+        for instance in iter_instances(ec2_client, instance_ids, page_size):
+            if include and not include(instance.get("Tags") or []):
+                continue
+            yield shape_instance(instance)
+
+    return _take(records(), limit)
+
+
+def iter_asg_instance_ids(autoscaling_client, asg_name, lifecycle_state="InService", page_size=PAGE_SIZE):
+    for page in iter_pages(autoscaling_client, "describe_auto_scaling_groups", page_size, AutoScalingGroupNames=[asg_name]):
+        for asg in page.get("AutoScalingGroups", []):
+            for instance in asg.get("Instances", []):
+                if lifecycle_state is None or instance.get("LifecycleState") == lifecycle_state:
+                    yield instance["InstanceId"]
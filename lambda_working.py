@@ -1,12 +1,9 @@
-import boto3
 import json
 import logging
 from collections import defaultdict
 
-
-# Initialize boto3 clients for EC2 and Auto Scaling
-ec2_client = boto3.client('ec2')
-autoscaling_client = boto3.client('autoscaling')
+from aws_clients import get_client
+from log_utils import payload
 
 # Setup logging for debugging
 logger = logging.getLogger()
@@ -14,11 +11,11 @@ logger.setLevel(logging.INFO)
 
 # Lambda handler
 def lambda_handler(event, context):
-    logger.info(f"Event: {json.dumps(event)}")
+    logger.info("Event: %s", payload(event))
     
     # Get the details of the Auto Scaling lifecycle hook event
     lifecycle_event_Records = event.get('Records', {})
-    logger.info(f"Records: {lifecycle_event_Records}")
+    logger.info("Records: %s", payload(lifecycle_event_Records))
     if len(lifecycle_event_Records) != 0:
         lifecycle_event_string = lifecycle_event_Records[0].get("Sns", {}).get("Message")
         lifecycle_event = json.loads(lifecycle_event_string)
@@ -28,7 +25,7 @@ def lambda_handler(event, context):
             "body": "No event records found."
         } 
     
-    logger.info(f"Message: {lifecycle_event}")
+    logger.info("Message: %s", payload(lifecycle_event))
     lifecycle_action_token = lifecycle_event.get('LifecycleActionToken')
     auto_scaling_group_name = lifecycle_event.get('AutoScalingGroupName')
     instance_id = lifecycle_event.get('EC2InstanceId')
@@ -67,7 +64,7 @@ def handle__new_provision(event):
 
     logger.info(f"Autoscaling group name: {auto_scaling_group_name}")
     interfaces = get_networkinterfaces(auto_scaling_group_name)
-    logger.info(f"Available Intarfaces: {interfaces}")
+    logger.info("Available Intarfaces: %s", payload(interfaces))
     logger.info(f"Fetching the information of all EC2 instances created as part of Autoscaling group: {auto_scaling_group_name}")
 
     instance_details = get_instances_in_asg(auto_scaling_group_name, instance_id)
@@ -76,16 +73,16 @@ def handle__new_provision(event):
             "statusCode": 200,
             "body": f"No instances found in Auto Scaling Group to be handled: {auto_scaling_group_name}"
         }
-    logger.info(f"Instance details are below: {instance_details}")
+    logger.info("Instance details are below: %s", payload(instance_details))
     ec2_subnet_mapping = map_ec2_subnet(interfaces, instance_details)
-    logger.info(f"Mapping of EC2 & Subnet: {ec2_subnet_mapping}")
+    logger.info("Mapping of EC2 & Subnet: %s", payload(ec2_subnet_mapping))
 
     #Get the details of EBS volume.
     ebs_data = get_ebs_volumes_with_tag("AsgName", auto_scaling_group_name)
-    logger.info(f"Available EBS volumes: {ebs_data}")
+    logger.info("Available EBS volumes: %s", payload(ebs_data))
 
     ec2_subnet_mapping = distribute_ebs_volumes_to_ec2(ec2_subnet_mapping, ebs_data)
-    logger.info(f"Final Data with EBS volume mapping: {ec2_subnet_mapping}")
+    logger.info("Final Data with EBS volume mapping: %s", payload(ec2_subnet_mapping))
 
     for item in ec2_subnet_mapping:
         try:
@@ -96,7 +93,7 @@ def handle__new_provision(event):
             
             logger.info(f"Attaching eni id {eni_id} to {ec2_id}")
             
-            response = ec2_client.attach_network_interface(
+            response = get_client('ec2').attach_network_interface(
                     NetworkInterfaceId=eni_id,
                     InstanceId=ec2_id,
                     DeviceIndex=1
@@ -126,7 +123,7 @@ def handle__new_provision(event):
             tag_eni(eni_id, tags_others)
             tag_ebs(volume_id, tags_others)
 
-            logger.info(f"Adding network interface tags {tags}")
+            logger.debug("Adding network interface tags %s", payload(tags))
 
             final_tag_ec2s(ec2_id, tags)
 
@@ -153,7 +150,7 @@ def handle__new_provision(event):
     try:
         for item in ec2_subnet_mapping:
             ec2_id = item.get("InstanceId")
-            logger.info(f"Adding final EC2 tags {tags}")
+            logger.debug("Adding final EC2 tags %s", payload(tags))
             final_tag_ec2s(ec2_id, tags)
             logger.info(f"Successfully added final EC2 tags.")
     except Exception as e:
@@ -170,25 +167,25 @@ def handle__new_provision(event):
 
 def tag_eni(id, tags):
     try:
-        response = ec2_client.create_tags(Resources=[id], Tags=tags)
-        logger.info(f"Successfully tagged. ENI {id} with tags {tags}")
+        response = get_client('ec2').create_tags(Resources=[id], Tags=tags)
+        logger.info("Successfully tagged. ENI %s with tags %s", id, payload(tags))
         return response
     except Exception as e:
-        logger.error(f"Error in tagging ENI with id {id} with tags {tags}")
-        raise Exception(f"Error in tagging ENI with id {id} with tags {tags}")
+        logger.error("Error in tagging ENI with id %s with tags %s", id, payload(tags))
+        raise Exception(f"Error in tagging ENI with id {id} with tags {payload(tags)}")
 
 def tag_ebs(id, tags):
     try:
-        response = ec2_client.create_tags(Resources=[id], Tags=tags)
-        logger.info(f"Successfully tagged. EBS {id} with tags {tags}")
+        response = get_client('ec2').create_tags(Resources=[id], Tags=tags)
+        logger.info("Successfully tagged. EBS %s with tags %s", id, payload(tags))
         return response
     except Exception as e:
-        logger.error(f"Error in tagging EBS with id {id} with tags {tags}")
-        raise Exception(f"Error in tagging EBS with id {id} with tags {tags}")
+        logger.error("Error in tagging EBS with id %s with tags %s", id, payload(tags))
+        raise Exception(f"Error in tagging EBS with id {id} with tags {payload(tags)}")
 
 def final_tag_ec2s(instance_id, tags):
     try:
-        response = ec2_client.create_tags(
+        response = get_client('ec2').create_tags(
             Resources=[instance_id],
             Tags=tags
          )
@@ -196,7 +193,7 @@ def final_tag_ec2s(instance_id, tags):
         return response
 
     except Exception as e:
-        raise Exception(f"Exception during tagging. {tags}")
+        raise Exception(f"Exception during tagging. {payload(tags)}")
 
 
 def get_networkinterfaces(ags_name):
@@ -211,9 +208,9 @@ def get_networkinterfaces(ags_name):
                 'Values': ["available"]        
             }
         ]    
-    logger.info(f"filters: {filters}")
-    response = ec2_client.describe_network_interfaces(Filters=filters)
-    logger.info(f"All interfaces:{response}")
+    logger.debug("filters: %s", payload(filters))
+    response = get_client('ec2').describe_network_interfaces(Filters=filters)
+    logger.info("All interfaces: %s", payload(response))
     network_interfaces = response['NetworkInterfaces']
 
     eni_details = []
@@ -262,17 +259,17 @@ def get_instances_in_asg(asg_name, instance_identifier):
         instance_id.append(instance_identifier)
     else:
         try:
-            response = autoscaling_client.describe_auto_scaling_groups(
+            response = get_client('autoscaling').describe_auto_scaling_groups(
                 AutoScalingGroupNames=[asg_name]
             )
-            logger.info(f"Response of Autoscaling group: {response}")
+            logger.info("Response of Autoscaling group: %s", payload(response))
             instance_ids = []
             for asg in response.get("AutoScalingGroups", []):
                 for instance in asg.get("Instances", []):
                     if instance.get("LifecycleState") == "InService":
                         instance_ids.append(instance["InstanceId"])
         
-            logger.info(f"Instance ids are: {instance_ids}")
+            logger.info("Instance ids are: %s", payload(instance_ids))
             instance_details = get_instance_details(instance_ids)
 
             return instance_details
@@ -309,15 +306,15 @@ def get_instance_details(instance_ids):
                 'Name': 'Status',
                 'Value': 'available'
             }
-        response = ec2_client.describe_instances(
+        response = get_client('ec2').describe_instances(
             InstanceIds=instance_ids )
             
-        logger.info(f"Response of read instance: {response}")
+        logger.info("Response of read instance: %s", payload(response))
         instance_details = []
         for reservation in response.get("Reservations", []):
             for instance in reservation.get("Instances", []):
                 tags = instance.get("Tags")
-                logger.info(f"Available tags of EC2: {tags}")
+                logger.debug("Available tags of EC2: %s", payload(tags))
                 if not filter_tags(tags, filter):
                     continue
                 else:
@@ -375,7 +372,7 @@ def map_ec2_subnet(subnet_data, ec2_data):
 
 def get_ebs_volumes_with_tag(tag_key, tag_value):
     try:
-        response = ec2_client.describe_volumes(
+        response = get_client('ec2').describe_volumes(
             Filters=[
                 {
                     'Name': 'tag:' + tag_key,
@@ -440,7 +437,7 @@ def attach_ebs_volumes_to_ec2(instance_id, volume_id):
     # volume_id = ec2_instance.get("AssignedVolumeId")
     try:
         logger.info(f"Attaching volume {volume_id} to instance {instance_id}.")
-        response = ec2_client.attach_volume(
+        response = get_client('ec2').attach_volume(
             VolumeId=volume_id,
             InstanceId=instance_id,
             Device='/dev/xvdf'
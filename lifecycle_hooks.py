@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+import async_operations
+import metrics
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+# Must stay well below heartbeat_timeout of the hooks in cluster1.tf.
+HEARTBEAT_INTERVAL_SECONDS = float(os.environ.get("LIFECYCLE_HEARTBEAT_INTERVAL_SECONDS", "60"))
+
+
+def _parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value.replace("Z", "+0000"), "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+    except ValueError:
+        try:
+            return datetime.strptime(value.replace("Z", "+0000"), "%Y-%m-%dT%H:%M:%S%z").timestamp()
+        except ValueError:
+            return None
+
+
+class LifecycleAction:
+    """One pending lifecycle action: sends throttled heartbeats while the handler
+    waits, completes (or abandons) exactly once and logs how long the hook took."""
+
+    def __init__(self, asg_name, hook_name, token, instance_id=None, transition=None, event_time=None,
+                 autoscaling_client=None, heartbeat_interval=HEARTBEAT_INTERVAL_SECONDS):
+        self.asg_name = asg_name
+        self.hook_name = hook_name
+        self.token = token
+        self.instance_id = instance_id
+        self.transition = transition
+        self.event_time = event_time
+        self.heartbeat_interval = heartbeat_interval
+        self.autoscaling_client = autoscaling_client
+        self.started = time.monotonic()
+        self.last_heartbeat = self.started
+        self.heartbeats = 0
+        self.result = None
+        self.reason = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_message(cls, message, **kwargs):
+        return cls(
+            message.get("AutoScalingGroupName"),
+            message.get("LifecycleHookName"),
+            message.get("LifecycleActionToken"),
+            instance_id=message.get("EC2InstanceId"),
+            transition=message.get("LifecycleTransition"),
+            event_time=_parse_time(message.get("Time")),
+            **kwargs
+        )
+
+    @property
+    def client(self):
+        return self.autoscaling_client or get_client("autoscaling")
+
+    @property
+    def pending(self):
+        return self.result is None and bool(self.hook_name and self.token)
+
+    def heartbeat(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not self.pending or (not force and now - self.last_heartbeat < self.heartbeat_interval):
+                return False
+            self.last_heartbeat = now
+        try:
+            self.client.record_lifecycle_action_heartbeat(
+                AutoScalingGroupName=self.asg_name,
+                LifecycleHookName=self.hook_name,
+                LifecycleActionToken=self.token,
+            )
+            self.heartbeats += 1
+            return True
+        except Exception as e:
+            logger.warning(f"Heartbeat for lifecycle hook {self.hook_name} of {self.instance_id} failed. {e}")
+            return False
+
+    def complete(self, result="CONTINUE", reason=None):
+        with self._lock:
+            if not self.pending:
+                return False
+            self.result = result
+            self.reason = reason
+        try:
+            self.client.complete_lifecycle_action(
+                AutoScalingGroupName=self.asg_name,
+                LifecycleHookName=self.hook_name,
+                LifecycleActionToken=self.token,
+                LifecycleActionResult=result,
+            )
+        except Exception as e:
+            logger.error(f"Error completing lifecycle hook {self.hook_name} of {self.instance_id} with {result}. {e}")
+            return False
+        finally:
+            timing = self.timing()
+            logger.info(f"Lifecycle hook timing: {json.dumps(timing)}")
+            metrics.put("LifecycleHookHandlerTime", timing["handler_seconds"] * 1000)
+            if timing["since_event_seconds"] is not None:
+                metrics.put("LifecycleHookLatency", timing["since_event_seconds"] * 1000)
+        return True
+
+    def abandon(self, reason):
+        logger.error(f"Abandoning lifecycle hook {self.hook_name} of {self.instance_id}. {reason}")
+        return self.complete("ABANDON", reason)
+
+    def timing(self):
+        return {
+            "asg_name": self.asg_name,
+            "hook_name": self.hook_name,
+            "instance_id": self.instance_id,
+            "transition": self.transition,
+            "result": self.result,
+            "reason": self.reason,
+            "handler_seconds": round(time.monotonic() - self.started, 3),
+            "since_event_seconds": round(time.time() - self.event_time, 3) if self.event_time else None,
+            "heartbeats": self.heartbeats,
+        }
+
+
+def heartbeat_all(actions):
+    for action in (actions or {}).values():
+        action.heartbeat()
+
+
+def complete_pending(actions, instance_id, result="CONTINUE", reason=None):
+    action = (actions or {}).get(instance_id)
+    if action is not None:
+        return action.complete(result, reason)
+    return False
+
+
+def complete_many(actions, instance_ids, result="CONTINUE", reason=None):
+    pending = [actions[instance_id] for instance_id in instance_ids if instance_id in (actions or {})]
+    runner = async_operations.runner()
+    if runner and len(pending) > 1:
+        return runner.run(async_operations.complete_actions(runner, pending, result, reason))
+    return [action.complete(result, reason) for action in pending]
@@ -0,0 +1,64 @@
+import json
+import logging
+
+logger = logging.getLogger()
+
+TERMINATING = "autoscaling:EC2_INSTANCE_TERMINATING"
+LAUNCHING = "autoscaling:EC2_INSTANCE_LAUNCHING"
+
+# Terminations free ENIs and volumes that launches in the same batch can reuse.
+TRANSITION_ORDER = {TERMINATING: 0, LAUNCHING: 1}
+
+
+def is_sqs_event(event):
+    return any(record.get("eventSource") == "aws:sqs" for record in event.get("Records", []))
+
+
+def _record_body(record, index):
+    if record.get("eventSource") == "aws:sqs":
+        record_id = record.get("messageId") or str(index)
+        body = json.loads(record.get("body") or "{}")
+        # SNS -> SQS subscriptions without raw delivery wrap the message in an SNS envelope.
+        if body.get("Type") == "Notification" and "Message" in body:
+            body = json.loads(body["Message"])
+        return record_id, body
+
+    sns = record.get("Sns", {})
+    record_id = sns.get("MessageId") or str(index)
+    return record_id, json.loads(sns.get("Message") or "{}")
+
+
+def parse_lifecycle_records(event):
+    records = []
+    for index, record in enumerate(event.get("Records", [])):
+        try:
+            record_id, message = _record_body(record, index)
+            error = None
+        except Exception as e:
+            record_id = record.get("messageId") or record.get("Sns", {}).get("MessageId") or str(index)
+            message = {}
+            error = f"Unable to parse record {record_id}. {e}"
+            logger.error(error)
+
+        records.append({
+            "record_id": record_id,
+            "message": message,
+            "error": error,
+            "asg_name": message.get("AutoScalingGroupName"),
+            "instance_id": message.get("EC2InstanceId"),
+            "transition": message.get("LifecycleTransition"),
+            "hook_name": message.get("LifecycleHookName"),
+            "token": message.get("LifecycleActionToken"),
+        })
+    return records
+
+
+def group_lifecycle_records(records):
+    # Groups valid records by (ASG, transition). Terminations come before launches so a
+    # replacement can pick up the resources of the node it replaces in the same batch.
+    groups = {}
+    for record in records:
+        if record["error"] or not record["asg_name"]:
+            continue
+        groups.setdefault((record["asg_name"], record["transition"]), []).append(record)
+    return dict(sorted(groups.items(), key=lambda item: (item[0][0], TRANSITION_ORDER.get(item[0][1], 2))))
@@ -0,0 +1,274 @@
+"""Lifecycle-storm load test: many LAUNCHING/TERMINATING messages within seconds,
+handled by concurrent lambda_handler invocations against aws_simulator.
+
+Storms are generated (a rolling instance refresh or the loss of one AZ) or replayed
+from a recording: JSON lines holding SNS records, SQS records or bare lifecycle
+messages, spaced by their "Time". Instance ids of a recording are mapped onto the
+simulated cluster. The report has the convergence time, handler latency, ASG lock
+waits, API calls per event and failures:
+
+    python lifecycle_storm.py --nodes 30 --storm refresh --events 10 --workers 8
+    python lifecycle_storm.py --nodes 30 --storm az-outage --az us-east-1a --batch-size 10
+    python lifecycle_storm.py --nodes 30 --replay storm.jsonl --speed 10 --output storm_report.json
+"""
+import argparse
+import json
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from aws_simulator import AVAILABILITY_ZONES, SimulatedAws
+
+LAUNCHING = "autoscaling:EC2_INSTANCE_LAUNCHING"
+TERMINATING = "autoscaling:EC2_INSTANCE_TERMINATING"
+
+
+def refresh_storm(sim, asg_name, count, interval=1.0, gap=0.2):
+    """Rolling refresh: every `interval` seconds a replacement launches in the AZ of an
+    old instance, which starts terminating `gap` seconds later."""
+    steps = []
+    for index, instance_id in enumerate(list(sim.asgs[asg_name]["instances"])[:count]):
+        at = index * interval
+        steps.append({"at": at, "transition": LAUNCHING, "availability_zone": sim.instances[instance_id]["az"]})
+        steps.append({"at": at + gap, "transition": TERMINATING, "instance_id": instance_id})
+    return steps
+
+
+def az_outage_storm(sim, asg_name, availability_zone, spread=2.0):
+    """Every instance of one AZ terminates within `spread` seconds; the replacements
+    launch in the other AZs at the same time."""
+    victims = [instance_id for instance_id in sim.asgs[asg_name]["instances"] if sim.instances[instance_id]["az"] == availability_zone]
+    others = [az for az in sorted(sim.asgs[asg_name]["subnets"]) if az != availability_zone]
+    steps = []
+    for index, instance_id in enumerate(victims):
+        at = spread * index / max(len(victims), 1)
+        steps.append({"at": at, "transition": TERMINATING, "instance_id": instance_id})
+        steps.append({"at": at, "transition": LAUNCHING, "availability_zone": others[index % len(others)]})
+    return steps
+
+
+def _recorded_message(line):
+    record = json.loads(line)
+    if "Sns" in record:
+        return json.loads(record["Sns"]["Message"])
+    if "body" in record:
+        body = json.loads(record["body"])
+        return json.loads(body["Message"]) if "Message" in body and "Type" in body else body
+    return record
+
+
+def _recorded_time(message):
+    value = (message.get("Time") or "").replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def replay_storm(sim, asg_name, path, speed=1.0):
+    """Steps of a recorded stream. Terminating instances are mapped to simulated
+    ones (round-robin over the AZs), launches start new simulated instances."""
+    with open(path) as recording:
+        messages = [_recorded_message(line) for line in recording if line.strip()]
+    messages = [message for message in messages if message.get("LifecycleTransition") in (LAUNCHING, TERMINATING)]
+    times = [_recorded_time(message) for message in messages]
+    start = min((t for t in times if t is not None), default=None)
+
+    by_az = {}
+    for instance_id in sim.asgs[asg_name]["instances"]:
+        by_az.setdefault(sim.instances[instance_id]["az"], []).append(instance_id)
+    mapped = {}
+    steps = []
+    for index, (message, recorded_at) in enumerate(zip(messages, times)):
+        at = (recorded_at - start) / speed if recorded_at is not None and start is not None else index * 0.1
+        details = message.get("Details") or {}
+        if message["LifecycleTransition"] == TERMINATING:
+            original = message.get("EC2InstanceId")
+            if original not in mapped:
+                azs = [az for az in sorted(by_az) if by_az[az]]
+                if not azs:
+                    continue
+                availability_zone = details.get("Availability Zone")
+                if availability_zone not in azs:
+                    availability_zone = azs[len(mapped) % len(azs)]
+                mapped[original] = by_az[availability_zone].pop(0)
+            steps.append({"at": at, "transition": TERMINATING, "instance_id": mapped[original]})
+        else:
+            availability_zone = details.get("Availability Zone")
+            if availability_zone not in sim.asgs[asg_name]["subnets"]:
+                availability_zone = None
+            steps.append({"at": at, "transition": LAUNCHING, "availability_zone": availability_zone})
+    return sorted(steps, key=lambda step: step["at"])
+
+
+def _percentiles(values):
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": round(statistics.median(values), 3),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def run_storm(sim, asg_name, steps, workers=8, batch_size=1, batch_window=0.0, settle_timeout=120.0):
+    """Feeds the steps to `workers` concurrent invocations of lambda_handler, one SNS
+    message each or SQS batches of up to `batch_size`, and waits until every running
+    instance of the ASG has its ENI and volume (or `settle_timeout` passes)."""
+    import asg_lock
+    import asg_operations
+
+    pending = queue.Queue()
+    latencies = []
+    failures = []
+    results_lock = threading.Lock()
+
+    def worker():
+        while True:
+            messages = pending.get()
+            if messages is None:
+                return
+            event = sim.sqs_event(*messages) if batch_size > 1 else sim.sns_event(*messages)
+            started = time.perf_counter()
+            try:
+                response = asg_operations.lambda_handler(event, None)
+                failed = [item["itemIdentifier"] for item in response.get("batchItemFailures", [])]
+                if response.get("statusCode", 500) >= 400 and not failed:
+                    failed = [response.get("body")]
+            except Exception as e:
+                failed = [f"{type(e).__name__}: {e}"]
+            with results_lock:
+                latencies.append(time.perf_counter() - started)
+                failures.extend(failed)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    started = time.monotonic()
+    batch = []
+    for step in steps:
+        delay = started + step["at"] - time.monotonic()
+        if batch and (delay > batch_window or len(batch) >= batch_size):
+            pending.put(batch)
+            batch = []
+        if delay > 0:
+            time.sleep(delay)
+        if step["transition"] == LAUNCHING:
+            message = sim.launch_instance(asg_name, step.get("availability_zone"))
+        else:
+            message = sim.terminate_instance(step["instance_id"])
+        batch.append(message)
+        if len(batch) >= batch_size:
+            pending.put(batch)
+            batch = []
+    if batch:
+        pending.put(batch)
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    handled = time.monotonic()
+
+    # Instances that came up without resources only converge if a later event places them.
+    while sim.unprovisioned_instances(asg_name) and time.monotonic() - handled < settle_timeout:
+        time.sleep(0.1)
+    converged = time.monotonic()
+    unprovisioned = sim.unprovisioned_instances(asg_name)
+
+    actions = list(sim.lifecycle_actions.values())
+    lock_waits = asg_lock.get_lock_backend().waits.get(f"asg_lock#{asg_name}", []) if asg_lock.LOCK_BACKEND == "memory" else []
+    api_calls = sum(sim.calls.values())
+    return {
+        "events": len(steps),
+        "invocations": len(latencies),
+        "workers": workers,
+        "batch_size": batch_size,
+        "convergence_seconds": round(converged - started, 3) if not unprovisioned else None,
+        "handled_seconds": round(handled - started, 3),
+        "handler_seconds": _percentiles(latencies),
+        "lock_wait_seconds": _percentiles(lock_waits),
+        "api_calls": api_calls,
+        "api_calls_per_event": round(api_calls / max(len(steps), 1), 1),
+        "api_calls_by_operation": dict(sorted(sim.calls.items(), key=lambda item: -item[1])),
+        "throttled": sim.throttled,
+        "failures": {
+            "invocations": len(failures),
+            "abandoned_hooks": sum(1 for action in actions if action["result"] == "ABANDON"),
+            "uncompleted_hooks": sum(1 for action in actions if action["result"] is None),
+            "unprovisioned_instances": len(unprovisioned),
+        },
+        "failure_samples": failures[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=30)
+    parser.add_argument("--storm", choices=["refresh", "az-outage"], default="refresh")
+    parser.add_argument("--events", type=int, default=10, help="instances replaced by a refresh storm")
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between replacements of a refresh storm")
+    parser.add_argument("--az", default=AVAILABILITY_ZONES[0], help="AZ lost in an az-outage storm")
+    parser.add_argument("--replay", help="JSON lines of recorded lifecycle messages")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent handler invocations")
+    parser.add_argument("--batch-size", type=int, default=1, help="messages per invocation (SQS batches when > 1)")
+    parser.add_argument("--batch-window", type=float, default=0.5, help="seconds an SQS batch waits to fill up")
+    parser.add_argument("--time-scale", type=float, default=0.2, help="see aws_simulator")
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--settle-timeout", type=float, default=30.0, help="seconds to wait for convergence after the last handler")
+    parser.add_argument("--output", help="write the report as JSON")
+    options = parser.parse_args()
+
+    # The handlers read these when they are imported.
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["ASG_LOCK_BACKEND"] = "memory"
+    os.environ["BINDING_STORE_BACKEND"] = "sqlite"
+    directory = tempfile.mkdtemp()
+    os.environ["BINDING_STORE_PATH"] = os.path.join(directory, "bindings.sqlite3")
+    os.environ["CHECKPOINT_BACKEND"] = "file"
+    os.environ["IDEMPOTENCY_BACKEND"] = "memory"
+    os.environ["CHECKPOINT_DIR"] = os.path.join(directory, "checkpoints")
+    os.environ.setdefault("METRICS_MODE", "off")
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+    sim = SimulatedAws(time_scale=options.time_scale, throttle_rate=options.throttle_rate, seed=options.seed)
+    asg_name = sim.create_cluster("asg-storm", options.nodes)
+    with sim:
+        import asg_operations
+
+        # Start from a provisioned cluster; only the storm is measured.
+        asg_operations.lambda_handler(sim.test_notification_event(asg_name), None)
+        sim.settle()
+        sim.calls.clear()
+        sim.throttled = 0
+        import asg_lock
+        asg_lock.get_lock_backend().waits.clear()
+
+        if options.replay:
+            steps = replay_storm(sim, asg_name, options.replay, options.speed)
+        elif options.storm == "az-outage":
+            steps = az_outage_storm(sim, asg_name, options.az)
+        else:
+            steps = refresh_storm(sim, asg_name, options.events, options.interval)
+        report = run_storm(sim, asg_name, steps, options.workers, options.batch_size, options.batch_window,
+                           options.settle_timeout)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    if options.output:
+        with open(options.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
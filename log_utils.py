@@ -0,0 +1,94 @@
+"""Lazily formatted, size-bounded log payloads.
+
+    logger.info("Instance details: %s", payload(instance_details))
+
+Nothing is formatted unless the record is emitted. By default long lists are
+summarized to their length and the IDs of their first items, and every payload is
+cut to LOG_PAYLOAD_MAX_BYTES. LOG_PAYLOADS=full logs the complete payloads.
+"""
+import json
+import os
+
+LOG_PAYLOADS = os.environ.get("LOG_PAYLOADS", "summary")
+LOG_PAYLOAD_MAX_BYTES = int(os.environ.get("LOG_PAYLOAD_MAX_BYTES", "2048"))
+# Lists longer than this are replaced by {"count": ..., "ids": [...]}.
+LOG_PAYLOAD_MAX_ITEMS = int(os.environ.get("LOG_PAYLOAD_MAX_ITEMS", "5"))
+
+ID_KEYS = (
+    "InstanceId",
+    "NetworkInterfaceId",
+    "VolumeId",
+    "AutoScalingGroupName",
+    "SubnetId",
+    "ReservationId",
+    "instance_id",
+    "eni_id",
+    "volume_id",
+    "resource_id",
+    "messageId",
+    "MessageId",
+)
+# Response metadata is never worth its bytes in a summary.
+DROPPED_KEYS = ("ResponseMetadata",)
+
+
+def _item_id(item):
+    if isinstance(item, dict):
+        for key in ID_KEYS:
+            if item.get(key):
+                return item[key]
+    elif isinstance(item, str):
+        return item
+    return None
+
+
+def summarize(value, max_items=LOG_PAYLOAD_MAX_ITEMS):
+    if isinstance(value, dict):
+        return {key: summarize(item, max_items) for key, item in value.items() if key not in DROPPED_KEYS}
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        if len(items) <= max_items:
+            return [summarize(item, max_items) for item in items]
+        ids = [item_id for item_id in map(_item_id, items) if item_id is not None]
+        if ids:
+            return {"count": len(items), "ids": ids[:max_items * 4]}
+        return {"count": len(items), "first": [summarize(item, max_items) for item in items[:max_items]]}
+    return value
+
+
+def _truncate(text, max_bytes):
+    # Cuts to at most max_bytes of UTF-8 without splitting a multi-byte character.
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", "ignore")
+
+
+def format_payload(value, mode=None, max_bytes=None):
+    mode = mode or LOG_PAYLOADS
+    if mode == "full":
+        return json.dumps(value, default=str)
+
+    max_bytes = max_bytes or LOG_PAYLOAD_MAX_BYTES
+    text = json.dumps(summarize(value), default=str)
+    size = len(text.encode("utf-8"))
+    if size > max_bytes:
+        text = f"{_truncate(text, max_bytes)}... ({size} bytes, LOG_PAYLOADS=full for all of it)"
+    return text
+
+
+class Payload:
+    # Formats on str(), i.e. only when the logging record is actually emitted.
+    __slots__ = ("value", "mode", "max_bytes")
+
+    def __init__(self, value, mode=None, max_bytes=None):
+        self.value = value
+        self.mode = mode
+        self.max_bytes = max_bytes
+
+    def __str__(self):
+        try:
+            return format_payload(self.value, self.mode, self.max_bytes)
+        except Exception:
+            return _truncate(repr(self.value), self.max_bytes or LOG_PAYLOAD_MAX_BYTES)
+
+
+def payload(value, mode=None, max_bytes=None):
+    return Payload(value, mode, max_bytes)
@@ -0,0 +1,140 @@
+"""Phase timings of one invocation, emitted as CloudWatch Embedded Metric Format.
+
+    with metrics.invocation():
+        metrics.set_dimensions(asg_name, transition)
+        with metrics.span("InventoryLoad"):
+            ...
+
+Durations of the same phase add up; one EMF line per (ASG, transition) is printed
+when the invocation ends. METRICS_MODE=off turns every call into a no-op.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger()
+
+METRICS_MODE = os.environ.get("METRICS_MODE", "emf")
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CouchbaseAsg")
+DIMENSIONS = ["AutoScalingGroupName", "Transition"]
+
+
+class MetricsRecorder:
+
+    def __init__(self, namespace=NAMESPACE):
+        self.namespace = namespace
+        self.dimensions = ("none", "none")
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set_dimensions(self, asg_name, transition):
+        self.dimensions = (asg_name or "none", transition or "none")
+
+    def put(self, name, value, unit="Milliseconds"):
+        with self._lock:
+            metrics = self._values.setdefault(self.dimensions, {})
+            total, _, count = metrics.get(name, (0, unit, 0))
+            metrics[name] = (total + value, unit, count + 1)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put(name, (time.perf_counter() - started) * 1000)
+
+    def records(self):
+        timestamp = int(time.time() * 1000)
+        with self._lock:
+            values = {dimensions: dict(metrics) for dimensions, metrics in self._values.items()}
+
+        records = []
+        for (asg_name, transition), metrics in values.items():
+            record = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [DIMENSIONS],
+                        "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit, _) in sorted(metrics.items())],
+                    }],
+                },
+                "AutoScalingGroupName": asg_name,
+                "Transition": transition,
+            }
+            for name, (total, _, count) in metrics.items():
+                record[name] = round(total, 3)
+                if count > 1:
+                    record[f"{name}Count"] = count
+            records.append(record)
+        return records
+
+    def flush(self):
+        # EMF is only picked up from log events that are a bare JSON document, so these
+        # go to stdout rather than through the logging formatter.
+        records = self.records()
+        for record in records:
+            print(json.dumps(record))
+        with self._lock:
+            self._values.clear()
+        return records
+
+
+class NullRecorder:
+
+    def set_dimensions(self, asg_name, transition):
+        pass
+
+    def put(self, name, value, unit="Milliseconds"):
+        pass
+
+    @contextmanager
+    def span(self, name):
+        yield
+
+    def records(self):
+        return []
+
+    def flush(self):
+        return []
+
+
+_null = NullRecorder()
+# One invocation runs at a time per Lambda process; worker threads record into it too.
+_current = _null
+
+
+def recorder():
+    return _current
+
+
+@contextmanager
+def invocation(namespace=NAMESPACE):
+    global _current
+    _current = MetricsRecorder(namespace) if METRICS_MODE != "off" else _null
+    started = time.perf_counter()
+    try:
+        yield _current
+    finally:
+        _current.put("Invocation", (time.perf_counter() - started) * 1000)
+        try:
+            _current.flush()
+        except Exception as e:
+            logger.warning(f"Failed to emit metrics. {e}")
+        _current = _null
+
+
+def set_dimensions(asg_name, transition):
+    _current.set_dimensions(asg_name, transition)
+
+
+def span(name):
+    return _current.span(name)
+
+
+def put(name, value, unit="Milliseconds"):
+    _current.put(name, value, unit)
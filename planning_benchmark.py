@@ -0,0 +1,305 @@
+"""Micro-benchmark for the pure-Python planning and record-shaping code.
+
+Synthetic fleets (optionally skewed over the AZs, with large tag sets) are fed to:
+  inventory_load      AsgInventory.load() over describe pages (record shaping and indexing)
+  plan_assignments    assignment.plan_assignments over the loaded inventory
+  legacy_mapping      lambda_working.map_ec2_subnet + distribute_ebs_volumes_to_ec2
+  filter_tags         asg_operations.filter_tags over every instance's tags
+  instance_components asg_operations.get_instance_components for up to 100 instances
+
+Each case reports the median time per run, the time per instance and the peak
+memory traced by tracemalloc. A run fails when a case grows faster than
+--max-exponent across fleet sizes (1.0 is linear) or when its median regressed by
+more than --tolerance against a baseline:
+
+    python planning_benchmark.py --sizes 10 100 1000 10000 --az-skew 0.6 0.3 0.1 --output planning.jsonl
+    python planning_benchmark.py --baseline planning.jsonl --tolerance 0.25
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ASG_NAME = "asg-benchmark"
+AVAILABILITY_ZONES = ("us-east-1a", "us-east-1b", "us-east-1c")
+
+
+def synthetic_fleet(size, az_weights=(1, 1, 1), extra_tags=20, free_fraction=0.1, seed=1):
+    """Describe-shaped instances, ENIs and volumes of a `size`-node ASG. A
+    `free_fraction` of the nodes is new (no ENI yet), so there is something to plan."""
+    rng = random.Random(seed)
+    azs = AVAILABILITY_ZONES[:len(az_weights)]
+    subnets = {az: f"subnet-{index:08x}" for index, az in enumerate(azs)}
+    padding = [{"Key": f"team:label-{index}", "Value": f"value-{index:04d}-" + "x" * 24} for index in range(extra_tags)]
+
+    instances, enis, volumes, asg_instances = [], [], [], []
+    for index in range(size):
+        az = rng.choices(azs, weights=az_weights)[0]
+        instance_id = f"i-{index:017x}"
+        is_new = rng.random() < free_fraction
+        instances.append({
+            "InstanceId": instance_id,
+            "SubnetId": subnets[az],
+            "Placement": {"AvailabilityZone": az},
+            "State": {"Name": "running"},
+            "Tags": padding + [
+                {"Key": "aws:autoscaling:groupName", "Value": ASG_NAME},
+                {"Key": "Status", "Value": "available" if is_new else "in-use"},
+            ],
+            "NetworkInterfaces": [{"NetworkInterfaceId": f"eni-p{index:016x}", "PrivateIpAddress": "10.0.0.1", "Status": "in-use"}],
+        })
+        asg_instances.append({"InstanceId": instance_id, "AvailabilityZone": az, "LifecycleState": "InService"})
+        eni = {
+            "NetworkInterfaceId": f"eni-{index:017x}",
+            "SubnetId": subnets[az],
+            "VpcId": "vpc-00000001",
+            "AvailabilityZone": az,
+            "Status": "available" if is_new else "in-use",
+            "PrivateIpAddresses": [{"PrivateIpAddress": f"10.0.{index // 250 % 250}.{index % 250}"}],
+            "TagSet": padding + [
+                {"Key": "AutoscaleGroup", "Value": ASG_NAME},
+                {"Key": "UniqueTag", "Value": f"data_{index}"},
+            ],
+        }
+        volume = {
+            "VolumeId": f"vol-{index:017x}",
+            "AvailabilityZone": az,
+            "State": "available" if is_new else "in-use",
+            "Size": rng.choice([8, 16, 64]),
+            "Tags": padding + [
+                {"Key": "AsgName", "Value": ASG_NAME},
+                {"Key": "Status", "Value": "available" if is_new else "in-use"},
+                {"Key": "NodeSlot", "Value": f"data_{index}"},
+            ],
+            "Attachments": [],
+        }
+        if not is_new:
+            eni["Attachment"] = {"AttachmentId": f"eni-attach-{index:08x}", "InstanceId": instance_id}
+            volume["Attachments"] = [{"InstanceId": instance_id}]
+        enis.append(eni)
+        volumes.append(volume)
+
+    asg = {"AutoScalingGroupName": ASG_NAME, "Instances": asg_instances, "Tags": []}
+    return {"asg": asg, "instances": instances, "enis": enis, "volumes": volumes}
+
+
+_PAGES = {
+    "describe_auto_scaling_groups": lambda fleet: {"AutoScalingGroups": [fleet["asg"]]},
+    "describe_instances": lambda fleet: {"Reservations": [{"Instances": fleet["instances"]}]},
+    "describe_network_interfaces": lambda fleet: {"NetworkInterfaces": fleet["enis"]},
+    "describe_volumes": lambda fleet: {"Volumes": fleet["volumes"]},
+}
+
+
+class _FleetPaginator:
+    # The fleet only holds what the inventory's filters would return, in a single page.
+
+    def __init__(self, fleet, operation):
+        self.fleet = fleet
+        self.operation = operation
+
+    def paginate(self, **kwargs):
+        yield _PAGES[self.operation](self.fleet)
+
+
+class _FleetClient:
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+
+    def get_paginator(self, operation):
+        return _FleetPaginator(self.fleet, operation)
+
+
+def _loaded_inventory(fleet):
+    from asg_inventory import AsgInventory
+
+    client = _FleetClient(fleet)
+    return AsgInventory(ASG_NAME, ec2_client=client, autoscaling_client=client).load()
+
+
+def case_inventory_load(fleet):
+    return lambda: _loaded_inventory(fleet)
+
+
+def case_plan_assignments(fleet):
+    from assignment import plan_assignments
+
+    inventory = _loaded_inventory(fleet)
+    instances = inventory.instance_details()
+    enis = inventory.available_enis()
+    volumes = inventory.available_volumes()
+    return lambda: plan_assignments(instances, enis, volumes)
+
+
+def case_legacy_mapping(fleet):
+    from lambda_working import distribute_ebs_volumes_to_ec2, map_ec2_subnet
+
+    inventory = _loaded_inventory(fleet)
+    instances = inventory.instance_details()
+    enis = inventory.available_enis()
+    volumes = inventory.available_volumes()
+    return lambda: distribute_ebs_volumes_to_ec2(map_ec2_subnet(enis, instances), volumes)
+
+
+def case_filter_tags(fleet):
+    from asg_operations import filter_tags
+
+    tag_sets = [instance["Tags"] for instance in fleet["instances"]]
+    wanted = {"Name": "Status", "Value": "available"}
+    return lambda: [filter_tags(tags, wanted) for tags in tag_sets]
+
+
+def case_instance_components(fleet):
+    from asg_operations import get_instance_components
+    from binding_store import SqliteBindingStore, make_binding
+
+    inventory = _loaded_inventory(fleet)
+    store = SqliteBindingStore(":memory:")
+    for eni in inventory.enis.values():
+        if eni["instance_id"]:
+            store.put(make_binding(ASG_NAME, eni["instance_id"], eni["eni_id"], None, eni["subnet_id"], eni["availability_zone"]))
+    instance_ids = list(inventory.instances)[:100]
+    return lambda: [get_instance_components(ASG_NAME, instance_id, store, inventory) for instance_id in instance_ids]
+
+
+CASES = {
+    "inventory_load": case_inventory_load,
+    "plan_assignments": case_plan_assignments,
+    "legacy_mapping": case_legacy_mapping,
+    "filter_tags": case_filter_tags,
+    "instance_components": case_instance_components,
+}
+# Cases whose work does not grow with the fleet by design.
+FIXED_WORK = {"instance_components"}
+
+
+def measure(run, repeats):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run()
+        times.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "peak_kib": peak / 1024}
+
+
+def run_benchmark(sizes, cases, repeats, az_weights, extra_tags, seed):
+    results = {}
+    for size in sizes:
+        fleet = synthetic_fleet(size, az_weights, extra_tags, seed=seed)
+        for name in cases:
+            run = CASES[name](fleet)
+            # Fewer repeats for big fleets keeps the whole suite in the seconds range.
+            result = measure(run, max(3, repeats * 100 // max(size, 100)))
+            result["us_per_instance"] = result["median_ms"] * 1000 / size
+            results.setdefault(name, {})[str(size)] = result
+    return results
+
+
+def growth_exponents(results):
+    # Slope of log(time) over log(size) between the smallest and the largest fleet.
+    exponents = {}
+    for name, by_size in results.items():
+        sizes = sorted(by_size, key=int)
+        if len(sizes) < 2:
+            continue
+        small, large = by_size[sizes[0]], by_size[sizes[-1]]
+        if small["median_ms"] > 0 and large["median_ms"] > 0:
+            exponents[name] = math.log(large["median_ms"] / small["median_ms"]) / math.log(int(sizes[-1]) / int(sizes[0]))
+    return exponents
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def load_baseline(path):
+    # One JSON result per line; the latest one wins.
+    baseline = None
+    with open(path) as handle:
+        for line in handle:
+            if line.strip():
+                baseline = json.loads(line)
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--az-skew", type=float, nargs="+", default=[1, 1, 1], help="relative weight of each AZ")
+    parser.add_argument("--extra-tags", type=int, default=20, help="unrelated tags on every resource")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-exponent", type=float, default=1.25,
+                        help="fail when a case grows faster than size**max-exponent")
+    parser.add_argument("--output", help="append the result as a JSON line to this file")
+    parser.add_argument("--baseline", help="JSON lines file with earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative increase of a median before the run fails")
+    args = parser.parse_args()
+
+    # lambda_working logs every volume it assigns; keep that out of the timings.
+    logging.disable(logging.WARNING)
+
+    results = run_benchmark(args.sizes, args.cases, args.repeats, args.az_skew, args.extra_tags, args.seed)
+    exponents = growth_exponents(results)
+    result = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "az_skew": args.az_skew,
+        "extra_tags": args.extra_tags,
+        "results": results,
+        "growth_exponents": exponents,
+    }
+
+    print(f"Planning benchmark (revision {result['revision']}):")
+    for name, by_size in results.items():
+        for size, values in sorted(by_size.items(), key=lambda item: int(item[0])):
+            print(f"  {name:<20} {int(size):>6} instances  median {values['median_ms']:9.3f} ms"
+                  f"  {values['us_per_instance']:8.2f} us/instance  peak {values['peak_kib']:9.1f} KiB")
+        if name in exponents:
+            print(f"  {name:<20} grows as size**{exponents[name]:.2f}")
+
+    if args.output:
+        with open(args.output, "a") as handle:
+            handle.write(json.dumps(result) + "\n")
+
+    failures = [
+        f"{name} grows as size**{exponent:.2f}"
+        for name, exponent in exponents.items()
+        if name not in FIXED_WORK and exponent > args.max_exponent
+    ]
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    if baseline:
+        for name, by_size in results.items():
+            for size, values in by_size.items():
+                before = baseline.get("results", {}).get(name, {}).get(size, {}).get("median_ms")
+                if before and values["median_ms"] > before * (1 + args.tolerance):
+                    failures.append(f"{name} at {size}: {before:.3f} -> {values['median_ms']:.3f} ms")
+    if failures:
+        print("Regressed: " + "; ".join(failures))
+        return 1
+    print("No regression." if baseline else "Within the growth limit.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
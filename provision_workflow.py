@@ -0,0 +1,238 @@
+"""Checkpoints of provisioning runs, so a run cut short by the Lambda deadline resumes
+where it stopped instead of starting over.
+
+Every planned instance goes through the steps eni_attached, attached (its volume
+too), completed (its launch hook), tagged and bound, and the checkpoint is written
+after each of them. Before attaching an instance the workflow checks the time left
+in the invocation against DEADLINE_MARGIN_MS; when the deadline is near the
+remaining instances are deferred: the lock is released, their hooks get a
+heartbeat and the invocation reports them as failed so Lambda delivers the event
+again. The next provisioning run of the ASG finishes the instances the checkpoint
+has as attached (even if the previous one timed out hard) and plans the rest.
+
+CHECKPOINT_BACKEND=file keeps the checkpoints as JSON files in CHECKPOINT_DIR for
+local runs; "off" disables them.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+CHECKPOINT_BACKEND = os.environ.get("CHECKPOINT_BACKEND", "dynamodb")
+CHECKPOINT_TABLE = os.environ.get("CHECKPOINT_TABLE", "asg-workflows")
+CHECKPOINT_DIR = os.environ.get("CHECKPOINT_DIR", "/tmp/asg_checkpoints")
+# Checkpoints nobody resumed are dropped after this long (DynamoDB TTL on expires_at).
+CHECKPOINT_TTL_SECONDS = int(os.environ.get("CHECKPOINT_TTL_SECONDS", "86400"))
+# Time kept back for tagging, saving bindings and releasing the lock once attaching stops.
+DEADLINE_MARGIN_MS = int(os.environ.get("DEADLINE_MARGIN_MS", "30000"))
+
+_remaining_time = None
+
+
+class WorkflowYielded(Exception):
+    pass
+
+
+def start_invocation(context):
+    # Called by lambda_handler; local runs pass no context and never yield.
+    global _remaining_time
+    _remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+
+
+def remaining_ms():
+    return _remaining_time() if _remaining_time else None
+
+
+def deadline_near(margin_ms=None):
+    remaining = remaining_ms()
+    return remaining is not None and remaining < (DEADLINE_MARGIN_MS if margin_ms is None else margin_ms)
+
+
+def workflow_key(asg_name):
+    # One workflow per ASG: runs are serialized by the ASG lock, and whichever run comes
+    # next finishes what an earlier one left attached.
+    return f"provision#{asg_name}"
+
+
+class FileCheckpointStore:
+    """One JSON file per workflow in a local directory."""
+
+    def __init__(self, directory=CHECKPOINT_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as checkpoint_file:
+                record = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+        return record if record.get("expires_at", 0) > time.time() else None
+
+    def put(self, record):
+        path = self._path(record["key"])
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as checkpoint_file:
+            json.dump(record, checkpoint_file, default=str)
+        os.replace(temporary, path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class DynamoDbCheckpointStore:
+    """Checkpoints in DynamoDB keyed by `workflow_key`; expired items are removed by TTL."""
+
+    def __init__(self, client, table_name=CHECKPOINT_TABLE):
+        self.client = client
+        self.table_name = table_name
+
+    def get(self, key):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={"workflow_key": {"S": key}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        # TTL deletion lags; an expired item is as good as gone.
+        if not item or float(item["expires_at"]["N"]) < time.time():
+            return None
+        return json.loads(item["record"]["S"])
+
+    def put(self, record):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "workflow_key": {"S": record["key"]},
+                "asg_name": {"S": record["asg_name"]},
+                "record": {"S": json.dumps(record, default=str)},
+                "expires_at": {"N": str(int(record["expires_at"]))},
+            },
+        )
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={"workflow_key": {"S": key}})
+
+
+def get_checkpoint_store():
+    if CHECKPOINT_BACKEND == "off":
+        return None
+    elif CHECKPOINT_BACKEND == "file":
+        return FileCheckpointStore(CHECKPOINT_DIR)
+    elif CHECKPOINT_BACKEND == "dynamodb":
+        return DynamoDbCheckpointStore(get_client("dynamodb"), CHECKPOINT_TABLE)
+    else:
+        raise Exception(f"Unknown checkpoint backend {CHECKPOINT_BACKEND}.")
+
+
+class ProvisionWorkflow:
+
+    def __init__(self, asg_name, store=None):
+        self.key = workflow_key(asg_name)
+        self.asg_name = asg_name
+        self.store = store if store is not None else get_checkpoint_store()
+        self.deferred = set()
+        # Attach threads checkpoint concurrently. One thread writes at a time and each
+        # write covers every change made before it started, so waiting threads share
+        # writes instead of queueing one put each (and a stale snapshot never wins).
+        self._lock = threading.Condition()
+        self._version = 0
+        self._saved_version = 0
+        self._writing = False
+        self.record = {"key": self.key, "asg_name": asg_name, "status": "running", "invocations": 0, "instances": {}}
+
+    def load(self):
+        record = self.store.get(self.key) if self.store else None
+        if record:
+            self.record = record
+            logger.info(f"Resuming workflow {self.key} (invocation {record['invocations'] + 1}) "
+                        f"with {len(record['instances'])} checkpointed instance(s).")
+        self.record["invocations"] += 1
+        self.record["status"] = "running"
+        return self
+
+    def checkpointed(self):
+        # Instances a previous invocation attached (at least their ENI) but did not finish.
+        return {
+            instance_id: state["item"] for instance_id, state in self.record["instances"].items()
+            if "eni_attached" in state["steps"] and "bound" not in state["steps"]
+        }
+
+    def forget(self, instance_id):
+        with self._lock:
+            self.record["instances"].pop(instance_id, None)
+        self.save()
+
+    def is_done(self, instance_id, step):
+        return step in self.record["instances"].get(instance_id, {}).get("steps", [])
+
+    def mark(self, items, step):
+        with self._lock:
+            for item in items:
+                state = self.record["instances"].setdefault(item["InstanceId"], {"item": item, "steps": []})
+                if step not in state["steps"]:
+                    state["steps"].append(step)
+        self.save()
+
+    def defer_if_deadline_near(self, instance_id):
+        if instance_id in self.deferred or deadline_near():
+            with self._lock:
+                self.deferred.add(instance_id)
+            return True
+        return False
+
+    def save(self, status=None):
+        # Returns once a write including this call's changes has finished.
+        if not self.store:
+            return
+        with self._lock:
+            if status:
+                self.record["status"] = status
+            self._version += 1
+            version = self._version
+            while self._saved_version < version:
+                if self._writing:
+                    self._lock.wait()
+                    continue
+                self._writing = True
+                target = self._version
+                self.record["updated_at"] = time.time()
+                self.record["expires_at"] = time.time() + CHECKPOINT_TTL_SECONDS
+                record = json.loads(json.dumps(self.record, default=str))
+                self._lock.release()
+                try:
+                    self.store.put(record)
+                except Exception as e:
+                    # A lost checkpoint costs a redo, not correctness; keep provisioning.
+                    logger.warning(f"Failed to save checkpoint of workflow {self.key}. {e}")
+                finally:
+                    self._lock.acquire()
+                    self._writing = False
+                    self._saved_version = target
+                    self._lock.notify_all()
+
+    def finish(self):
+        if self.deferred:
+            self.save("yielded")
+            logger.info(f"Workflow {self.key} yielded with {len(self.deferred)} deferred instance(s), "
+                        f"{remaining_ms()} ms left.")
+        elif self.checkpointed():
+            # Half-attached instances (e.g. the volume attach failed) must not get a second ENI.
+            self.save("incomplete")
+        elif self.store:
+            try:
+                self.store.delete(self.key)
+            except Exception as e:
+                logger.warning(f"Failed to delete checkpoint of workflow {self.key}. {e}")
@@ -0,0 +1,183 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+logger = logging.getLogger()
+
+RATE_LIMITER_ENABLED = os.environ.get("API_RATE_LIMITER", "true").lower() == "true"
+
+# Requests per second and burst size per API category, overridable as
+# API_RATE_<CATEGORY>="<rate>:<burst>". The buckets are per process; they smooth the
+# calls of one invocation (and its threads), the account-wide EC2 limits still apply.
+DEFAULT_RATES = {
+    "describe": (20.0, 40),
+    "mutate": (10.0, 20),
+    "tag": (10.0, 20),
+    "lifecycle": (5.0, 10),
+    "other": (10.0, 20),
+}
+# On a throttling response the bucket's rate is multiplied by BACKOFF_FACTOR (never below
+# MIN_RATE_FRACTION of the configured rate); every success wins back RECOVERY_FRACTION.
+BACKOFF_FACTOR = 0.5
+MIN_RATE_FRACTION = 0.05
+RECOVERY_FRACTION = 0.05
+
+THROTTLING_CODES = {
+    "RequestLimitExceeded",
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "SlowDown",
+}
+
+
+def _configured_rate(category):
+    rate, burst = DEFAULT_RATES.get(category, DEFAULT_RATES["other"])
+    value = os.environ.get(f"API_RATE_{category.upper()}")
+    if value:
+        rate, _, burst_value = value.partition(":")
+        rate = float(rate)
+        burst = int(burst_value) if burst_value else max(1, int(rate * 2))
+    return rate, burst
+
+
+def api_category(operation_name):
+    if operation_name.startswith(("Describe", "Get", "List")):
+        return "describe"
+    if operation_name in ("CreateTags", "DeleteTags", "CreateOrUpdateTags"):
+        return "tag"
+    if "LifecycleAction" in operation_name:
+        return "lifecycle"
+    if operation_name.startswith(("Attach", "Detach")):
+        return "mutate"
+    return "other"
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.min_rate = rate * MIN_RATE_FRACTION
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        # Blocks until a token is available and returns the time spent waiting.
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * BACKOFF_FACTOR)
+            # Drop the saved burst so the reduced rate applies immediately.
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+
+class ApiRateLimiter:
+    """One token bucket per (service, API category), fed by botocore client events:
+    every attempt takes a token before it is sent, throttling errors halve the
+    bucket's rate and successes raise it again. Counts calls, throttles and retries."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.counters = defaultdict(lambda: defaultdict(int))
+
+    def bucket(self, service, category):
+        key = (service, category)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(*_configured_rate(category))
+        return bucket
+
+    def _count(self, service, category, name, value=1):
+        with self._lock:
+            self.counters[f"{service}:{category}"][name] += value
+
+    def before_send(self, event_name, **kwargs):
+        _, service, operation_name = event_name.split(".", 2)
+        category = api_category(operation_name)
+        waited = self.bucket(service, category).acquire()
+        self._count(service, category, "attempts")
+        if waited:
+            self._count(service, category, "waited_seconds", waited)
+
+    def needs_retry(self, operation, response=None, attempts=None, **kwargs):
+        if response is None:
+            return None
+        code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLING_CODES:
+            service = operation.service_model.service_id.hyphenize()
+            category = api_category(operation.name)
+            self.bucket(service, category).throttled()
+            self._count(service, category, "throttled")
+            logger.warning(f"{operation.name} throttled ({code}) on attempt {attempts}; slowing down {service} {category} calls.")
+        # The retry decision stays with botocore's retry handler.
+        return None
+
+    def after_call(self, model, http_response=None, parsed=None, **kwargs):
+        service = model.service_model.service_id.hyphenize()
+        category = api_category(model.name)
+        self._count(service, category, "calls")
+        retries = (parsed or {}).get("ResponseMetadata", {}).get("RetryAttempts") or 0
+        if retries:
+            self._count(service, category, "retried")
+            self._count(service, category, "retries", retries)
+        if http_response is not None and http_response.status_code < 300:
+            self.bucket(service, category).succeeded()
+        else:
+            self._count(service, category, "failed")
+
+    def install(self, client):
+        events = client.meta.events
+        events.register("before-send.*.*", self.before_send, unique_id="asg-rate-limiter-before-send")
+        events.register("needs-retry.*.*", self.needs_retry, unique_id="asg-rate-limiter-needs-retry")
+        events.register("after-call.*.*", self.after_call, unique_id="asg-rate-limiter-after-call")
+        return client
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(values) for key, values in self.counters.items()}
+
+    def reset_counters(self):
+        with self._lock:
+            self.counters.clear()
+
+
+rate_limiter = ApiRateLimiter()
+
+
+def log_rate_limiter_counters():
+    counters = rate_limiter.snapshot()
+    if counters:
+        logger.info(f"API rate limiter counters: {counters}")
+    return counters
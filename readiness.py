@@ -0,0 +1,118 @@
+import logging
+import os
+import time
+
+logger = logging.getLogger()
+
+INSTANCE_TIMEOUT_SECONDS = float(os.environ.get("READY_INSTANCE_TIMEOUT_SECONDS", "300"))
+ENI_TIMEOUT_SECONDS = float(os.environ.get("READY_ENI_TIMEOUT_SECONDS", "120"))
+VOLUME_TIMEOUT_SECONDS = float(os.environ.get("READY_VOLUME_TIMEOUT_SECONDS", "120"))
+INITIAL_DELAY_SECONDS = 0.5
+MAX_DELAY_SECONDS = 8.0
+
+
+class ReadinessTimeout(Exception):
+    pass
+
+
+def wait_until(check, description, timeout, initial_delay=INITIAL_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS, on_wait=None):
+    # Polls `check` with bounded exponential backoff until it returns something truthy.
+    started = time.monotonic()
+    deadline = started + timeout
+    delay = initial_delay
+
+    while True:
+        result = check()
+        if result:
+            logger.info(f"{description} ready after {time.monotonic() - started:.2f}s.")
+            return result
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ReadinessTimeout(f"Timed out after {timeout}s waiting for {description}.")
+
+        if on_wait:
+            on_wait()
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def _is_not_found(error):
+    # Freshly launched or freshly detached resources can briefly be invisible to describes.
+    code = getattr(error, "response", {}).get("Error", {}).get("Code", "")
+    return code.endswith(".NotFound")
+
+
+def instances_running(ec2_client, instance_ids):
+    try:
+        response = ec2_client.describe_instances(InstanceIds=instance_ids)
+    except Exception as e:
+        if _is_not_found(e):
+            return False
+        raise
+
+    states = {}
+    for reservation in response.get("Reservations", []):
+        for instance in reservation.get("Instances", []):
+            states[instance["InstanceId"]] = instance.get("State", {}).get("Name")
+    return all(states.get(instance_id) == "running" for instance_id in instance_ids)
+
+
+def enis_available(ec2_client, eni_ids):
+    try:
+        response = ec2_client.describe_network_interfaces(NetworkInterfaceIds=eni_ids)
+    except Exception as e:
+        if _is_not_found(e):
+            return False
+        raise
+
+    statuses = {eni["NetworkInterfaceId"]: eni.get("Status") for eni in response.get("NetworkInterfaces", [])}
+    return all(statuses.get(eni_id) == "available" for eni_id in eni_ids)
+
+
+def volumes_available(ec2_client, volume_ids):
+    try:
+        response = ec2_client.describe_volumes(VolumeIds=volume_ids)
+    except Exception as e:
+        if _is_not_found(e):
+            return False
+        raise
+
+    states = {volume["VolumeId"]: volume.get("State") for volume in response.get("Volumes", [])}
+    return all(states.get(volume_id) == "available" for volume_id in volume_ids)
+
+
+def wait_for_instances_running(ec2_client, instance_ids, timeout=INSTANCE_TIMEOUT_SECONDS, on_wait=None):
+    instance_ids = [instance_id for instance_id in instance_ids if instance_id]
+    if not instance_ids:
+        return True
+    return wait_until(
+        lambda: instances_running(ec2_client, instance_ids),
+        f"instances {instance_ids} running",
+        timeout,
+        on_wait=on_wait,
+    )
+
+
+def wait_for_enis_available(ec2_client, eni_ids, timeout=ENI_TIMEOUT_SECONDS, on_wait=None):
+    eni_ids = [eni_id for eni_id in eni_ids if eni_id]
+    if not eni_ids:
+        return True
+    return wait_until(
+        lambda: enis_available(ec2_client, eni_ids),
+        f"ENIs {eni_ids} available",
+        timeout,
+        on_wait=on_wait,
+    )
+
+
+def wait_for_volumes_available(ec2_client, volume_ids, timeout=VOLUME_TIMEOUT_SECONDS, on_wait=None):
+    volume_ids = [volume_id for volume_id in volume_ids if volume_id]
+    if not volume_ids:
+        return True
+    return wait_until(
+        lambda: volumes_available(ec2_client, volume_ids),
+        f"volumes {volume_ids} available",
+        timeout,
+        on_wait=on_wait,
+    )
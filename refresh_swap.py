@@ -0,0 +1,68 @@
+import logging
+
+from assignment import ENI_SLOT_TAG, server_group_of
+from binding_store import make_binding
+
+logger = logging.getLogger()
+
+SWAP_TARGET_STATES = ["pending", "running"]
+
+
+def record_incoming_instance(binding_store, asg_name, instance):
+    # An instance launched without a free ENI in its subnet (instance refresh) waits
+    # as a binding without resources until the node it replaces terminates.
+    binding_store.put(make_binding(
+        asg_name,
+        instance["InstanceId"],
+        subnet_id=instance.get("SubnetId"),
+        availability_zone=instance.get("AvailabilityZone"),
+        server_group=server_group_of(instance.get("AvailabilityZone")),
+    ))
+    logger.info(f"Recorded {instance['InstanceId']} as waiting for the resources of a terminating instance.")
+
+
+def is_incoming(binding):
+    return not binding.get("eni_id") and not binding.get("ebs_id")
+
+
+def find_incoming_instance(binding_store, asg_name, outgoing, inventory):
+    """Picks the waiting instance that takes over `outgoing`'s ENI and volume: one
+    in the same subnet if there is any, else one in the same AZ. Entries of
+    instances that are gone or already attached are dropped on the way."""
+    availability_zone = outgoing.get("availability_zone")
+    if not availability_zone:
+        eni = inventory.eni(outgoing.get("eni_id"))
+        availability_zone = eni["availability_zone"] if eni else None
+    if not availability_zone:
+        return None
+
+    candidates = []
+    for binding in binding_store.list_by_az(asg_name, availability_zone):
+        if not is_incoming(binding) or binding["instance_id"] == outgoing["instance_id"]:
+            continue
+        instance = inventory.instance(binding["instance_id"])
+        if (not instance or instance.get("State") not in SWAP_TARGET_STATES
+                or str(instance.get("LifecycleState") or "").startswith("Terminating")
+                or inventory.eni_of_instance(binding["instance_id"])):
+            logger.info(f"Dropping stale waiting instance {binding['instance_id']}.")
+            binding_store.delete(asg_name, binding["instance_id"])
+            continue
+        candidates.append(binding)
+
+    candidates.sort(key=lambda binding: binding.get("subnet_id") != outgoing.get("subnet_id"))
+    return candidates[0] if candidates else None
+
+
+def plan_swap(outgoing, incoming, inventory):
+    # Same item shape as assignment.plan_assignments, so attach_instance_resources can run it.
+    eni = inventory.eni(outgoing["eni_id"]) or {}
+    availability_zone = incoming.get("availability_zone") or outgoing.get("availability_zone")
+    return {
+        "InstanceId": incoming["instance_id"],
+        "SubnetId": incoming.get("subnet_id") or outgoing.get("subnet_id"),
+        "AssignedENI": outgoing["eni_id"],
+        "AssignedVolumeId": outgoing["ebs_id"],
+        "availability_zone": availability_zone,
+        "NodeSlot": outgoing.get("slot") or (eni.get("tags") or {}).get(ENI_SLOT_TAG),
+        "CouchbaseServerGroup": server_group_of(availability_zone),
+    }
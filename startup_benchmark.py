@@ -0,0 +1,153 @@
+"""Cold-start benchmark for the Lambda entry points.
+
+Every run starts a fresh interpreter and measures, for one handler module:
+  import_ms          importing the module
+  early_exit_ms      a lambda_handler call that returns before touching AWS
+  first_api_call_ms  the first EC2 call, including boto3 import and client
+                     construction (the response is stubbed, so no network time)
+
+    python startup_benchmark.py --module asg_operations --runs 15 --output bench_output.txt
+    python startup_benchmark.py --baseline bench_output.txt --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+METRICS = ["import_ms", "early_exit_ms", "first_api_call_ms"]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_child(module_name):
+    import importlib
+
+    started = time.perf_counter()
+    module = importlib.import_module(module_name)
+    import_ms = (time.perf_counter() - started) * 1000
+    boto3_after_import = "boto3" in sys.modules
+
+    started = time.perf_counter()
+    module.lambda_handler({"Records": []}, None)
+    early_exit_ms = (time.perf_counter() - started) * 1000
+    boto3_after_early_exit = "boto3" in sys.modules
+
+    started = time.perf_counter()
+    from aws_clients import get_client
+    from botocore.stub import Stubber
+
+    client = get_client("ec2")
+    with Stubber(client) as stubber:
+        stubber.add_response("describe_network_interfaces", {"NetworkInterfaces": []})
+        client.describe_network_interfaces()
+    first_api_call_ms = (time.perf_counter() - started) * 1000
+
+    print(json.dumps({
+        "import_ms": import_ms,
+        "early_exit_ms": early_exit_ms,
+        "first_api_call_ms": first_api_call_ms,
+        "boto3_after_import": boto3_after_import,
+        "boto3_after_early_exit": boto3_after_early_exit,
+    }))
+
+
+def run_once(module_name):
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", module_name],
+        cwd=HERE, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs):
+    summary = {}
+    for metric in METRICS:
+        values = sorted(run[metric] for run in runs)
+        summary[metric] = {
+            "min": values[0],
+            "median": statistics.median(values),
+            "p90": values[min(len(values) - 1, int(round(0.9 * (len(values) - 1))))],
+        }
+    summary["boto3_after_import"] = any(run["boto3_after_import"] for run in runs)
+    summary["boto3_after_early_exit"] = any(run["boto3_after_early_exit"] for run in runs)
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def load_baseline(path, module_name):
+    # The baseline file holds one JSON result per line; the latest matching one wins.
+    baseline = None
+    with open(path) as handle:
+        for line in handle:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                if record.get("module") == module_name:
+                    baseline = record
+    return baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the Lambda entry points.")
+    parser.add_argument("--module", default="asg_operations")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--output", help="append the result as a JSON line to this file")
+    parser.add_argument("--baseline", help="JSON lines file with earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative increase of a median before the run fails")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    baseline = load_baseline(args.baseline, args.module) if args.baseline else None
+
+    runs = [run_once(args.module) for _ in range(args.runs)]
+    result = {
+        "module": args.module,
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "runs": len(runs),
+        "summary": summarize(runs),
+    }
+
+    print(f"{args.module} over {len(runs)} cold starts (revision {result['revision']}):")
+    for metric in METRICS:
+        values = result["summary"][metric]
+        print(f"  {metric:<18} min {values['min']:8.2f}  median {values['median']:8.2f}  p90 {values['p90']:8.2f}")
+    print(f"  boto3 imported by module import: {result['summary']['boto3_after_import']}")
+    print(f"  boto3 imported by early exit:    {result['summary']['boto3_after_early_exit']}")
+
+    if args.output:
+        with open(args.output, "a") as handle:
+            handle.write(json.dumps(result) + "\n")
+
+    if baseline:
+        regressions = []
+        for metric in METRICS:
+            before = baseline["summary"][metric]["median"]
+            after = result["summary"][metric]["median"]
+            if before and after > before * (1 + args.tolerance):
+                regressions.append(f"{metric}: {before:.2f} -> {after:.2f} ms")
+        if regressions:
+            print(f"Regressed against {baseline.get('revision')}: " + "; ".join(regressions))
+            return 1
+        print(f"No regression against {baseline.get('revision')}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import logging
+import threading
+from collections import defaultdict
+
+import async_operations
+
+logger = logging.getLogger()
+
+# CreateTags accepts up to 1000 resource ids per request.
+MAX_RESOURCES_PER_CALL = 1000
+
+
+def _plan_by_tag_set(resource_tags):
+    # One request per distinct tag set, covering every resource that carries it.
+    groups = defaultdict(list)
+    for resource_id, tags in resource_tags.items():
+        groups[frozenset(tags.items())].append(resource_id)
+    return [(sorted(resources), dict(tag_set)) for tag_set, resources in groups.items()]
+
+
+def _plan_by_resource_set(resource_tags):
+    # One request per distinct set of resources sharing a tag, which wins when a
+    # few tags are common to most resources and the rest are per resource.
+    resources_by_tag = defaultdict(set)
+    for resource_id, tags in resource_tags.items():
+        for tag in tags.items():
+            resources_by_tag[tag].add(resource_id)
+
+    groups = defaultdict(dict)
+    for (key, value), resources in resources_by_tag.items():
+        groups[frozenset(resources)][key] = value
+    return [(sorted(resources), tags) for resources, tags in groups.items()]
+
+
+def _chunk(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class TagBatch:
+    """Collects the tag mutations of one invocation and writes them in as few requests as possible."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resource_tags = defaultdict(dict)
+
+    def add(self, resource_ids, tags):
+        if isinstance(resource_ids, str):
+            resource_ids = [resource_ids]
+        with self._lock:
+            for resource_id in resource_ids:
+                if not resource_id:
+                    continue
+                for tag in tags:
+                    # A later mutation of the same key replaces the earlier one.
+                    self._resource_tags[resource_id][tag['Key']] = tag['Value']
+
+    def __len__(self):
+        return len(self._resource_tags)
+
+    def plan(self):
+        with self._lock:
+            resource_tags = {resource_id: dict(tags) for resource_id, tags in self._resource_tags.items()}
+
+        plans = [_plan_by_tag_set(resource_tags), _plan_by_resource_set(resource_tags)]
+        best = min(plans, key=lambda plan: sum(-(-len(resources) // MAX_RESOURCES_PER_CALL) for resources, _ in plan))
+        requests = []
+        for resources, tags in best:
+            formatted = [{'Key': key, 'Value': value} for key, value in sorted(tags.items())]
+            for chunk in _chunk(resources, MAX_RESOURCES_PER_CALL):
+                requests.append((chunk, formatted))
+        return requests
+
+    def flush(self, ec2_client):
+        requests = self.plan()
+        with self._lock:
+            self._resource_tags.clear()
+
+        resource_count = sum(len(resources) for resources, _ in requests)
+        runner = async_operations.runner()
+        if runner:
+            # All requests at once; the first failure is reported like in the sequential path.
+            outcomes = runner.run(async_operations.flush_tags(runner, requests, ec2_client))
+            for (resources, tags), (_, error) in zip(requests, outcomes):
+                if error is not None:
+                    raise Exception(f"Error in tagging resources {resources} with tags {tags}. {error}")
+        else:
+            for resources, tags in requests:
+                try:
+                    ec2_client.create_tags(Resources=resources, Tags=tags)
+                except Exception as e:
+                    raise Exception(f"Error in tagging resources {resources} with tags {tags}. {e}")
+
+        logger.info(f"Flushed tags for {resource_count} resources in {len(requests)} request(s).")
+        return len(requests)